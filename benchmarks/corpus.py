@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Generatore del corpus sintetico per i benchmark
+Produce con reportlab un insieme deterministico di PDF: testo nativo,
+pagine "scansionate" (immagini rasterizzate a DPI e inclinazioni diverse,
+con rumore), documenti misti e pagine bianche, da 1 a 500 pagine.
+Stesso seme e stesse versioni delle librerie -> stessi byte (vedi manifest).
+
+Uso:
+    python corpus.py perf_results/corpus-quick --profile quick
+"""
+
+import io
+import sys
+import json
+import random
+import hashlib
+import argparse
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+MANIFEST_NAME = "manifest.json"
+GENERATOR_VERSION = 1
+DEFAULT_SEED = 20240101
+
+# Le scansioni sono incorporate in JPEG, come quelle prodotte dagli scanner
+SCAN_JPEG_QUALITY = 75
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+POINTS_PER_INCH = 72
+
+# Tipi di pagina: testo nativo, scansione, bianca (scansione di un foglio vuoto)
+TEXT, SCAN, BLANK = 'text', 'scan', 'blank'
+
+WORDS = (
+    "contratto fornitura servizio cliente fattura importo scadenza pagamento "
+    "articolo comma decreto regione comune provincia ufficio protocollo data "
+    "documento allegato firma responsabile procedura verifica controllo "
+    "relazione tecnica progetto lavori cantiere materiale quantità prezzo "
+    "totale imponibile aliquota sede legale partita codice fiscale registro"
+).split()
+
+# Documenti per profilo: (nome, pagine, schema delle pagine, dpi, inclinazione in gradi)
+# Lo schema si ripete ciclicamente sulle pagine del documento
+PROFILES = {
+    'quick': [
+        ('text_1p', 1, (TEXT,), None, 0),
+        ('text_20p', 20, (TEXT,), None, 0),
+        ('scan_150dpi_3p', 3, (SCAN,), 150, 0),
+        ('scan_200dpi_skew2_3p', 3, (SCAN,), 200, 2.0),
+        ('scan_300dpi_skew-4_3p', 3, (SCAN,), 300, -4.0),
+        ('mixed_12p', 12, (TEXT, SCAN, TEXT, BLANK), 200, 1.0),
+        ('blank_4p', 4, (BLANK,), 200, 0),
+    ],
+}
+PROFILES['full'] = PROFILES['quick'] + [
+    ('text_100p', 100, (TEXT,), None, 0),
+    ('scan_300dpi_skew1_50p', 50, (SCAN,), 300, 1.0),
+    ('mixed_200p', 200, (TEXT, SCAN, SCAN, BLANK, TEXT), 200, -1.5),
+    ('text_500p', 500, (TEXT,), None, 0),
+]
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, OSError):
+        # Pillow senza FreeType: solo il font bitmap di default
+        return ImageFont.load_default()
+
+def _paragraphs(rng, lines):
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 11))).capitalize()
+        for _ in range(lines)
+    ]
+
+def _text_page(pdf, rng, page_number):
+    """Pagina con testo nativo (estraibile, nessun OCR necessario)"""
+    pdf.setFont("Helvetica-Bold", 14)
+    pdf.drawString(60, PAGE_HEIGHT - 60, f"Documento di prova - pagina {page_number}")
+    pdf.setFont("Helvetica", 10)
+    y = PAGE_HEIGHT - 90
+    for line in _paragraphs(rng, 48):
+        pdf.drawString(60, y, line)
+        y -= 15
+
+def _scan_image(rng, dpi, skew, page_number, blank=False):
+    """Immagine di una pagina scansionata: testo, inclinazione e rumore del sensore"""
+    width = int(PAGE_WIDTH / POINTS_PER_INCH * dpi)
+    height = int(PAGE_HEIGHT / POINTS_PER_INCH * dpi)
+    image = Image.new('L', (width, height), 255)
+
+    if not blank:
+        draw = ImageDraw.Draw(image)
+        scale = dpi / POINTS_PER_INCH
+        draw.text((int(60 * scale), int(50 * scale)), f"Scansione di prova - pagina {page_number}",
+                  fill=0, font=_font(int(14 * scale)))
+        font = _font(int(10 * scale))
+        y = 90 * scale
+        for line in _paragraphs(rng, 44):
+            draw.text((int(60 * scale), int(y)), line, fill=20, font=font)
+            y += 15 * scale
+
+    if skew:
+        image = image.rotate(skew, resample=Image.BICUBIC, fillcolor=255)
+
+    # Rumore gaussiano leggero e qualche macchia, come in una scansione reale
+    noise = np.random.default_rng(rng.getrandbits(32)).normal(0, 6, (height, width))
+    pixels = np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    for _ in range(rng.randint(5, 20)):
+        x, y = rng.randrange(width - 4), rng.randrange(height - 4)
+        pixels[y:y + rng.randint(1, 4), x:x + rng.randint(1, 4)] = 0
+    return Image.fromarray(pixels, 'L')
+
+def generate_document(path, pages, pattern, dpi, skew, seed):
+    """Scrive un PDF di `pages` pagine secondo lo schema; restituisce i tipi di pagina"""
+    rng = random.Random(seed)
+    # invariant: nessuna data o ID casuale nel PDF, output identico a parità di input
+    pdf = canvas.Canvas(str(path), pagesize=A4, invariant=1)
+    kinds = []
+    for i in range(pages):
+        kind = pattern[i % len(pattern)]
+        kinds.append(kind)
+        if kind == TEXT:
+            _text_page(pdf, rng, i + 1)
+        else:
+            image = _scan_image(rng, dpi, skew, i + 1, blank=(kind == BLANK))
+            jpeg = io.BytesIO()
+            image.save(jpeg, 'JPEG', quality=SCAN_JPEG_QUALITY, dpi=(dpi, dpi))
+            jpeg.seek(0)
+            pdf.drawImage(ImageReader(jpeg), 0, 0, width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        pdf.showPage()
+    pdf.save()
+    return kinds
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def corpus_id(manifest):
+    """Impronta del corpus: cambia se cambia anche un solo documento"""
+    digests = "".join(doc['sha256'] for doc in manifest['documents'])
+    return hashlib.sha256(digests.encode('ascii')).hexdigest()[:16]
+
+def generate_corpus(output_dir, profile='quick', seed=DEFAULT_SEED):
+    """Genera il corpus del profilo in output_dir e restituisce il manifest"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    documents = []
+    for n, (name, pages, pattern, dpi, skew) in enumerate(PROFILES[profile]):
+        path = output_dir / f"{name}.pdf"
+        kinds = generate_document(path, pages, pattern, dpi, skew, seed + n)
+        documents.append({
+            'file': path.name,
+            'pages': pages,
+            'page_kinds': {kind: kinds.count(kind) for kind in sorted(set(kinds))},
+            'dpi': dpi,
+            'skew': skew,
+            'size': path.stat().st_size,
+            'sha256': file_sha256(path)
+        })
+        print(f"  {path.name}: {pages} pagine, {path.stat().st_size / 1024:.0f} KB")
+
+    manifest = {
+        'generator_version': GENERATOR_VERSION,
+        'profile': profile,
+        'seed': seed,
+        'documents': documents
+    }
+    manifest['corpus_id'] = corpus_id(manifest)
+    with open(output_dir / MANIFEST_NAME, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+def load_manifest(corpus_dir):
+    """Manifest di un corpus già generato, None se assente"""
+    try:
+        with open(Path(corpus_dir) / MANIFEST_NAME, encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera il corpus sintetico dei benchmark")
+    parser.add_argument('output_dir', help="Directory del corpus")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick',
+                        help="quick: pochi documenti brevi; full: fino a 500 pagine")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    print(f"Generazione corpus '{args.profile}' in {args.output_dir}")
+    manifest = generate_corpus(args.output_dir, args.profile, args.seed)
+    print(f"Corpus {manifest['corpus_id']}: {len(manifest['documents'])} documenti, "
+          f"{sum(doc['pages'] for doc in manifest['documents'])} pagine")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
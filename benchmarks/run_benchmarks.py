@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Benchmark del processore PDF su corpus sintetico
+Misura i singoli stadi di PDFProcessor (analyze, rasterize, preprocess, ocr)
+e la pipeline completa sul corpus generato da corpus.py: pagine al secondo,
+latenza p50/p95 e picco di memoria. I risultati vanno in JSON e si
+confrontano con una baseline per individuare regressioni tra commit.
+Nessun accesso alla rete.
+
+Uso:
+    python run_benchmarks.py perf_results/corpus-quick --output perf_results/latest.json
+    python run_benchmarks.py perf_results/corpus-quick --baseline benchmarks/baseline.json
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+# Moduli del processore: scripts/ nel repository, /app nell'immagine Docker
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / 'scripts'
+sys.path.insert(0, str(SCRIPTS_DIR if SCRIPTS_DIR.is_dir() else Path('/app')))
+
+from PIL import Image
+from pdf_processor import (
+    PDFProcessor, available_cpus, default_workers, processing_settings,
+    optimize_image_for_ocr, recognize_page
+)
+from image_preprocessing import is_blank_page
+from tracing import measure
+from corpus import PROFILES, generate_corpus, load_manifest, file_sha256
+
+logger = logging.getLogger(__name__)
+
+RESULTS_VERSION = 1
+
+# Stadi misurati e strumenti esterni necessari a ciascuno
+STAGES = ('analyze', 'rasterize', 'preprocess', 'ocr', 'pipeline')
+REQUIRED_TOOLS = {
+    'analyze': (),
+    'rasterize': ('pdfinfo', 'pdftoppm'),
+    'preprocess': ('pdfinfo', 'pdftoppm'),
+    'ocr': ('pdfinfo', 'pdftoppm', 'tesseract'),
+    'pipeline': ('pdfinfo', 'pdftoppm', 'tesseract', 'qpdf')
+}
+
+# Metriche confrontate con la baseline: (chiave, True se un valore più alto è meglio)
+COMPARED_METRICS = (
+    ('pages_per_second', True),
+    ('p50_seconds', False),
+    ('p95_seconds', False),
+    ('peak_rss_mb', False)
+)
+DEFAULT_THRESHOLD = 10.0
+
+def percentile(values, q):
+    """Percentile q (0-100) con interpolazione lineare"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+class StageResult:
+    """Campioni di latenza di uno stadio (per pagina o per documento) e picco di memoria"""
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.samples = []
+        self.pages = 0
+        self.peak_rss_mb = 0.0
+        self.failures = 0
+        self.documents = []
+
+    def add(self, seconds, pages=1):
+        self.samples.append(seconds)
+        self.pages += pages
+
+    def peak(self, mb):
+        self.peak_rss_mb = max(self.peak_rss_mb, mb or 0.0)
+
+    def summary(self):
+        seconds = sum(self.samples)
+        summary = {
+            'unit': self.unit,
+            'samples': len(self.samples),
+            'pages': self.pages,
+            'seconds': round(seconds, 3),
+            'pages_per_second': round(self.pages / seconds, 3) if seconds > 0 else None,
+            'p50_seconds': _round(percentile(self.samples, 50)),
+            'p95_seconds': _round(percentile(self.samples, 95)),
+            'peak_rss_mb': self.peak_rss_mb,
+            'failures': self.failures
+        }
+        if self.documents:
+            summary['documents'] = self.documents
+        return summary
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+def tool_version(cmd):
+    """Prima riga della versione di uno strumento esterno, None se non disponibile"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = (result.stdout or result.stderr).strip().splitlines()
+    return lines[0] if lines else None
+
+def environment(workers):
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': available_cpus(),
+        'pipeline_workers': workers,
+        'tesseract': tool_version(['tesseract', '--version']),
+        'pdftoppm': tool_version(['pdftoppm', '-v']),
+        'qpdf': tool_version(['qpdf', '--version'])
+    }
+
+def prepare_corpus(corpus_dir, profile):
+    """Manifest del corpus, rigenerato se assente, di un altro profilo o modificato"""
+    manifest = load_manifest(corpus_dir)
+    if manifest and manifest.get('profile') == profile:
+        intact = all(
+            (Path(corpus_dir) / doc['file']).exists()
+            and file_sha256(Path(corpus_dir) / doc['file']) == doc['sha256']
+            for doc in manifest['documents']
+        )
+        if intact:
+            return manifest
+        logger.warning("Corpus modificato rispetto al manifest: rigenerazione")
+
+    print(f"Generazione corpus '{profile}' in {corpus_dir}")
+    return generate_corpus(corpus_dir, profile)
+
+class BenchmarkRunner:
+    """Esegue gli stadi selezionati su tutti i documenti del corpus"""
+
+    def __init__(self, corpus_dir, manifest, stages=STAGES, repeat=1, workers=None):
+        self.corpus_dir = Path(corpus_dir)
+        self.manifest = manifest
+        self.repeat = max(1, repeat)
+        self.workers = workers or default_workers()
+        self.skipped = {}
+        self.stages = []
+        for stage in stages:
+            missing = [tool for tool in REQUIRED_TOOLS[stage] if not shutil.which(tool)]
+            if missing:
+                self.skipped[stage] = f"strumenti non disponibili: {', '.join(missing)}"
+            else:
+                self.stages.append(stage)
+        self.results = {
+            stage: StageResult('document' if stage in ('analyze', 'pipeline') else 'page')
+            for stage in self.stages
+        }
+
+    def run(self):
+        for run in range(self.repeat):
+            for doc in self.manifest['documents']:
+                path = self.corpus_dir / doc['file']
+                print(f"  [{run + 1}/{self.repeat}] {doc['file']} ({doc['pages']} pagine)")
+                scratch = Path(tempfile.mkdtemp(prefix='bench_'))
+                try:
+                    self._bench_stages(path, scratch)
+                    if 'pipeline' in self.results:
+                        self._bench_pipeline(path, doc, scratch)
+                finally:
+                    shutil.rmtree(scratch, ignore_errors=True)
+
+        results = {stage: result.summary() for stage, result in self.results.items()}
+        for stage, reason in self.skipped.items():
+            results[stage] = {'skipped': reason}
+        return {stage: results[stage] for stage in STAGES if stage in results}
+
+    def _bench_stages(self, path, scratch):
+        """Stadi isolati, in un solo processo: analisi del documento, poi per ogni
+        pagina da OCR rendering, preprocessing e tesseract"""
+        page_stages = {'rasterize', 'preprocess', 'ocr'} & set(self.results)
+        if 'analyze' not in self.results and not page_stages:
+            return
+
+        processor = PDFProcessor(path, scratch / 'stages.pdf', temp_dir=scratch / 'pages', workers=1)
+        with measure() as usage:
+            processor.analyze_pdf_content()
+        if 'analyze' in self.results:
+            self.results['analyze'].add(usage['wall_seconds'], len(processor.page_types))
+            self.results['analyze'].peak(usage['peak_rss_mb'])
+
+        if not page_stages or not processor.ocr_pages:
+            return
+
+        settings = processor.ocr_settings()
+        rendered = processor.iter_rendered_pages(processor.ocr_pages, chunk_size=1)
+        while True:
+            with measure() as usage:
+                item = next(rendered, None)
+            if item is None:
+                break
+            index, page_path, dpi = item
+            if 'rasterize' in self.results:
+                self.results['rasterize'].add(usage['wall_seconds'])
+                self.results['rasterize'].peak(usage['peak_rss_mb'])
+
+            # Come nella pipeline, le pagine bianche non passano da preprocessing e OCR
+            with Image.open(page_path) as image:
+                image.load()
+            if is_blank_page(image, settings['blank_threshold']):
+                Path(page_path).unlink(missing_ok=True)
+                continue
+
+            if 'preprocess' in self.results:
+                with measure() as usage:
+                    optimize_image_for_ocr(image, settings['preprocessing'], dpi)
+                self.results['preprocess'].add(usage['wall_seconds'])
+                self.results['preprocess'].peak(usage['peak_rss_mb'])
+            image = None
+
+            if 'ocr' in self.results:
+                page = recognize_page(page_path, index, scratch, settings, dpi)
+                if page.ok:
+                    self.results['ocr'].add(page.trace['ocr_seconds'])
+                    self.results['ocr'].peak(page.trace['ocr_peak_rss_mb'])
+                else:
+                    self.results['ocr'].failures += 1
+            Path(page_path).unlink(missing_ok=True)
+
+    def _bench_pipeline(self, path, doc, scratch):
+        """Pipeline completa con i worker configurati, come in produzione"""
+        result = self.results['pipeline']
+        processor = PDFProcessor(
+            path, scratch / 'pipeline.pdf', temp_dir=scratch / 'pipeline', workers=self.workers
+        )
+        with measure() as usage:
+            success = processor.process()
+        if not success:
+            result.failures += 1
+            return
+
+        result.add(usage['wall_seconds'], doc['pages'])
+        # Il picco include i processi pagina e tesseract, misurati nella traccia
+        page_peaks = [
+            max(page.get('peak_rss_mb') or 0, page.get('ocr_peak_rss_mb') or 0)
+            for page in processor.trace['pages']
+        ]
+        result.peak(max([usage['peak_rss_mb']] + page_peaks))
+        result.documents.append({
+            'file': doc['file'],
+            'pages': doc['pages'],
+            'content_type': processor.stats.get('content_type'),
+            'seconds': usage['wall_seconds'],
+            'stage_seconds': processor.stats.get('stage_seconds')
+        })
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Confronta i risultati con la baseline
+
+    Restituisce una riga per stadio e metrica con la variazione percentuale;
+    `regression` è vero se la metrica peggiora oltre `threshold` per cento.
+    """
+    rows = []
+    for stage, result in current['results'].items():
+        base = baseline.get('results', {}).get(stage)
+        if not base or 'skipped' in result or 'skipped' in base:
+            continue
+        for key, higher_is_better in COMPARED_METRICS:
+            old, new = base.get(key), result.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            rows.append({
+                'stage': stage,
+                'metric': key,
+                'baseline': old,
+                'current': new,
+                'change_pct': round(change, 1),
+                'regression': worse > threshold
+            })
+    return rows
+
+def print_results(results):
+    print(f"\n{'stadio':<12}{'pag/s':>10}{'p50 s':>10}{'p95 s':>10}{'picco MB':>10}  unità")
+    for stage, result in results.items():
+        if 'skipped' in result:
+            print(f"{stage:<12}  saltato ({result['skipped']})")
+            continue
+        print(
+            f"{stage:<12}{_fmt(result['pages_per_second']):>10}{_fmt(result['p50_seconds']):>10}"
+            f"{_fmt(result['p95_seconds']):>10}{result['peak_rss_mb']:>10}  {result['unit']}"
+            + (f", {result['failures']} errori" if result['failures'] else "")
+        )
+
+def print_comparison(rows, baseline, threshold):
+    print(f"\nConfronto con la baseline {baseline.get('label') or baseline.get('created_at')} "
+          f"(soglia {threshold}%)")
+    for row in rows:
+        mark = '✗' if row['regression'] else ' '
+        print(f" {mark} {row['stage']:<12}{row['metric']:<18}{_fmt(row['baseline']):>10} -> "
+              f"{_fmt(row['current']):<10}{row['change_pct']:+.1f}%")
+
+def _fmt(value):
+    return '-' if value is None else f"{value:.3f}"
+
+def git_label():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del processore PDF su corpus sintetico")
+    parser.add_argument('corpus_dir', help="Directory del corpus (generato se assente)")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick',
+                        help="Profilo del corpus: quick o full (fino a 500 pagine)")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"Stadi da misurare, separati da virgola (default: {','.join(STAGES)})")
+    parser.add_argument('--repeat', type=int, default=1, help="Ripetizioni dell'intero corpus")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processi pagina della pipeline (default: OCR_WORKERS o CPU disponibili)")
+    parser.add_argument('--output', default='benchmark_results.json', help="Risultati JSON")
+    parser.add_argument('--baseline', default=None, help="Risultati JSON di riferimento da confrontare")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Sovrascrive la baseline con i risultati di questa esecuzione")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Peggioramento percentuale oltre cui una metrica è una regressione")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="Esce con codice 1 se ci sono regressioni rispetto alla baseline")
+    parser.add_argument('--label', default=os.environ.get('BENCH_LABEL') or None,
+                        help="Etichetta dei risultati (default: BENCH_LABEL o commit git)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log del processore")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"stadi sconosciuti: {', '.join(sorted(unknown))}")
+
+    manifest = prepare_corpus(args.corpus_dir, args.profile)
+    runner = BenchmarkRunner(args.corpus_dir, manifest, stages, args.repeat, args.workers)
+    print(f"Benchmark corpus {manifest['corpus_id']} ({args.profile}), stadi: {', '.join(runner.stages)}")
+
+    started_at = datetime.now()
+    results = runner.run()
+    report = {
+        'version': RESULTS_VERSION,
+        'label': args.label or git_label(),
+        'created_at': started_at.isoformat(),
+        'corpus': {
+            'id': manifest['corpus_id'],
+            'profile': manifest['profile'],
+            'documents': len(manifest['documents']),
+            'pages': sum(doc['pages'] for doc in manifest['documents'])
+        },
+        'repeat': runner.repeat,
+        'environment': environment(runner.workers),
+        'settings': processing_settings(),
+        'results': results
+    }
+    print_results(results)
+
+    regressions = []
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        if baseline.get('corpus', {}).get('id') != report['corpus']['id']:
+            print("⚠ Corpus diverso da quello della baseline: confronto non significativo")
+        if baseline.get('settings') != report['settings']:
+            print("⚠ Configurazione OCR diversa da quella della baseline")
+        rows = compare(report, baseline, args.threshold)
+        regressions = [row for row in rows if row['regression']]
+        report['comparison'] = {
+            'baseline_label': baseline.get('label'),
+            'threshold_pct': args.threshold,
+            'rows': rows
+        }
+        print_comparison(rows, baseline, args.threshold)
+        print(f"\n{len(regressions)} regressioni" if regressions else "\nNessuna regressione")
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Risultati: {args.output}")
+
+    if args.baseline and (args.update_baseline or baseline is None):
+        report.pop('comparison', None)
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Baseline aggiornata: {args.baseline}")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Client asincrono (asyncio + aiohttp) per l'API PDF OCR Processor
+Connessioni HTTP riusate da un pool, upload e download in streaming su disco,
+invio concorrente di molti file limitato alla capacità della coda del server.
+
+Uso:
+    python async_client.py batch_input batch_output
+    python async_client.py batch_input batch_output --concurrency 4
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+
+import aiohttp
+
+# Configurazione API
+API_BASE_URL = "http://localhost:5000"
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Attesa di ogni richiesta long-poll su /status (il server la limita a 60s)
+STATUS_POLL_WAIT = 30
+
+class JobFailed(Exception):
+    """Il job è terminato in errore sul server"""
+
+class AsyncPDFOCRClient:
+    """Client asincrono per l'API PDF OCR Processor
+
+    Va usato come context manager: la sessione (e il suo pool di connessioni)
+    vive quanto il blocco `async with`.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, max_connections=16, max_retries=5):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def health_check(self):
+        """Stato dell'API (/health)"""
+        async with self.session.get(f"{self.base_url}/health") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def queue_capacity(self):
+        """Job che il server accetta senza rifiutarli: slot di esecuzione + posti in coda"""
+        queue = (await self.health_check()).get('queue', {})
+        return max(1, queue.get('slots', 1) + queue.get('max_queued', 0))
+
+    async def submit(self, file_path, output_name=None, callback_url=None):
+        """Invia un PDF in modalità asincrona e restituisce il job_id
+
+        Il file viene letto a blocchi durante l'upload. Con la coda piena (429)
+        attende il tempo indicato da Retry-After e riprova.
+        """
+        for attempt in range(self.max_retries + 1):
+            form = aiohttp.FormData()
+            form.add_field('async', 'true')
+            if output_name:
+                form.add_field('output_name', output_name)
+            if callback_url:
+                form.add_field('callback_url', callback_url)
+
+            with open(file_path, 'rb') as fh:
+                form.add_field(
+                    'file', fh, filename=os.path.basename(file_path),
+                    content_type='application/pdf'
+                )
+                async with self.session.post(f"{self.base_url}/process", data=form) as response:
+                    body = await response.json()
+                    if response.status in (200, 202):
+                        return body['job_id']
+                    if response.status != 429 or attempt == self.max_retries:
+                        raise JobFailed(body.get('error', f"HTTP {response.status}"))
+                    retry_after = int(response.headers.get('Retry-After', 5))
+
+            await asyncio.sleep(retry_after)
+
+    async def wait(self, job_id, timeout=600):
+        """Attende la fine del job con il long-poll di /status; restituisce lo stato finale"""
+        deadline = time.monotonic() + timeout
+        state = None
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Job {job_id} non completato entro {timeout}s")
+
+            params = {'wait': max(1, min(STATUS_POLL_WAIT, int(remaining)))}
+            if state:
+                params['state'] = state
+            async with self.session.get(
+                f"{self.base_url}/status/{job_id}", params=params,
+                timeout=aiohttp.ClientTimeout(total=params['wait'] + 30)
+            ) as response:
+                status = await response.json()
+                if response.status != 200:
+                    raise JobFailed(status.get('error', f"HTTP {response.status}"))
+
+            if status['status'] == 'completed':
+                return status
+            if status['status'] == 'error':
+                raise JobFailed(status.get('error', 'Errore sconosciuto'))
+            state = status.get('state')
+
+    async def download(self, job_id, output_path):
+        """Scarica il risultato a blocchi su disco (file .part rinominato a fine download)"""
+        output_path = Path(output_path)
+        part_path = output_path.with_name(output_path.name + '.part')
+        async with self.session.get(f"{self.base_url}/download/{job_id}") as response:
+            if response.status != 200:
+                body = await response.json()
+                raise JobFailed(body.get('error', 'Download fallito'))
+            with open(part_path, 'wb') as fh:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    fh.write(chunk)
+        os.replace(part_path, output_path)
+        return output_path
+
+    async def process(self, file_path, output_path, timeout=600):
+        """Invia, attende e scarica un singolo PDF"""
+        job_id = await self.submit(file_path, Path(output_path).name)
+        status = await self.wait(job_id, timeout)
+        await self.download(job_id, output_path)
+        return job_id, status
+
+    async def process_many(self, files, output_dir, concurrency=None, timeout=600):
+        """Elabora molti PDF mantenendo piena, senza superarla, la coda del server
+
+        I job sul server (in coda o in elaborazione) sono al più `concurrency`,
+        di default la capacità letta da /health. Il download avviene dopo aver
+        liberato il posto, così il job successivo parte subito.
+        Restituisce un risultato per file, nell'ordine di `files`.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        limit = asyncio.Semaphore(concurrency or await self.queue_capacity())
+
+        async def run(file_path):
+            file_path = Path(file_path)
+            output_path = output_dir / f"{file_path.stem}_ocr.pdf"
+            result = {'file': str(file_path), 'status': 'success'}
+            start = time.monotonic()
+            try:
+                async with limit:
+                    job_id = await self.submit(file_path, output_path.name)
+                    result['job_id'] = job_id
+                    status = await self.wait(job_id, timeout)
+                await self.download(job_id, output_path)
+                result.update(output=str(output_path), cache_hit=status.get('cache_hit', False))
+            except (JobFailed, aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                result.update(status='error', error=str(e) or type(e).__name__)
+            result['seconds'] = round(time.monotonic() - start, 2)
+            return result
+
+        return await asyncio.gather(*(run(f) for f in files))
+
+async def main():
+    parser = argparse.ArgumentParser(description='Elaborazione concorrente di una directory di PDF')
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--url', default=API_BASE_URL)
+    parser.add_argument('--concurrency', type=int, help='Job contemporanei (default: capacità del server)')
+    parser.add_argument('--timeout', type=int, default=600, help='Timeout per job in secondi')
+    args = parser.parse_args()
+
+    files = sorted(Path(args.input_dir).glob('*.pdf'))
+    if not files:
+        print(f"❌ Nessun PDF in {args.input_dir}")
+        return 1
+
+    start = time.monotonic()
+    async with AsyncPDFOCRClient(args.url) as client:
+        results = await client.process_many(files, args.output_dir, args.concurrency, args.timeout)
+
+    failed = [r for r in results if r['status'] == 'error']
+    for r in failed:
+        print(f"  ❌ {r['file']}: {r['error']}")
+    print(f"📊 {len(results) - len(failed)}/{len(results)} file elaborati "
+          f"in {time.monotonic() - start:.1f}s")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -4,6 +4,7 @@ Esempi di integrazione PDF OCR Processor con sistemi automatici
 """
 
 import requests
+import json
 import time
 import os
 from pathlib import Path
@@ -57,36 +58,64 @@ class PDFOCRClient:
         finally:
             files['file'].close()
     
-    def process_async(self, file_path, output_name=None):
-        """Elaborazione asincrona - ritorna job_id"""
+    def process_async(self, file_path, output_name=None, max_retries=3, callback_url=None,
+                      profile=False):
+        """Elaborazione asincrona - ritorna job_id
+        
+        Con la coda piena (429) attende il tempo indicato da Retry-After e riprova.
+        Con callback_url l'API notifica la fine del job con una POST firmata.
+        Con profile il job viene profilato con cProfile (vedi download_profile).
+        """
         
-        files = {'file': open(file_path, 'rb')}
         data = {'async': 'true'}
         
         if output_name:
             data['output_name'] = output_name
+        if callback_url:
+            data['callback_url'] = callback_url
+        if profile:
+            data['profile'] = 'true'
         
         try:
-            response = self.session.post(
-                f"{self.base_url}/process",
-                files=files,
-                data=data
-            )
-            
-            if response.status_code == 202:
-                return True, response.json()['job_id']
-            else:
-                return False, response.json().get('error', 'Errore sconosciuto')
+            for attempt in range(max_retries + 1):
+                with open(file_path, 'rb') as fh:
+                    response = self.session.post(
+                        f"{self.base_url}/process",
+                        files={'file': fh},
+                        data=data
+                    )
+                
+                if response.status_code == 429 and attempt < max_retries:
+                    time.sleep(int(response.headers.get('Retry-After', 5)))
+                    continue
+                
+                # 200 = risultato già in cache, 202 = job in coda
+                if response.status_code in (200, 202):
+                    return True, response.json()['job_id']
+                else:
+                    return False, response.json().get('error', 'Errore sconosciuto')
                 
         except Exception as e:
             return False, str(e)
-        finally:
-            files['file'].close()
     
-    def get_job_status(self, job_id):
-        """Controlla stato di un job"""
+    def get_job_status(self, job_id, wait=0, state=None, trace=False):
+        """Controlla stato di un job
+        
+        Con wait > 0 la risposta arriva solo quando lo stato cambia rispetto
+        a `state` (campo `state` di una risposta precedente) o dopo wait secondi.
+        Con trace un job terminato include la traccia per stadio e per pagina.
+        """
+        params = {}
+        if wait:
+            params['wait'] = wait
+            if state:
+                params['state'] = state
+        if trace:
+            params['trace'] = 'true'
         try:
-            response = self.session.get(f"{self.base_url}/status/{job_id}")
+            response = self.session.get(
+                f"{self.base_url}/status/{job_id}", params=params, timeout=wait + 30
+            )
             if response.status_code == 200:
                 return True, response.json()
             else:
@@ -97,22 +126,94 @@ class PDFOCRClient:
     def download_result(self, job_id, output_path):
         """Scarica risultato di un job completato"""
         try:
-            response = self.session.get(f"{self.base_url}/download/{job_id}")
-            if response.status_code == 200:
+            with self.session.get(f"{self.base_url}/download/{job_id}", stream=True) as response:
+                if response.status_code != 200:
+                    return False, response.json().get('error', 'Download fallito')
+                # Scrittura a blocchi: il PDF non viene caricato interamente in memoria
                 with open(output_path, 'wb') as f:
-                    f.write(response.content)
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                return True, output_path
+        except Exception as e:
+            return False, str(e)
+    
+    def download_profile(self, job_id, output_path):
+        """Scarica il profilo cProfile di un job inviato con profile=True
+        
+        Il file si analizza con `python -m pstats` o snakeviz.
+        """
+        try:
+            response = self.session.get(f"{self.base_url}/profile/{job_id}")
+            if response.status_code != 200:
+                return False, response.json().get('error', 'Profilo non disponibile')
+            with open(output_path, 'wb') as f:
+                f.write(response.content)
+            return True, output_path
+        except Exception as e:
+            return False, str(e)
+    
+    def process_batch(self, file_paths):
+        """Invia molti PDF in un'unica richiesta come gruppo di job; ritorna group_id
+        
+        Accetta anche archivi .zip/.tar(.gz): i PDF contenuti vengono estratti dal server.
+        """
+        handles = [open(path, 'rb') for path in file_paths]
+        try:
+            files = [
+                ('archive' if str(path).lower().endswith(('.zip', '.tar', '.tar.gz', '.tgz')) else 'files',
+                 (os.path.basename(str(path)), fh))
+                for path, fh in zip(file_paths, handles)
+            ]
+            response = self.session.post(f"{self.base_url}/batch", files=files, timeout=600)
+            if response.status_code == 202:
+                return True, response.json()['group_id']
+            return False, response.json().get('error', 'Errore sconosciuto')
+        except Exception as e:
+            return False, str(e)
+        finally:
+            for fh in handles:
+                fh.close()
+    
+    def wait_for_batch(self, group_id, timeout=3600, check_interval=5):
+        """Attende la fine di tutti i job di un gruppo; ritorna lo stato aggregato"""
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            response = self.session.get(f"{self.base_url}/batch/{group_id}")
+            if response.status_code != 200:
+                return False, response.json().get('error', 'Gruppo non trovato')
+            status = response.json()
+            if status['status'] not in ('queued', 'processing'):
+                return status['status'] != 'error', status
+            time.sleep(check_interval)
+        return False, "Timeout raggiunto"
+    
+    def download_batch(self, group_id, output_path):
+        """Scarica i risultati del gruppo come unico ZIP, a blocchi su disco"""
+        try:
+            with self.session.get(f"{self.base_url}/batch/{group_id}/download", stream=True) as response:
+                if response.status_code != 200:
+                    return False, response.json().get('error', 'Download fallito')
+                with open(output_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
                 return True, output_path
-            else:
-                return False, response.json().get('error', 'Download fallito')
         except Exception as e:
             return False, str(e)
     
-    def wait_for_completion(self, job_id, timeout=600, check_interval=5):
-        """Attende completamento di un job asincrono"""
+    def wait_for_completion(self, job_id, timeout=600, poll_wait=30):
+        """Attende completamento di un job asincrono
+        
+        Usa il long-poll di /status: ogni richiesta resta aperta finché il job
+        cambia stato (al più poll_wait secondi), senza attese fisse tra le richieste.
+        """
         start_time = time.time()
+        state = None
         
         while time.time() - start_time < timeout:
-            success, status = self.get_job_status(job_id)
+            remaining = timeout - (time.time() - start_time)
+            success, status = self.get_job_status(
+                job_id, wait=max(1, min(poll_wait, int(remaining))), state=state
+            )
             
             if not success:
                 return False, status
@@ -122,9 +223,31 @@ class PDFOCRClient:
             elif status['status'] == 'error':
                 return False, status.get('error', 'Errore sconosciuto')
             
-            time.sleep(check_interval)
+            state = status.get('state')
         
         return False, "Timeout raggiunto"
+    
+    def watch_progress(self, job_id):
+        """Segue un job tramite lo stream /events (Server-Sent Events)
+        
+        Generatore di tuple (evento, stato): `status` ai cambi di stato,
+        `progress` a ogni pagina completata; termina alla fine del job.
+        """
+        with self.session.get(
+            f"{self.base_url}/events/{job_id}", stream=True, timeout=(10, 60)
+        ) as response:
+            if response.status_code != 200:
+                raise RuntimeError(response.json().get('error', 'Job non trovato'))
+            
+            event, data = None, []
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[6:].strip()
+                elif line.startswith('data:'):
+                    data.append(line[5:].strip())
+                elif not line and data:
+                    yield event, json.loads('\n'.join(data))
+                    event, data = None, []
 
 # ESEMPIO 1: Elaborazione singola sincrona
 def example_sync_processing():
@@ -175,8 +298,15 @@ def example_async_processing():
     
     print(f"📋 Job ID: {job_id}")
     
-    # Monitora progresso
+    # Monitora progresso (stream /events, una riga per pagina completata)
     print("⏳ Monitoraggio in corso...")
+    for event, status in client.watch_progress(job_id):
+        progress = status.get('progress') or {}
+        if progress.get('pages_ocr'):
+            print(f"   {progress['pages_done']}/{progress['pages_ocr']} pagine OCR")
+        elif event == 'status':
+            print(f"   Stato: {status['status']}")
+    
     success, result = client.wait_for_completion(job_id)
     
     if success:
@@ -196,7 +326,12 @@ def example_async_processing():
 
 # ESEMPIO 3: Elaborazione batch con retry
 def example_batch_processing():
-    """Esempio di elaborazione batch con gestione errori"""
+    """Esempio di elaborazione batch con gestione errori
+    
+    Un file alla volta: per inviare molti file in parallelo, fino alla capacità
+    della coda del server, usare AsyncPDFOCRClient.process_many (async_client.py),
+    oppure inviarli in un'unica richiesta con PDFOCRClient.process_batch.
+    """
     
     client = PDFOCRClient()
     input_dir = Path("batch_input")
@@ -409,73 +544,27 @@ def example_monitoring_integration():
 
 # ESEMPIO 5: Integrazione con webhook
 def example_webhook_integration():
-    """Esempio di integrazione con sistema webhook"""
-    
-    from threading import Thread
-    import queue
+    """Esempio di integrazione con sistema webhook
     
-    # Coda per gestire notifiche
-    notification_queue = queue.Queue()
-    
-    def webhook_sender():
-        """Thread che invia notifiche webhook"""
-        webhook_url = "https://your-system.com/webhook/pdf-processed"
-        
-        while True:
-            try:
-                notification = notification_queue.get(timeout=60)
-                
-                # Invia notifica
-                response = requests.post(
-                    webhook_url,
-                    json=notification,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    print(f"✅ Webhook inviato: {notification['job_id']}")
-                else:
-                    print(f"❌ Webhook fallito: {response.status_code}")
-                    
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"❌ Errore webhook: {e}")
-    
-    # Avvia thread webhook
-    webhook_thread = Thread(target=webhook_sender, daemon=True)
-    webhook_thread.start()
+    L'API invia una POST firmata (HMAC-SHA256) a fine job: a WEBHOOK_URL se
+    configurato e all'eventuale callback_url passato con il job. Non serve
+    interrogare /status; per provare in locale avviare webhook_receiver.py
+    (con WEBHOOK_ALLOWED_HOSTS=localhost sull'API: le callback verso indirizzi
+    interni sono rifiutate).
+    """
     
     client = PDFOCRClient()
     
-    # Processa file con notifiche webhook
     file_path = "documento.pdf"
     if os.path.exists(file_path):
-        success, job_id = client.process_async(file_path)
+        success, job_id = client.process_async(
+            file_path, callback_url="http://localhost:8080/webhook/pdf-processed"
+        )
         
         if success:
-            # Monitora e invia notifiche
-            while True:
-                success, status = client.get_job_status(job_id)
-                
-                if success:
-                    notification = {
-                        'job_id': job_id,
-                        'file': file_path,
-                        'status': status['status'],
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    
-                    if status['status'] == 'completed':
-                        notification['output_size'] = status.get('output_size', 0)
-                        notification_queue.put(notification)
-                        break
-                    elif status['status'] == 'error':
-                        notification['error'] = status.get('error', 'Errore sconosciuto')
-                        notification_queue.put(notification)
-                        break
-                
-                time.sleep(10)
+            print(f"📋 Job {job_id} accodato: la notifica arriverà al termine")
+        else:
+            print(f"❌ Errore avvio: {job_id}")
 
 if __name__ == "__main__":
     print("=== Esempi di Integrazione PDF OCR Processor ===\n")
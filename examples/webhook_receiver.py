@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Ricevitore webhook di prova per PDF OCR Processor
+Verifica la firma HMAC delle notifiche e stampa gli eventi ricevuti.
+
+Uso:
+    WEBHOOK_SECRET=segreto python webhook_receiver.py --port 8080
+    # API: WEBHOOK_URL=http://host:8080/webhook oppure callback_url per job
+    # --fail N risponde 503 alle prime N notifiche per provare i ritentativi
+"""
+
+import os
+import hmac
+import json
+import time
+import hashlib
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Differenza massima accettata tra il timestamp firmato e l'ora locale (anti-replay)
+MAX_CLOCK_SKEW = 300
+
+def verify_signature(secret, timestamp, body, signature):
+    """Confronta la firma ricevuta con quella attesa per "<timestamp>.<body>" """
+    expected = 'sha256=' + hmac.new(
+        secret.encode('utf-8'), f"{timestamp}.".encode('utf-8') + body, hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    secret = None
+    failures_left = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        timestamp = self.headers.get('X-PDF-OCR-Timestamp', '')
+
+        if self.secret:
+            if not verify_signature(self.secret, timestamp, body,
+                                    self.headers.get('X-PDF-OCR-Signature')):
+                print("❌ Firma non valida")
+                return self._reply(401)
+            if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > MAX_CLOCK_SKEW:
+                print("❌ Timestamp fuori tolleranza")
+                return self._reply(401)
+
+        if WebhookHandler.failures_left > 0:
+            WebhookHandler.failures_left -= 1
+            print(f"⚠️  Errore simulato (ancora {WebhookHandler.failures_left})")
+            return self._reply(503)
+
+        event = json.loads(body)
+        print(f"✅ {event['event']} job {event['id']} "
+              f"(consegna {self.headers.get('X-PDF-OCR-Delivery')})")
+        if event.get('error'):
+            print(f"   Errore: {event['error']}")
+        elif event.get('download_path'):
+            print(f"   Risultato: {event['download_path']} ({event.get('output_size', 0)} bytes)")
+        self._reply(200)
+
+    def _reply(self, code):
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Ricevitore webhook di prova')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fail', type=int, default=0,
+                        help='Notifiche iniziali a cui rispondere 503')
+    args = parser.parse_args()
+
+    WebhookHandler.secret = os.environ.get('WEBHOOK_SECRET') or None
+    WebhookHandler.failures_left = args.fail
+
+    print(f"📡 In ascolto su http://{args.host}:{args.port}/ "
+          f"(firma {'verificata' if WebhookHandler.secret else 'non verificata'})")
+    ThreadingHTTPServer((args.host, args.port), WebhookHandler).serve_forever()
+
+if __name__ == '__main__':
+    main()
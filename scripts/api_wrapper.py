@@ -4,20 +4,40 @@ API REST wrapper per PDF OCR Processor
 Permette integrazione con sistemi automatici via HTTP
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 import os
+import json
 import tempfile
 import shutil
 import subprocess
 import logging
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
 import time
+import multiprocessing
+import atexit
+import zipfile
+from urllib.parse import quote, urlparse
+from result_cache import ResultCache, file_sha256, make_cache_key
+from pdf_processor import processing_settings
+from worker_pool import WorkerPool, JobTimeout
+from job_scheduler import JobScheduler, QueueFull
+from job_store import JobStatus, IN_FLIGHT_STATUSES, open_job_store
+from page_checkpoint import completed_pages, read_progress
+from upload_stream import StreamingUploadRequest, NotAPDF, TooManyFiles, extract_pdfs
+from webhooks import WebhookDispatcher, CallbackRejected
+from metrics import JobMetrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+# Dimensione massima degli upload (MAX_FILE_SIZE_MB): il corpo viene scritto
+# su disco a blocchi, quindi il limite non dipende dalla memoria dei worker
+MAX_FILE_SIZE_MB = int(os.environ.get('MAX_FILE_SIZE_MB', '') or 500)
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
+app.request_class = StreamingUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE_MB * 1024 * 1024
 
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
@@ -26,60 +46,506 @@ logger = logging.getLogger(__name__)
 # Directory di lavoro
 WORK_DIR = "/tmp/pdf_processor"
 os.makedirs(WORK_DIR, exist_ok=True)
+app.config['UPLOAD_ROOT'] = WORK_DIR
+
+# Checkpoint per pagina, uno per chiave di cache: anche un nuovo invio dello
+# stesso file con la stessa configurazione riprende dalle pagine già fatte
+CHECKPOINT_DIR = os.path.join(WORK_DIR, "checkpoints")
+CHECKPOINT_MAX_AGE_HOURS = 24
+
+# Tentativi per job: dopo un timeout o un worker terminato il job riparte
+# dal checkpoint, purché il tentativo precedente abbia completato pagine
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '') or 3)
+
+# Gruppi di job (/batch): file per gruppo, byte estraibili da un archivio,
+# conservazione del gruppo (i job seguono la pulizia normale)
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', '') or 500)
+BATCH_MAX_EXTRACT_MB = int(os.environ.get('BATCH_MAX_EXTRACT_MB', '') or 4096)
+GROUP_MAX_AGE_HOURS = 24
+
+# Archivio job condiviso tra i worker gunicorn (DATABASE_URL, default SQLite locale)
+job_store = open_job_store(os.environ.get('DATABASE_URL') or f"sqlite:///{WORK_DIR}/jobs.db")
+
+# Identificativo del processo proprietario dei job avviati da questo worker
+OWNER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+# Eventi di completamento dei job eseguiti da questo processo; per gli altri
+# l'attesa interroga l'archivio ogni JOB_POLL_INTERVAL secondi
+job_events = {}
+jobs_lock = threading.Lock()
+JOB_POLL_INTERVAL = 0.5
+
+# Attesa massima di /status?wait=N (long-poll) e intervallo dei heartbeat di /events
+STATUS_MAX_WAIT = 60
+EVENTS_HEARTBEAT = 15
+
+# Cache risultati condivisa con CLI e batch (OCR_CACHE_DIR, vuoto = disabilitata)
+result_cache = ResultCache.from_env()
+
+# Backend di elaborazione: "local" (pool di worker pre-avviati) o "docker" (container per job)
+PROCESSING_BACKEND = os.environ.get('PROCESSING_BACKEND', 'local').lower()
+PROCESSING_TIMEOUT = int(os.environ.get('PROCESSING_TIMEOUT', '') or 600)
+
+# Coda limitata e slot di esecuzione (MAX_CONCURRENT_JOBS / MAX_QUEUED_JOBS),
+# comuni a tutti i worker gunicorn tramite l'archivio dei job
+scheduler = JobScheduler.from_env(job_store)
+
+# Pool di worker del processo gunicorn corrente (creato in get_worker_pool)
+worker_pool = None
+worker_pool_pid = None
+worker_pool_lock = threading.Lock()
 
-# Storage per job in corso
-active_jobs = {}
+# Notifiche di fine job (WEBHOOK_URL e callback_url per job), coda persistente condivisa
+webhooks = WebhookDispatcher.from_env(os.path.join(WORK_DIR, "webhooks.db"))
+WEBHOOK_RETENTION_HOURS = 24
 
-class JobStatus:
-    QUEUED = "queued"
-    PROCESSING = "processing" 
-    COMPLETED = "completed"
-    ERROR = "error"
+# Metriche Prometheus su /metrics (ENABLE_METRICS), aggregate tra i worker
+# gunicorn tramite PROMETHEUS_MULTIPROC_DIR
+metrics = JobMetrics.from_env(job_store.count_by_status)
+
+# Download delegati a nginx (X-Accel-Redirect): prefisso della location interna
+# che serve WORK_DIR, vuoto = file inviati direttamente dall'API
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '')
+
+# Variabili di configurazione OCR inoltrate al container del processore
+PROCESSOR_ENV_VARS = [
+    'OCR_LANGUAGE', 'OCR_DPI', 'OCR_MIN_DPI', 'OCR_ADAPTIVE_DPI', 'OCR_PSM', 'OCR_OEM',
+    'OCR_WORKERS', 'OCR_ANALYSIS_SAMPLE',
+    'OCR_BLANK_THRESHOLD', 'OCR_DROP_BLANK_PAGES', 'OCR_PREPROCESS'
+]
+
+# Campi interni non esposti nelle risposte
+INTERNAL_JOB_FIELDS = ['input_path', 'output_path', 'cache_key', 'owner', 'callback_urls']
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
+def public_job_view(job):
+    """Copia del job senza i campi interni"""
+    job = job.copy()
+    for field in INTERNAL_JOB_FIELDS:
+        job.pop(field, None)
+    return job
+
+def register_job(job):
+    """Registra un nuovo job, oppure restituisce l'id del job identico già in corso
+    
+    La deduplicazione avviene nell'archivio, quindi vale tra tutti i worker.
+    """
+    with jobs_lock:
+        job_events[job['id']] = threading.Event()
+    
+    existing_id = job_store.create(job)
+    if existing_id is not None:
+        with jobs_lock:
+            job_events.pop(job['id'], None)
+    return existing_id
+
+def finish_job(job_id):
+    """Sveglia le richieste di questo processo in attesa del job"""
+    with jobs_lock:
+        event = job_events.pop(job_id, None)
+    
+    if event:
+        event.set()
+
+def wait_for_job(job_id, timeout=None):
+    """Attende la fine di un job; restituisce il job (ancora in corso se scade il timeout)"""
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        job = job_store.get(job_id)
+        if job is None or job['status'] not in IN_FLIGHT_STATUSES:
+            return job
+        
+        wait = JOB_POLL_INTERVAL
+        if deadline is not None:
+            wait = min(wait, deadline - time.monotonic())
+            if wait <= 0:
+                return job
+        
+        event = job_events.get(job_id)
+        if event:
+            event.wait(wait)
+        else:
+            time.sleep(wait)
+
+def job_progress(job):
+    """Avanzamento per pagina scritto dal processore nel checkpoint (solo job in elaborazione)"""
+    if job['status'] != JobStatus.PROCESSING or not job.get('cache_key'):
+        return None
+    return read_progress(checkpoint_dir_for(job))
+
+def job_state(job, progress):
+    """Token che cambia a ogni variazione di stato o di avanzamento del job"""
+    if not progress:
+        return job['status']
+    return f"{job['status']}:{progress.get('stage')}:{progress.get('pages_done', 0)}"
+
+def watch_job(job_id, state=None, timeout=0):
+    """Attende che stato o avanzamento del job cambino rispetto a `state`
+    
+    Con `state` None il riferimento è lo stato al momento della chiamata.
+    Restituisce (job, avanzamento) appena cambia qualcosa, il job termina o
+    scade il timeout; (None, None) se il job non esiste.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = job_store.get(job_id)
+        if job is None:
+            return None, None
+        progress = job_progress(job)
+        current = job_state(job, progress)
+        if state is None:
+            state = current
+        
+        remaining = deadline - time.monotonic()
+        if current != state or job['status'] not in IN_FLIGHT_STATUSES or remaining <= 0:
+            return job, progress
+        
+        wait = min(JOB_POLL_INTERVAL, remaining)
+        event = job_events.get(job_id)
+        if event:
+            event.wait(wait)
+        else:
+            time.sleep(wait)
+
+def record_job(job_id):
+    """Registra nelle metriche un job appena terminato"""
+    if not metrics:
+        return
+    job = job_store.get(job_id)
+    if job is None or job['status'] in IN_FLIGHT_STATUSES:
+        return
+    try:
+        metrics.observe_job(job)
+    except Exception as e:
+        logger.warning(f"Impossibile registrare le metriche del job {job_id}: {e}")
+
+def count_requests(outcome, n=1):
+    """Conta nelle metriche richieste non eseguite come nuovi job"""
+    if metrics:
+        metrics.count(outcome, n)
+
+def notify_job(job_id):
+    """Accoda la notifica webhook di un job terminato"""
+    job = job_store.get(job_id)
+    if job is None or job['status'] in IN_FLIGHT_STATUSES:
+        return
+    
+    event = 'job.completed' if job['status'] == JobStatus.COMPLETED else 'job.failed'
+    payload = public_job_view(job)
+    payload['event'] = event
+    if job['status'] == JobStatus.COMPLETED:
+        payload['download_path'] = f"/download/{job_id}"
+    
+    try:
+        webhooks.notify(job_id, event, payload, job.get('callback_urls'))
+    except Exception as e:
+        logger.error(f"Impossibile accodare il webhook del job {job_id}: {e}")
+
+def add_job_callback(job_id, callback_url):
+    """Aggiunge la callback di una richiesta agganciata a un job esistente
+    
+    Se il job è terminato nel frattempo la notifica viene accodata subito
+    (consegna almeno una volta: la callback può ricevere un duplicato).
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return
+    urls = job.get('callback_urls', [])
+    if callback_url not in urls:
+        job = job_store.update(job_id, callback_urls=urls + [callback_url])
+    if job and job['status'] not in IN_FLIGHT_STATUSES:
+        notify_job(job_id)
+
+def callback_url_error(url):
+    """Motivo per cui callback_url non è accettabile, None se valido
+    
+    Oltre allo schema si verifica la destinazione: senza WEBHOOK_ALLOWED_HOSTS
+    il server non invia notifiche a indirizzi interni (loopback, metadata, reti private).
+    """
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        parsed = None
+    if not parsed or parsed.scheme not in ('http', 'https') or not parsed.netloc:
+        return 'callback_url non valido (http/https)'
+    try:
+        webhooks.policy.check(url)
+    except CallbackRejected as e:
+        return f'callback_url non ammesso: {e}'
+    except (OSError, ValueError):
+        return 'callback_url non valido: host non risolvibile'
+    return None
+
+def reject_job(job_id):
+    """Annulla un job non ammesso in coda"""
+    job_store.delete(job_id)
+    finish_job(job_id)
+
+def load_job_stats(output_path):
+    """Statistiche scritte dal processore (pagine OCR, bianche saltate, ...)"""
+    return _load_job_json(os.path.splitext(output_path)[0] + '.stats.json')
+
+def load_job_trace(output_path):
+    """Traccia scritta dal processore (tempi, CPU e memoria per stadio e per pagina)"""
+    return _load_job_json(os.path.splitext(output_path)[0] + '.trace.json')
+
+def profile_path_for(job):
+    return os.path.splitext(job['output_path'])[0] + '.prof'
+
+def _load_job_json(path):
+    try:
+        with open(path, encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def get_worker_pool():
+    """Pool di worker del processo corrente, creato al primo uso
+    
+    Ogni worker gunicorn ha il proprio pool: un pool ereditato con fork
+    dal processo master non è utilizzabile e viene ricreato.
+    """
+    global worker_pool, worker_pool_pid
+    with worker_pool_lock:
+        if worker_pool is None or worker_pool_pid != os.getpid():
+            worker_pool = WorkerPool.from_env()
+            worker_pool_pid = os.getpid()
+        return worker_pool
+
+def shutdown_worker_pool():
+    """Chiude il pool all'uscita del worker gunicorn (riciclo, riavvio)
+    
+    I processi del pool non sono daemon: senza chiusura esplicita l'uscita
+    resterebbe bloccata sul join fino al SIGKILL di gunicorn e un job in corso
+    continuerebbe nel proprio gruppo di processi mentre un altro worker lo riprende.
+    """
+    with worker_pool_lock:
+        if worker_pool is not None and worker_pool_pid == os.getpid():
+            worker_pool.shutdown(terminate=True)
+
+def send_result(job, download_name=None):
+    """Risposta con il PDF di output di un job completato
+    
+    ETag forte dall'hash del contenuto e richieste condizionali/Range gestite
+    da send_file (304, 206); con DOWNLOAD_ACCEL_PREFIX il trasferimento è
+    delegato a nginx e il worker si libera subito.
+    """
+    download_name = download_name or job['output_file']
+    etag = job.get('output_etag')
+    
+    if DOWNLOAD_ACCEL_PREFIX:
+        relative_path = os.path.relpath(job['output_path'], WORK_DIR)
+        response = app.response_class(mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = (
+            DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative_path)
+        )
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        if etag:
+            response.set_etag(etag)
+        return response
+    
+    response = send_file(
+        job['output_path'],
+        as_attachment=True,
+        download_name=download_name,
+        mimetype='application/pdf',
+        conditional=True,
+        etag=etag or True
+    )
+    # Annuncia il supporto Range anche sulle risposte complete (download riprendibili)
+    response.headers.setdefault('Accept-Ranges', 'bytes')
+    return response
+
+class _ZipStreamBuffer:
+    """Destinazione in sola scrittura per zipfile: raccoglie i byte da inviare al client"""
+    
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._offset
+    
+    def flush(self):
+        pass
+    
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_zip(files, extra=None):
+    """Genera uno ZIP (senza compressione: i PDF lo sono già) mentre lo invia
+    
+    `files` sono coppie (nome nell'archivio, percorso), `extra` {nome: bytes};
+    in memoria resta un solo blocco per volta.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, path in files:
+            info = zipfile.ZipInfo.from_file(path, arcname=name)
+            large = info.file_size > zipfile.ZIP64_LIMIT
+            with open(path, 'rb') as src, archive.open(info, 'w', force_zip64=large) as dst:
+                for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                    dst.write(chunk)
+                    yield buffer.pop()
+        for name, data in (extra or {}).items():
+            archive.writestr(name, data)
+    yield buffer.pop()
+
+def checkpoint_dir_for(job):
+    return os.path.join(CHECKPOINT_DIR, job['cache_key'])
+
+def run_local(input_path, output_path, checkpoint_dir, profile=False):
+    """Elabora il PDF in un worker del pool; restituisce (successo, errore, statistiche)"""
+    scratch_dir = os.path.join(os.path.dirname(input_path), 'scratch')
+    result = get_worker_pool().run(input_path, output_path, scratch_dir, checkpoint_dir, profile)
+    return result['success'], result['error'], result['stats']
+
+def run_docker(input_path, output_path, checkpoint_dir, profile=False):
+    """Elabora il PDF in un container dedicato; restituisce (successo, errore, statistiche)"""
+    # Esegui il processore Docker con la stessa configurazione OCR dell'API
+    cmd = ['docker', 'run', '--rm']
+    for var in PROCESSOR_ENV_VARS:
+        if os.environ.get(var):
+            cmd += ['-e', var]
+    cmd += [
+        '-v', f'{os.path.dirname(input_path)}:/app/input',
+        '-v', f'{os.path.dirname(output_path)}:/app/output',
+        '-v', f'{checkpoint_dir}:/app/checkpoint',
+        'pdf-ocr-processor',
+        '--stats',
+        '--trace',
+        '--checkpoint', '/app/checkpoint'
+    ]
+    if profile:
+        cmd.append('--profile')
+    cmd += [os.path.basename(input_path), os.path.basename(output_path)]
+    
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=PROCESSING_TIMEOUT)
+    success = result.returncode == 0 and os.path.exists(output_path)
+    return success, result.stderr, load_job_stats(output_path) if success else None
+
 def process_pdf_async(job_id, input_path, output_path):
     """Processa PDF in background"""
     try:
-        active_jobs[job_id]['status'] = JobStatus.PROCESSING
-        active_jobs[job_id]['started_at'] = datetime.now()
+        job = job_store.update(job_id, status=JobStatus.PROCESSING, started_at=datetime.now())
+        checkpoint_dir = checkpoint_dir_for(job)
+        os.makedirs(checkpoint_dir, exist_ok=True)
         
-        # Esegui il processore Docker
-        cmd = [
-            'docker', 'run', '--rm',
-            '-v', f'{os.path.dirname(input_path)}:/app/input',
-            '-v', f'{os.path.dirname(output_path)}:/app/output',
-            'pdf-ocr-processor',
-            os.path.basename(input_path),
-            os.path.basename(output_path)
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        attempt = 0
+        while True:
+            attempt += 1
+            pages_before = completed_pages(checkpoint_dir)
+            try:
+                runner = run_docker if PROCESSING_BACKEND == 'docker' else run_local
+                success, error, stats = runner(
+                    input_path, output_path, checkpoint_dir, job.get('profile', False)
+                )
+                break
+            except (subprocess.TimeoutExpired, JobTimeout, RuntimeError) as e:
+                # Interruzione: si riprova solo se il tentativo ha fatto progressi
+                progress = completed_pages(checkpoint_dir) - pages_before
+                if attempt >= JOB_MAX_ATTEMPTS or progress <= 0:
+                    raise
+                logger.warning(
+                    f"Job {job_id} interrotto ({e}), {progress} pagine salvate: "
+                    f"tentativo {attempt + 1}/{JOB_MAX_ATTEMPTS}"
+                )
+                job_store.update(job_id, attempts=attempt + 1)
         
-        if result.returncode == 0 and os.path.exists(output_path):
-            active_jobs[job_id]['status'] = JobStatus.COMPLETED
-            active_jobs[job_id]['completed_at'] = datetime.now()
-            active_jobs[job_id]['output_size'] = os.path.getsize(output_path)
+        if success:
+            # OCR fallito su alcune pagine: output consegnato ma segnalato, e non in cache
+            pages_failed = (stats or {}).get('pages_failed') or 0
+            fields = {}
+            if pages_failed:
+                fields = {
+                    'pages_failed': pages_failed,
+                    'warning': f"OCR fallito su {pages_failed} pagine, copiate senza testo"
+                }
+                logger.warning(f"Job {job_id} completato con {pages_failed} pagine senza OCR")
+            job = job_store.update(
+                job_id,
+                status=JobStatus.COMPLETED,
+                completed_at=datetime.now(),
+                output_size=os.path.getsize(output_path),
+                output_etag=file_sha256(output_path),
+                stats=stats,
+                **fields
+            )
+            
+            if result_cache and not pages_failed:
+                try:
+                    result_cache.put(job['cache_key'], output_path)
+                except Exception as e:
+                    logger.warning(f"Impossibile salvare il risultato in cache: {e}")
         else:
-            active_jobs[job_id]['status'] = JobStatus.ERROR
-            active_jobs[job_id]['error'] = result.stderr
+            fail_job(job_id, error or 'Elaborazione fallita')
             
-    except subprocess.TimeoutExpired:
-        active_jobs[job_id]['status'] = JobStatus.ERROR
-        active_jobs[job_id]['error'] = "Timeout: elaborazione troppo lunga"
+    except (subprocess.TimeoutExpired, JobTimeout):
+        fail_job(job_id, "Timeout: elaborazione troppo lunga")
     except Exception as e:
-        active_jobs[job_id]['status'] = JobStatus.ERROR  
-        active_jobs[job_id]['error'] = str(e)
+        fail_job(job_id, str(e))
+    finally:
+        finish_job(job_id)
+        record_job(job_id)
+        notify_job(job_id)
+
+def fail_job(job_id, error):
+    job_store.update(job_id, status=JobStatus.ERROR, error=error, completed_at=datetime.now())
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check per monitoring"""
-    return jsonify({
+    counts = job_store.count_by_status()
+    health = {
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'active_jobs': len([j for j in active_jobs.values() if j['status'] == JobStatus.PROCESSING])
-    })
+        'active_jobs': counts.get(JobStatus.PROCESSING, 0),
+        'jobs': counts,
+        'backend': PROCESSING_BACKEND
+    }
+    
+    health['queue'] = scheduler.stats()
+    
+    if worker_pool is not None and worker_pool_pid == os.getpid():
+        health['worker_pool'] = worker_pool.stats()
+    
+    if result_cache:
+        health['cache'] = result_cache.stats()
+    
+    health['webhooks'] = webhooks.stats()
+    
+    return jsonify(health)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Metriche in formato Prometheus, sommate su tutti i worker"""
+    if not metrics:
+        return jsonify({'error': 'Metriche disabilitate (ENABLE_METRICS=false)'}), 404
+    
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.errorhandler(NotAPDF)
+def handle_not_a_pdf(e):
+    # Upload interrotto ai primi byte: il resto del corpo non viene letto
+    return jsonify({'error': 'Solo file PDF sono supportati'}), 400
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_too_large(e):
+    return jsonify({'error': f'File troppo grande (massimo {MAX_FILE_SIZE_MB}MB)'}), 413
+
+@app.teardown_request
+def discard_unclaimed_upload(exc):
+    """Rimuove gli upload di richieste fallite o non trasformate in job"""
+    request.discard_upload()
 
 @app.route('/process', methods=['POST'])
 def process_pdf():
@@ -99,19 +565,30 @@ def process_pdf():
     # Parametri opzionali
     async_mode = request.form.get('async', 'false').lower() == 'true'
     output_name = request.form.get('output_name', '')
+    profile = request.form.get('profile', 'false').lower() == 'true'
+    callback_url = request.form.get('callback_url', '').strip()
+    callback_error = callback_url_error(callback_url) if callback_url else None
+    if callback_error:
+        return jsonify({'error': callback_error}), 400
     
     try:
-        # Crea job ID univoco
-        job_id = str(uuid.uuid4())
-        job_dir = os.path.join(WORK_DIR, job_id)
-        os.makedirs(job_dir, exist_ok=True)
+        # Il file è già su disco nella directory del job creata durante l'upload,
+        # con hash e pagine calcolati mentre arrivavano i byte
+        upload = file.stream
+        upload.close()
+        # Il controllo dell'intestazione avviene sui byte ricevuti: un file vuoto
+        # o più corto di %PDF- non lo ha mai raggiunto
+        if not upload.is_pdf():
+            return jsonify({'error': 'Solo file PDF sono supportati'}), 400
+        job_id = request.job_id
+        job_dir = request.upload_dir
         
-        # Salva file input
-        filename = secure_filename(file.filename)
+        filename = secure_filename(file.filename) or 'input.pdf'
         input_path = os.path.join(job_dir, filename)
-        file.save(input_path)
+        os.replace(upload.path, input_path)
         
-        # Determina nome output
+        # Determina nome output (sempre dentro la directory del job)
+        output_name = secure_filename(output_name)
         if not output_name:
             base_name = os.path.splitext(filename)[0]
             output_name = f"{base_name}_ocr.pdf"
@@ -119,108 +596,496 @@ def process_pdf():
         output_path = os.path.join(job_dir, output_name)
         
         # Inizializza job tracking
-        active_jobs[job_id] = {
-            'id': job_id,
-            'status': JobStatus.QUEUED,
-            'input_file': filename,
-            'output_file': output_name,
-            'input_size': os.path.getsize(input_path),
-            'created_at': datetime.now(),
-            'input_path': input_path,
-            'output_path': output_path
-        }
+        job = new_job(job_id, input_path, output_path, upload)
+        if callback_url:
+            job['callback_urls'] = [callback_url]
+        if profile:
+            job['profile'] = True
         
-        if async_mode:
-            # Processing asincrono
-            thread = threading.Thread(
-                target=process_pdf_async,
-                args=(job_id, input_path, output_path)
-            )
-            thread.daemon = True
-            thread.start()
+        # Risultato già in cache: il job è completato subito
+        # (non per i job da profilare, che devono essere elaborati)
+        if not profile and complete_from_cache(job):
+            job_store.create(job)
+            request.upload_claimed = True
+            record_job(job_id)
+            notify_job(job_id)
+            
+            if async_mode:
+                return jsonify({
+                    'job_id': job_id,
+                    'status': JobStatus.COMPLETED,
+                    'cache_hit': True,
+                    'message': 'Risultato in cache, usa /download/{job_id} per scaricarlo'
+                }), 200
             
+            return send_result(job)
+        
+        # Stesso input con la stessa configurazione già in coda o in elaborazione:
+        # la richiesta si aggancia al job esistente e ne condivide il risultato
+        existing_id = register_job(job)
+        if existing_id:
+            logger.info(f"Richiesta duplicata agganciata al job {existing_id}")
+            count_requests('deduplicated')
+            if callback_url:
+                add_job_callback(existing_id, callback_url)
+            return attach_to_job(existing_id, async_mode, output_name)
+        request.upload_claimed = True
+        
+        try:
+            scheduler.submit(job_id)
+        except QueueFull as e:
+            # Coda piena: il job non viene creato e il client riprova più tardi
+            reject_job(job_id)
+            shutil.rmtree(job_dir, ignore_errors=True)
+            count_requests('rejected')
+            logger.warning(f"Job rifiutato, coda piena (retry tra {e.retry_after}s)")
+            response = jsonify({
+                'error': 'Coda di elaborazione piena, riprovare più tardi',
+                'retry_after': e.retry_after
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 429
+        
+        position = scheduler.position(job_id)
+        
+        if async_mode:
+            # Processing asincrono: il job parte quando si libera uno slot
             return jsonify({
                 'job_id': job_id,
                 'status': JobStatus.QUEUED,
-                'message': 'Job avviato, usa /status/{job_id} per monitorare'
+                'queue_position': position,
+                'message': 'Job accodato, usa /status/{job_id} per monitorare'
             }), 202
             
         else:
-            # Processing sincrono
-            process_pdf_async(job_id, input_path, output_path)
+            # Processing sincrono: attende il job accodato
+            job = wait_for_job(job_id)
             
-            if active_jobs[job_id]['status'] == JobStatus.COMPLETED:
-                return send_file(
-                    output_path,
-                    as_attachment=True,
-                    download_name=output_name,
-                    mimetype='application/pdf'
-                )
+            if job and job['status'] == JobStatus.COMPLETED:
+                return send_result(job)
             else:
                 return jsonify({
-                    'error': active_jobs[job_id].get('error', 'Errore sconosciuto')
+                    'error': job.get('error', 'Errore sconosciuto') if job else 'Job non trovato'
                 }), 500
                 
     except Exception as e:
         logger.error(f"Errore processing: {e}")
         return jsonify({'error': str(e)}), 500
 
+def new_job(job_id, input_path, output_path, upload):
+    """Nuovo job in coda per un PDF ricevuto (hash e pagine calcolati durante l'upload)"""
+    return {
+        'id': job_id,
+        'status': JobStatus.QUEUED,
+        'input_file': os.path.basename(input_path),
+        'output_file': os.path.basename(output_path),
+        'input_size': upload.size,
+        'input_pages': upload.page_count,
+        'input_hash': upload.sha256,
+        'created_at': datetime.now(),
+        'input_path': input_path,
+        'output_path': output_path,
+        # Chiave di cache: hash del contenuto + configurazione OCR effettiva
+        'cache_key': make_cache_key(upload.sha256, processing_settings()),
+        'owner': OWNER_ID
+    }
+
+def complete_from_cache(job):
+    """Completa subito il job se il risultato è in cache; True se trovato"""
+    if not (result_cache and result_cache.get(job['cache_key'], job['output_path'])):
+        return False
+    job.update({
+        'status': JobStatus.COMPLETED,
+        'completed_at': datetime.now(),
+        'output_size': os.path.getsize(job['output_path']),
+        'output_etag': file_sha256(job['output_path']),
+        'cache_hit': True
+    })
+    return True
+
+def attach_to_job(job_id, async_mode, download_name):
+    """Risposta per una richiesta agganciata a un job già in corso"""
+    if async_mode:
+        job = job_store.get(job_id)
+        return jsonify({
+            'job_id': job_id,
+            'status': job['status'] if job else JobStatus.ERROR,
+            'deduplicated': True,
+            'message': 'Job identico già in corso, usa /status/{job_id} per monitorare'
+        }), 202
+    
+    # Sincrono: attende il job esistente e ne restituisce lo stesso risultato
+    job = wait_for_job(job_id, timeout=600)
+    if job and job['status'] in IN_FLIGHT_STATUSES:
+        return jsonify({'error': 'Timeout: elaborazione troppo lunga'}), 500
+    
+    if job and job['status'] == JobStatus.COMPLETED:
+        return send_result(job, download_name)
+    
+    return jsonify({
+        'error': job.get('error', 'Errore sconosciuto') if job else 'Job non trovato'
+    }), 500
+
 @app.route('/status/<job_id>', methods=['GET'])
 def get_job_status(job_id):
-    """Controlla stato di un job"""
+    """Controlla stato di un job
+    
+    Con ?wait=N (long-poll, max STATUS_MAX_WAIT secondi) la risposta arriva
+    quando stato o avanzamento cambiano rispetto a ?state= (il campo `state`
+    di una risposta precedente; default lo stato attuale) o allo scadere di N.
+    Con ?trace=true un job terminato include la traccia del processore
+    (tempi, CPU e memoria per stadio e per pagina).
+    """
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), STATUS_MAX_WAIT)
+    except ValueError:
+        return jsonify({'error': 'Parametro wait non valido'}), 400
+    
+    job, progress = watch_job(job_id, request.args.get('state'), wait)
+    if job is None:
+        return jsonify({'error': 'Job non trovato'}), 404
+    
+    status = job_status_view(job, progress)
+    if request.args.get('trace', 'false').lower() == 'true' and job['status'] not in IN_FLIGHT_STATUSES:
+        status['trace'] = load_job_trace(job['output_path'])
+    return jsonify(status)
+
+@app.route('/events/<job_id>', methods=['GET'])
+def stream_job_events(job_id):
+    """Stream Server-Sent Events dello stato di un job
     
-    if job_id not in active_jobs:
+    Eventi `status` ai cambi di stato e `progress` a ogni pagina completata,
+    con lo stesso contenuto di /status; lo stream si chiude alla fine del job.
+    """
+    if job_store.get(job_id) is None:
         return jsonify({'error': 'Job non trovato'}), 404
     
-    job = active_jobs[job_id].copy()
+    def generate():
+        # Stato iniziale vuoto: il primo evento riporta subito lo stato attuale
+        state, status = '', None
+        yield f"retry: {EVENTS_HEARTBEAT * 1000}\n\n"
+        while True:
+            job, progress = watch_job(job_id, state, EVENTS_HEARTBEAT)
+            if job is None:
+                return
+            
+            current = job_state(job, progress)
+            if current == state:
+                # Commento SSE: mantiene aperta la connessione attraverso i proxy
+                yield ": heartbeat\n\n"
+                continue
+            
+            event = 'progress' if job['status'] == status else 'status'
+            state, status = current, job['status']
+            data = app.json.dumps(job_status_view(job, progress))
+            yield f"id: {state}\nevent: {event}\ndata: {data}\n\n"
+            
+            if status not in IN_FLIGHT_STATUSES:
+                return
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # nginx non deve bufferizzare lo stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def job_status_view(job, progress=None):
+    """Stato pubblico di un job per /status e /events"""
+    job_id = job['id']
     
     # Rimuovi percorsi interni dalla risposta
-    job.pop('input_path', None)
-    job.pop('output_path', None)
+    job = public_job_view(job)
+    job['state'] = job_state(job, progress)
+    if progress:
+        job['progress'] = progress
+    
+    # Posizione nella coda comune e avvio stimato se in attesa
+    if job['status'] == JobStatus.QUEUED:
+        position = scheduler.position(job_id)
+        if position is not None:
+            wait = scheduler.estimated_wait(position)
+            job['queue_position'] = position
+            job['estimated_start'] = (datetime.now() + timedelta(seconds=wait)).isoformat()
     
     # Calcola durata se in corso
     if job['status'] == JobStatus.PROCESSING and 'started_at' in job:
         duration = (datetime.now() - job['started_at']).total_seconds()
         job['duration_seconds'] = round(duration, 1)
     
-    return jsonify(job)
+    return job
+
+@app.route('/batch', methods=['POST'])
+def process_batch():
+    """Invio di molti PDF come un unico gruppo di job
+    
+    Accetta più campi `files` (PDF) e/o campi `archive` (ZIP o TAR di PDF).
+    I job del gruppo entrano insieme nella coda dei gruppi, dal file più
+    grande; stato aggregato su /batch/<group_id>, risultati in un unico ZIP
+    da /batch/<group_id>/download.
+    """
+    uploads = request.files.getlist('files') + request.files.getlist('archive')
+    if not uploads:
+        return jsonify({'error': 'Nessun file fornito (campi files o archive)'}), 400
+    
+    group_id = request.job_id
+    sources, rejected = [], []
+    try:
+        for file in uploads:
+            upload = file.stream
+            upload.close()
+            if upload.expect_pdf:
+                if not upload.is_pdf():
+                    return jsonify({'error': f'{file.filename}: solo file PDF sono supportati'}), 400
+                if allowed_file(file.filename):
+                    sources.append((file.filename, upload))
+                else:
+                    rejected.append(file.filename)
+                continue
+            # Il limite di file vale durante l'estrazione, prima di scrivere il PDF in eccesso
+            extracted, skipped = extract_pdfs(
+                upload.path, request.upload_dir, BATCH_MAX_EXTRACT_MB * 1024 * 1024,
+                max_files=max(0, BATCH_MAX_FILES - len(sources))
+            )
+            sources += extracted
+            rejected += skipped
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except TooManyFiles:
+        return jsonify({'error': f'Troppi file: massimo {BATCH_MAX_FILES} per gruppo'}), 413
+    
+    if not sources:
+        return jsonify({'error': 'Nessun PDF trovato', 'rejected': rejected}), 400
+    if len(sources) > BATCH_MAX_FILES:
+        return jsonify({'error': f'Troppi file: massimo {BATCH_MAX_FILES} per gruppo'}), 413
+    
+    members, to_schedule, cached, output_names = [], [], [], set()
+    job_dir = None
+    try:
+        for name, upload in sources:
+            # Ogni file diventa un job normale, con la propria directory
+            job_id = str(uuid.uuid4())
+            job_dir = os.path.join(WORK_DIR, job_id)
+            os.makedirs(job_dir)
+            filename = secure_filename(os.path.basename(name)) or 'input.pdf'
+            input_path = os.path.join(job_dir, filename)
+            os.replace(upload.path, input_path)
+            
+            # Nomi univoci nello ZIP dei risultati (stesso nome in cartelle diverse)
+            stem = os.path.splitext(filename)[0]
+            output_name = f"{stem}_ocr.pdf"
+            n = 1
+            while output_name in output_names:
+                n += 1
+                output_name = f"{stem}_{n}_ocr.pdf"
+            output_names.add(output_name)
+            
+            job = new_job(job_id, input_path, os.path.join(job_dir, output_name), upload)
+            job['group_id'] = group_id
+            
+            if complete_from_cache(job):
+                # Registrato solo dopo l'ammissione del gruppo in coda
+                cached.append(job)
+            else:
+                existing_id = register_job(job)
+                if existing_id:
+                    # Stesso contenuto già in corso: il gruppo condivide quel job
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    count_requests('deduplicated')
+                    job_id = existing_id
+                else:
+                    to_schedule.append(job)
+            members.append({'job_id': job_id, 'file': name, 'output': output_name})
+        
+        # Prima i file più grandi: i più piccoli riempiono gli slot verso la fine
+        to_schedule.sort(key=lambda job: job['input_size'], reverse=True)
+        scheduler.submit_group([job['id'] for job in to_schedule])
+    except QueueFull as e:
+        discard_group_jobs(to_schedule, cached)
+        count_requests('rejected', len(to_schedule))
+        logger.warning(f"Gruppo rifiutato, coda piena (retry tra {e.retry_after}s)")
+        response = jsonify({
+            'error': 'Coda di elaborazione piena, riprovare più tardi',
+            'retry_after': e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    except Exception as e:
+        # Errore a metà gruppo (disco pieno, archivio job): nessun job registrato
+        # resta in coda senza essere eseguito, né aggancia richieste successive
+        discard_group_jobs(to_schedule, cached)
+        if job_dir:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        logger.error(f"Errore creazione gruppo {group_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    for job in cached:
+        job_store.create(job)
+        record_job(job['id'])
+        notify_job(job['id'])
+    
+    job_store.create_group({
+        'id': group_id,
+        'created_at': datetime.now(),
+        'members': members,
+        'rejected': rejected
+    })
+    logger.info(f"Gruppo {group_id}: {len(members)} file, {len(to_schedule)} accodati")
+    
+    return jsonify({
+        'group_id': group_id,
+        'total': len(members),
+        'queued': len(to_schedule),
+        'rejected': rejected,
+        'jobs': [{'job_id': m['job_id'], 'file': m['file']} for m in members],
+        'message': 'Gruppo accodato, usa /batch/{group_id} per monitorare'
+    }), 202
+
+def discard_group_jobs(to_schedule, cached):
+    """Annulla i job di un gruppo non ammesso e ne rimuove le directory"""
+    for job in to_schedule:
+        reject_job(job['id'])
+        shutil.rmtree(os.path.dirname(job['input_path']), ignore_errors=True)
+    for job in cached:
+        shutil.rmtree(os.path.dirname(job['input_path']), ignore_errors=True)
+
+def group_status_view(group):
+    """Stato aggregato di un gruppo: conteggi, avanzamento e stato di ogni file"""
+    jobs = job_store.get_many(m['job_id'] for m in group['members'])
+    counts = {}
+    members = []
+    pages_total = pages_done = 0
+    
+    for member in group['members']:
+        job = jobs.get(member['job_id'])
+        # Job già rimosso dalla pulizia
+        status = job['status'] if job else 'expired'
+        counts[status] = counts.get(status, 0) + 1
+        entry = {'job_id': member['job_id'], 'file': member['file'], 'status': status}
+        
+        if job:
+            pages = job.get('input_pages') or 0
+            pages_total += pages
+            if status == JobStatus.COMPLETED:
+                pages_done += pages
+            elif status == JobStatus.ERROR:
+                entry['error'] = job.get('error')
+            elif status == JobStatus.PROCESSING:
+                progress = job_progress(job)
+                if progress:
+                    entry['progress'] = progress
+                    pages_done += progress.get('pages_done', 0)
+        members.append(entry)
+    
+    total = len(members)
+    in_flight = sum(counts.get(s, 0) for s in IN_FLIGHT_STATUSES)
+    completed = counts.get(JobStatus.COMPLETED, 0)
+    if in_flight:
+        status = JobStatus.QUEUED if counts.get(JobStatus.QUEUED) == total else JobStatus.PROCESSING
+    elif completed == total:
+        status = JobStatus.COMPLETED
+    elif completed == 0:
+        status = JobStatus.ERROR
+    else:
+        status = 'partial'
+    
+    return {
+        'group_id': group['id'],
+        'status': status,
+        'created_at': group['created_at'],
+        'total': total,
+        'counts': counts,
+        'progress': round((total - in_flight) / total, 3) if total else 1.0,
+        'pages_total': pages_total,
+        'pages_done': pages_done,
+        'rejected': group.get('rejected', []),
+        'jobs': members
+    }
+
+@app.route('/batch/<group_id>', methods=['GET'])
+def get_batch_status(group_id):
+    """Stato aggregato di un gruppo di job"""
+    
+    group = job_store.get_group(group_id)
+    if group is None:
+        return jsonify({'error': 'Gruppo non trovato'}), 404
+    
+    return jsonify(group_status_view(group))
+
+@app.route('/batch/<group_id>/download', methods=['GET'])
+def download_batch(group_id):
+    """Risultati di un gruppo in un unico ZIP generato durante l'invio
+    
+    Con il gruppo ancora in corso risponde 409, salvo ?partial=true (solo i
+    file già completati). Lo ZIP contiene anche batch_status.json.
+    """
+    group = job_store.get_group(group_id)
+    if group is None:
+        return jsonify({'error': 'Gruppo non trovato'}), 404
+    
+    view = group_status_view(group)
+    in_progress = view['status'] in IN_FLIGHT_STATUSES
+    if in_progress and request.args.get('partial', 'false').lower() != 'true':
+        return jsonify({'error': f'Gruppo non completato (status: {view["status"]})'}), 409
+    
+    jobs = job_store.get_many(m['job_id'] for m in group['members'])
+    files = []
+    for member in group['members']:
+        job = jobs.get(member['job_id'])
+        if job and job['status'] == JobStatus.COMPLETED and os.path.exists(job['output_path']):
+            files.append((member['output'], job['output_path']))
+    
+    if not files:
+        return jsonify({'error': 'Nessun risultato disponibile'}), 404
+    
+    summary = json.dumps(view, indent=2, default=str).encode('utf-8')
+    response = Response(stream_zip(files, {'batch_status.json': summary}), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=f"batch_{group_id}.zip")
+    return response
 
 @app.route('/download/<job_id>', methods=['GET'])
 def download_result(job_id):
     """Scarica risultato di un job completato"""
     
-    if job_id not in active_jobs:
+    job = job_store.get(job_id)
+    if job is None:
         return jsonify({'error': 'Job non trovato'}), 404
     
-    job = active_jobs[job_id]
-    
     if job['status'] != JobStatus.COMPLETED:
         return jsonify({'error': f'Job non completato (status: {job["status"]})'}), 400
     
     if not os.path.exists(job['output_path']):
         return jsonify({'error': 'File di output non trovato'}), 404
     
-    return send_file(
-        job['output_path'],
-        as_attachment=True,
-        download_name=job['output_file'],
-        mimetype='application/pdf'
-    )
+    return send_result(job)
+
+@app.route('/profile/<job_id>', methods=['GET'])
+def download_profile(job_id):
+    """Scarica il profilo cProfile di un job inviato con profile=true (formato pstats)"""
+    
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job non trovato'}), 404
+    
+    path = profile_path_for(job)
+    if not job.get('profile') or not os.path.exists(path):
+        return jsonify({'error': 'Profilo non disponibile (inviare il job con profile=true)'}), 404
+    
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"{job_id}.prof")
 
 @app.route('/jobs', methods=['GET'])
 def list_jobs():
-    """Lista tutti i job (per debugging)"""
+    """Lista dei job più recenti, filtrabile per stato (per debugging)"""
     
-    jobs = []
-    for job in active_jobs.values():
-        job_info = job.copy()
-        job_info.pop('input_path', None)
-        job_info.pop('output_path', None)
-        jobs.append(job_info)
+    status = request.args.get('status')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    
+    jobs = [public_job_view(job) for job in job_store.list(status=status, limit=limit)]
     
     return jsonify({
         'jobs': jobs,
-        'total': len(jobs)
+        'total': len(jobs),
+        'counts': job_store.count_by_status()
     })
 
 @app.route('/cleanup', methods=['POST'])
@@ -228,27 +1093,59 @@ def cleanup_jobs():
     """Pulisce job completati (manuale)"""
     
     cleaned = 0
-    for job_id in list(active_jobs.keys()):
-        job = active_jobs[job_id]
+    # Rimuovi job completati o in errore da più di 1 ora
+    for job in job_store.finished_before(datetime.now() - timedelta(hours=1)):
+        # Rimuovi file
+        job_dir = os.path.dirname(job.get('input_path', ''))
+        if job_dir and os.path.exists(job_dir):
+            shutil.rmtree(job_dir, ignore_errors=True)
         
-        # Rimuovi job completati da più di 1 ora
-        if job['status'] in [JobStatus.COMPLETED, JobStatus.ERROR]:
-            completed_at = job.get('completed_at', job.get('created_at'))
-            if (datetime.now() - completed_at).total_seconds() > 3600:
-                # Rimuovi file
-                job_dir = os.path.dirname(job.get('input_path', ''))
-                if os.path.exists(job_dir):
-                    shutil.rmtree(job_dir)
-                
-                # Rimuovi da memoria
-                del active_jobs[job_id]
-                cleaned += 1
+        # Rimuovi dall'archivio
+        job_store.delete(job['id'])
+        cleaned += 1
+    
+    # Checkpoint di job falliti e mai ripresentati
+    if os.path.isdir(CHECKPOINT_DIR):
+        max_age = CHECKPOINT_MAX_AGE_HOURS * 3600
+        for name in os.listdir(CHECKPOINT_DIR):
+            path = os.path.join(CHECKPOINT_DIR, name)
+            try:
+                if time.time() - os.path.getmtime(path) > max_age:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+    
+    job_store.delete_groups_before(datetime.now() - timedelta(hours=GROUP_MAX_AGE_HOURS))
+    
+    # Consegne webhook riuscite (quelle in dead-letter restano per l'ispezione)
+    webhooks.queue.purge(time.time() - WEBHOOK_RETENTION_HOURS * 3600)
     
     return jsonify({
         'message': f'Ripuliti {cleaned} job',
-        'remaining': len(active_jobs)
+        'remaining': sum(job_store.count_by_status().values())
     })
 
+@app.route('/webhooks', methods=['GET'])
+def list_webhook_deliveries():
+    """Consegne webhook più recenti, filtrabili per stato (es. ?status=dead)"""
+    
+    status = request.args.get('status')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    
+    return jsonify({
+        'deliveries': webhooks.queue.list(status=status, limit=limit),
+        'counts': webhooks.queue.counts()
+    })
+
+@app.route('/webhooks/<delivery_id>/retry', methods=['POST'])
+def retry_webhook_delivery(delivery_id):
+    """Rimette in coda una consegna in dead-letter"""
+    
+    if not webhooks.queue.retry(delivery_id):
+        return jsonify({'error': 'Consegna non trovata o non in dead-letter'}), 404
+    
+    return jsonify({'id': delivery_id, 'status': 'pending'})
+
 # Auto-cleanup ogni ora
 def auto_cleanup():
     """Cleanup automatico in background"""
@@ -260,10 +1157,47 @@ def auto_cleanup():
         except:
             pass
 
-# Avvia thread di cleanup
-cleanup_thread = threading.Thread(target=auto_cleanup)
-cleanup_thread.daemon = True
-cleanup_thread.start()
+def resume_orphaned_jobs():
+    """Rimette in coda i job rimasti in corso da processi terminati (riavvio, crash)
+    
+    I job riprendono dal proprio checkpoint per pagina.
+    """
+    for job in job_store.adopt_orphans(OWNER_ID):
+        if not os.path.exists(job['input_path']):
+            fail_job(job['id'], "Elaborazione interrotta dal riavvio del servizio")
+            record_job(job['id'])
+            notify_job(job['id'])
+            continue
+        logger.info(f"Job {job['id']} ripreso dopo il riavvio")
+
+def run_queued_job(job):
+    """Esegue un job prelevato dalla coda comune da uno slot di questo processo"""
+    process_pdf_async(job['id'], job['input_path'], job['output_path'])
+
+# Avvio del servizio solo nel processo API: i worker del pool (spawn) reimportano
+# il modulo e non devono registrarsi come proprietari, riprendere job o avviare thread
+if multiprocessing.parent_process() is None:
+    # Registra il processo come proprietario dei job che avvierà e riprende
+    # quelli rimasti orfani
+    job_store.register_owner(OWNER_ID)
+    resume_orphaned_jobs()
+    
+    # Slot di esecuzione del processo, alimentati dalla coda comune
+    scheduler.start(OWNER_ID, run_queued_job)
+    
+    # Avvia thread di cleanup
+    cleanup_thread = threading.Thread(target=auto_cleanup)
+    cleanup_thread.daemon = True
+    cleanup_thread.start()
+    
+    webhooks.start()
+    
+    # Pre-avvio del pool: i worker sono pronti prima della prima richiesta
+    if PROCESSING_BACKEND == 'local':
+        # Registrato dopo multiprocessing: gli hook atexit girano in ordine inverso,
+        # quindi il pool si chiude prima del join dei processi figli
+        atexit.register(shutdown_worker_pool)
+        get_worker_pool()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Elaborazione batch di una directory di PDF
+I file vengono distribuiti su un pool di worker OCR pre-avviati (un
+interprete per worker, non per file), dal più grande al più piccolo.
+Un manifest nella directory di output registra hash di input e output:
+una nuova esecuzione salta i file già elaborati con la stessa configurazione.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pdf_processor import available_cpus, processing_settings
+from result_cache import ResultCache, file_sha256, make_cache_key
+from worker_pool import WorkerPool, JobTimeout, DEFAULT_JOB_TIMEOUT
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".batch_manifest.json"
+SUMMARY_NAME = "batch_summary.json"
+
+def default_jobs():
+    """File elaborati in parallelo: BATCH_JOBS oppure metà delle CPU disponibili"""
+    value = os.environ.get('BATCH_JOBS', '').strip()
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    return max(1, available_cpus() // 2)
+
+def output_name(input_path):
+    return f"{input_path.stem}_ocr.pdf"
+
+class BatchManifest:
+    """Manifest dei file completati, {nome input: record}, riscritto atomicamente"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding='utf-8') as fh:
+                self.entries = json.load(fh).get('files', {})
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_done(self, name, cache_key, output_dir):
+        """True se il file è già stato elaborato con questo input e questa configurazione"""
+        entry = self.entries.get(name)
+        if not entry or entry.get('cache_key') != cache_key:
+            return False
+        output_path = Path(output_dir) / entry['output']
+        return output_path.exists() and output_path.stat().st_size == entry.get('output_size')
+
+    def record(self, name, entry):
+        with self._lock:
+            self.entries[name] = entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+                json.dump({'files': self.entries}, fh, indent=2)
+            os.replace(tmp_path, self.path)
+
+class BatchRunner:
+    """Elabora tutti i PDF di una directory con un pool di worker OCR"""
+
+    def __init__(self, input_dir, output_dir, temp_dir="/app/temp", jobs=None,
+                 page_workers=None, timeout=DEFAULT_JOB_TIMEOUT, force=False, cache_dir=None):
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.temp_dir = Path(temp_dir)
+        self.jobs = max(1, jobs or default_jobs())
+        self.page_workers = page_workers or max(1, available_cpus() // self.jobs)
+        self.timeout = timeout
+        self.force = force
+        self.cache = ResultCache.from_env(cache_dir)
+        self.manifest = BatchManifest(self.output_dir / MANIFEST_NAME)
+        self.settings = processing_settings()
+
+    def pending_files(self):
+        """PDF di input, dal più grande: i file lunghi partono per primi e i
+        piccoli riempiono i worker che si liberano verso la fine"""
+        files = [p for p in self.input_dir.iterdir() if p.is_file() and p.suffix.lower() == '.pdf']
+        return sorted(files, key=lambda p: p.stat().st_size, reverse=True)
+
+    def run(self):
+        """Elabora il batch e restituisce il riepilogo"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        files = self.pending_files()
+        started_at = datetime.now()
+        start = time.monotonic()
+        results = []
+
+        # Hash e controllo del manifest prima di avviare i worker
+        todo = []
+        for path in files:
+            cache_key = make_cache_key(file_sha256(path), self.settings)
+            if not self.force and self.manifest.is_done(path.name, cache_key, self.output_dir):
+                results.append({'file': path.name, 'status': 'skipped', 'seconds': 0.0})
+                continue
+            if self._from_cache(path, cache_key):
+                results.append({'file': path.name, 'status': 'cached', 'seconds': 0.0})
+                continue
+            todo.append((path, cache_key))
+
+        logger.info(
+            f"Batch: {len(files)} file, {len(files) - len(todo)} già elaborati, "
+            f"{len(todo)} da elaborare con {self.jobs} worker x {self.page_workers} processi pagina"
+        )
+
+        if todo:
+            pool = WorkerPool(
+                min(self.jobs, len(todo)), page_workers=self.page_workers, timeout=self.timeout
+            )
+            try:
+                with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                    futures = [executor.submit(self._process, pool, path, key) for path, key in todo]
+                    for i, future in enumerate(as_completed(futures), 1):
+                        result = future.result()
+                        results.append(result)
+                        mark = {'processed': '✓', 'partial': '⚠'}.get(result['status'], '✗')
+                        logger.info(
+                            f"[{i}/{len(todo)}] {mark} {result['file']} in {result['seconds']}s"
+                        )
+            finally:
+                pool.shutdown()
+
+        wall = time.monotonic() - start
+        processed = [r for r in results if r['status'] in ('processed', 'partial')]
+        pages = sum(r.get('pages_total') or 0 for r in processed)
+        summary = {
+            'started_at': started_at.isoformat(),
+            'completed_at': datetime.now().isoformat(),
+            'wall_seconds': round(wall, 2),
+            'jobs': self.jobs,
+            'page_workers': self.page_workers,
+            'files_total': len(files),
+            'counts': {
+                status: sum(1 for r in results if r['status'] == status)
+                for status in ('processed', 'partial', 'cached', 'skipped', 'error')
+            },
+            'pages_processed': pages,
+            'pages_per_second': round(pages / wall, 3) if wall > 0 else None,
+            'files': sorted(results, key=lambda r: r['file'])
+        }
+        return summary
+
+    def _from_cache(self, path, cache_key):
+        """Copia il risultato dalla cache risultati, se presente, e lo registra"""
+        if not self.cache:
+            return False
+        output_path = self.output_dir / output_name(path)
+        if not self.cache.get(cache_key, output_path):
+            return False
+        self._record(path, cache_key, output_path, 0.0)
+        return True
+
+    def _process(self, pool, path, cache_key):
+        """Elabora un file in un worker del pool (eseguito nei thread del batch)"""
+        output_path = self.output_dir / output_name(path)
+        scratch_dir = Path(tempfile.mkdtemp(dir=self.temp_dir, prefix='batch_'))
+        # Checkpoint per pagina: un batch interrotto riprende anche i file a metà
+        checkpoint_dir = self.temp_dir / 'checkpoints' / cache_key
+        result = {'file': path.name, 'status': 'error'}
+        start = time.monotonic()
+        try:
+            outcome = pool.run(path, output_path, scratch_dir, checkpoint_dir)
+            result['seconds'] = round(time.monotonic() - start, 2)
+            # Statistiche e traccia non restano accanto agli output (le statistiche vanno nel riepilogo)
+            for suffix in ('.stats.json', '.trace.json'):
+                Path(os.path.splitext(output_path)[0] + suffix).unlink(missing_ok=True)
+
+            if outcome['success']:
+                stats = outcome['stats'] or {}
+                result.update(
+                    status='processed',
+                    output=output_path.name,
+                    pages_total=stats.get('pages_total'),
+                    pages_ocr=stats.get('pages_ocr'),
+                    stats=stats
+                )
+                if stats.get('pages_failed'):
+                    # Output parziale: né manifest né cache, il prossimo batch lo riprova
+                    result.update(status='partial', pages_failed=stats['pages_failed'])
+                    logger.warning(f"{path.name}: {stats['pages_failed']} pagine senza OCR")
+                    return result
+                self._record(path, cache_key, output_path, result['seconds'])
+                if self.cache:
+                    try:
+                        self.cache.put(cache_key, output_path)
+                    except Exception as e:
+                        logger.warning(f"Impossibile salvare il risultato in cache: {e}")
+            else:
+                result['error'] = outcome['error'] or 'Elaborazione fallita'
+        except (JobTimeout, RuntimeError) as e:
+            # Timeout o worker terminato: il pool lo sostituisce, il batch prosegue
+            result.update(seconds=round(time.monotonic() - start, 2), error=str(e))
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        return result
+
+    def _record(self, path, cache_key, output_path, seconds):
+        self.manifest.record(path.name, {
+            'cache_key': cache_key,
+            'output': output_path.name,
+            'output_size': output_path.stat().st_size,
+            'output_sha256': file_sha256(output_path),
+            'seconds': seconds,
+            'completed_at': datetime.now().isoformat()
+        })
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Elabora in parallelo tutti i PDF di una directory"
+    )
+    parser.add_argument('input_dir', help="Directory dei PDF di input")
+    parser.add_argument('output_dir', help="Directory dei PDF di output")
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help="File elaborati in parallelo (default: BATCH_JOBS o metà delle CPU)"
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help="Processi OCR per file (default: OCR_WORKERS o CPU / jobs)"
+    )
+    parser.add_argument(
+        '--temp-dir', default=os.environ.get('BATCH_TEMP_DIR', '/app/temp'),
+        help="Directory temporanea e dei checkpoint"
+    )
+    parser.add_argument(
+        '--timeout', type=int, default=int(os.environ.get('PROCESSING_TIMEOUT', '') or DEFAULT_JOB_TIMEOUT),
+        help="Tempo massimo per file in secondi"
+    )
+    parser.add_argument(
+        '--summary', default=None,
+        help=f"Riepilogo JSON (default: <output_dir>/{SUMMARY_NAME})"
+    )
+    parser.add_argument(
+        '--force', action='store_true',
+        help="Rielabora anche i file già presenti nel manifest"
+    )
+    parser.add_argument(
+        '--cache-dir', default=None,
+        help="Directory della cache risultati (default: OCR_CACHE_DIR, vuoto = disabilitata)"
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir):
+        print(f"Directory di input non trovata: {args.input_dir}")
+        sys.exit(1)
+
+    page_workers = args.workers
+    if page_workers is None and os.environ.get('OCR_WORKERS', '').strip().isdigit():
+        page_workers = int(os.environ['OCR_WORKERS']) or None
+
+    runner = BatchRunner(
+        args.input_dir, args.output_dir, temp_dir=args.temp_dir, jobs=args.jobs,
+        page_workers=page_workers, timeout=args.timeout, force=args.force,
+        cache_dir=args.cache_dir
+    )
+    summary = runner.run()
+
+    summary_path = args.summary or os.path.join(args.output_dir, SUMMARY_NAME)
+    with open(summary_path, 'w', encoding='utf-8') as fh:
+        json.dump(summary, fh, indent=2)
+
+    counts = summary['counts']
+    logger.info(
+        f"Batch completato in {summary['wall_seconds']}s: {counts['processed']} elaborati, "
+        f"{counts['partial']} parziali, {counts['cached']} da cache, {counts['skipped']} invariati, "
+        f"{counts['error']} errori (riepilogo: {summary_path})"
+    )
+    sys.exit(1 if counts['error'] or counts['partial'] else 0)
+
+if __name__ == "__main__":
+    main()
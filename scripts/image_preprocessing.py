@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Preprocessing delle immagini per OCR basato su array NumPy
+Stadi configurabili: pulizia bordi, raddrizzamento, binarizzazione adattiva, denoise
+"""
+
+import time
+import logging
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Ordine di esecuzione degli stadi disponibili
+AVAILABLE_STAGES = ('border', 'deskew', 'binarize', 'denoise')
+
+DEFAULT_OPTIONS = {
+    'stages': list(AVAILABLE_STAGES),
+    # Finestra della soglia adattiva in pollici (1/8" ~ un paio di righe di testo)
+    'window_inches': 0.125,
+    # Un pixel è inchiostro se più scuro della media locale di questa frazione
+    'threshold': 0.15,
+    # Angolo massimo di raddrizzamento in gradi
+    'max_skew': 5.0
+}
+
+def parse_stages(value):
+    """Lista di stadi da una stringa separata da virgole (es. OCR_PREPROCESS)"""
+    if value is None:
+        return list(DEFAULT_OPTIONS['stages'])
+    stages = [s.strip().lower() for s in value.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in AVAILABLE_STAGES]
+    if unknown:
+        raise ValueError(f"Stadi di preprocessing sconosciuti: {', '.join(unknown)}")
+    # Gli stadi vengono sempre eseguiti nell'ordine canonico
+    return [s for s in AVAILABLE_STAGES if s in stages]
+
+# Rilevamento pagine bianche: un pixel è contenuto se si discosta dal livello della
+# carta di più di max(BLANK_MIN_DELTA, BLANK_NOISE_FACTOR * rumore), in entrambe le
+# direzioni (testo chiaro su fondo scuro); oltre BLANK_MAX_NOISE la pagina non è uniforme
+BLANK_MIN_DELTA = 24
+BLANK_NOISE_FACTOR = 6
+BLANK_MAX_NOISE = 10
+
+def is_blank_page(image, threshold):
+    """Rileva pagine bianche o quasi bianche dall'istogramma dei livelli di grigio
+    
+    L'immagine viene ridotta e analizzata senza i bordi (ombre di scansione).
+    Una pagina è bianca se l'istogramma è stretto attorno al livello della
+    carta e la frazione di pixel lontani da quel livello, più chiari o più
+    scuri, è sotto `threshold`.
+    """
+    if threshold <= 0:
+        return False
+    
+    gray = image if image.mode == 'L' else image.convert('L')
+    # Riduzione 4x: sufficiente per la statistica e 16 volte meno pixel
+    small = np.asarray(gray.reduce(4) if min(gray.size) >= 400 else gray)
+    
+    h, w = small.shape
+    my, mx = h // 20, w // 20
+    core = small[my:h - my, mx:w - mx]
+    if core.size == 0:
+        return False
+    
+    # Livello della carta: mediana della luminosità (la carta domina la pagina)
+    cumulative = np.cumsum(np.bincount(core.ravel(), minlength=256))
+    paper_level = int(np.searchsorted(cumulative, cumulative[-1] // 2))
+    
+    # Distanza dalla carta e rumore (mediana delle distanze): su una pagina
+    # con contenuto sparso il rumore è quello della carta
+    deviation = np.abs(core.astype(np.int16) - paper_level)
+    dev_cumulative = np.cumsum(np.bincount(deviation.ravel(), minlength=256))
+    noise = int(np.searchsorted(dev_cumulative, dev_cumulative[-1] // 2))
+    if noise > BLANK_MAX_NOISE:
+        # Istogramma largo: texture, foto o contenuto esteso
+        return False
+    
+    delta = max(BLANK_MIN_DELTA, BLANK_NOISE_FACTOR * noise)
+    content_pixels = dev_cumulative[-1] - dev_cumulative[delta]
+    return content_pixels / core.size < threshold
+
+def _box_sum(values, radius, axis):
+    """Somma su finestra mobile lungo un asse (cumsum con bordi replicati)"""
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (radius + 1, radius)
+    cumulative = np.cumsum(np.pad(values, pad, mode='edge'), axis=axis, dtype=np.float32)
+    
+    n = values.shape[axis]
+    width = 2 * radius + 1
+    upper = [slice(None)] * values.ndim
+    lower = [slice(None)] * values.ndim
+    upper[axis] = slice(width, width + n)
+    lower[axis] = slice(0, n)
+    
+    # Riusa il buffer della parte alta per il risultato
+    result = cumulative[tuple(upper)]
+    result -= cumulative[tuple(lower)]
+    return result
+
+def _local_mean(gray, radius):
+    """Media locale su finestra quadrata (filtro box separabile)"""
+    mean = _box_sum(gray.astype(np.float32), radius, axis=1)
+    mean = _box_sum(mean, radius, axis=0)
+    mean /= (2 * radius + 1) ** 2
+    return mean
+
+def _ink_neighbours(ink):
+    """Numero di vicini inchiostro (3x3, escluso il pixel stesso)"""
+    padded = np.pad(ink.view(np.uint8), 1)
+    h, w = ink.shape
+    count = np.zeros((h, w), dtype=np.uint8)
+    for dy in range(3):
+        for dx in range(3):
+            if dy == 1 and dx == 1:
+                continue
+            count += padded[dy:dy + h, dx:dx + w]
+    return count
+
+def _estimate_skew(ink, max_skew):
+    """Angolo di inclinazione (gradi) dal profilo di proiezione delle righe
+    
+    Per ogni angolo candidato i pixel inchiostro vengono proiettati sulle
+    righe con uno shear (y - x*tan) e si sceglie l'angolo con il profilo più
+    "a gradini", cioè con la massima somma dei quadrati delle differenze.
+    """
+    ys, xs = np.nonzero(ink)
+    if ys.size < 100:
+        return 0.0
+    
+    # Limita i punti per mantenere costante il costo
+    if ys.size > 200000:
+        step = ys.size // 200000 + 1
+        ys, xs = ys[::step], xs[::step]
+    
+    ys = ys.astype(np.float32)
+    xs = xs.astype(np.float32)
+    offset = xs.max() * np.tan(np.radians(max_skew)) + 1
+    
+    def score(angle):
+        rows = np.rint(ys - xs * np.tan(np.radians(angle)) + offset).astype(np.int64)
+        profile = np.bincount(rows)
+        diff = np.diff(profile)
+        return float(np.dot(diff, diff))
+    
+    # Ricerca grossolana poi raffinata
+    coarse = np.arange(-max_skew, max_skew + 0.01, 0.5)
+    best = max(coarse, key=score)
+    fine = np.arange(best - 0.5, best + 0.51, 0.1)
+    return float(max(fine, key=score))
+
+class PreprocessingPipeline:
+    """Pipeline di preprocessing con tempi per stadio
+    
+    L'immagine resta un array uint8 per tutta la pipeline; l'output è
+    un'immagine bilevel (modo '1') se la binarizzazione è attiva,
+    altrimenti in scala di grigi.
+    """
+    
+    def __init__(self, options=None):
+        self.options = dict(DEFAULT_OPTIONS)
+        if options:
+            self.options.update(options)
+        self.stages = self.options['stages']
+        self.timings = {}
+    
+    def _timed(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+        return result
+    
+    def run(self, image, dpi=300):
+        """Esegue gli stadi configurati e restituisce (immagine, tempi per stadio)"""
+        self.timings = {}
+        
+        gray = self._timed('grayscale', self._to_gray, image)
+        image = None
+        
+        if 'border' in self.stages:
+            self._timed('border', self._clean_border, gray)
+        
+        if 'deskew' in self.stages:
+            gray = self._timed('deskew', self._deskew, gray)
+        
+        if 'binarize' not in self.stages:
+            return Image.fromarray(gray), self.timings
+        
+        radius = max(3, int(dpi * self.options['window_inches']) // 2)
+        ink = self._timed('binarize', self._binarize, gray, radius)
+        gray = None
+        
+        if 'denoise' in self.stages:
+            self._timed('denoise', self._denoise, ink)
+        
+        # Bilevel: bianco = True, nero (inchiostro) = False
+        np.logical_not(ink, out=ink)
+        result = self._timed('to_image', Image.fromarray, ink)
+        return result, self.timings
+    
+    def _to_gray(self, image):
+        # Nessun ridimensionamento: la risoluzione è già scelta in fase di rendering
+        if image.mode != 'L':
+            image = image.convert('L')
+        
+        # Copia scrivibile: gli stadi successivi lavorano in place
+        return np.array(image, dtype=np.uint8)
+    
+    def _clean_border(self, gray):
+        """Sbianca (in place) le bande scure lasciate dallo scanner sui bordi
+        
+        Le dimensioni della pagina non cambiano, così il PDF generato mantiene
+        la geometria originale.
+        """
+        dark_rows = gray.mean(axis=1) < 100
+        dark_cols = gray.mean(axis=0) < 100
+        h, w = gray.shape
+        
+        top = int(np.argmin(dark_rows)) if dark_rows[0] else 0
+        bottom = int(np.argmin(dark_rows[::-1])) if dark_rows[-1] else 0
+        left = int(np.argmin(dark_cols)) if dark_cols[0] else 0
+        right = int(np.argmin(dark_cols[::-1])) if dark_cols[-1] else 0
+        
+        # Una banda oltre un quarto della pagina non è un bordo
+        if top < h // 4 and top:
+            gray[:top] = 255
+        if bottom < h // 4 and bottom:
+            gray[h - bottom:] = 255
+        if left < w // 4 and left:
+            gray[:, :left] = 255
+        if right < w // 4 and right:
+            gray[:, w - right:] = 255
+    
+    def _deskew(self, gray):
+        """Stima l'inclinazione su una versione ridotta e ruota la pagina"""
+        factor = max(1, min(gray.shape) // 800)
+        small = gray[::factor, ::factor]
+        ink = small < max(int(small.mean()) - 40, 0)
+        
+        angle = _estimate_skew(ink, self.options['max_skew'])
+        if abs(angle) < 0.1:
+            return gray
+        
+        logger.debug(f"Raddrizzamento pagina: {angle:.2f} gradi")
+        # Con l'asse y verso il basso, le righe allineate dallo shear y - x*tan(a)
+        # tornano orizzontali con una rotazione antioraria di a (convenzione PIL)
+        rotated = Image.fromarray(gray).rotate(
+            angle, resample=Image.Resampling.BILINEAR, fillcolor=255
+        )
+        return np.array(rotated, dtype=np.uint8)
+    
+    def _binarize(self, gray, radius):
+        """Soglia adattiva: inchiostro se più scuro della media locale (Bradley)"""
+        mean = _local_mean(gray, radius)
+        mean *= 1.0 - self.options['threshold']
+        return gray < mean
+    
+    def _denoise(self, ink):
+        """Rimuove (in place) i pixel inchiostro isolati"""
+        isolated = _ink_neighbours(ink) == 0
+        isolated &= ink
+        ink[isolated] = False
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Scheduler dei job dell'API
+Coda limitata che alimenta un numero fisso di slot di esecuzione:
+a coda piena i nuovi job vengono rifiutati invece di sovraccaricare l'host.
+Coda e limiti sono nell'archivio dei job, comuni a tutti i worker gunicorn.
+"""
+
+import os
+import math
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime
+
+from job_store import JobStatus, LANE_JOBS, LANE_GROUPS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOTS = 1
+DEFAULT_MAX_QUEUED = 20
+DEFAULT_MAX_BACKLOG = 1000
+
+# Durata stimata di un job prima di averne misurato qualcuno (secondi)
+DEFAULT_JOB_ESTIMATE = 60.0
+
+# Peso delle ultime durate nella media mobile esponenziale
+DURATION_SMOOTHING = 0.2
+
+# Intervallo con cui gli slot inattivi controllano la coda comune (secondi):
+# i job accodati da altri processi partono entro questo tempo
+QUEUE_POLL_INTERVAL = 1.0
+
+class QueueFull(Exception):
+    """Coda piena: il job va ripresentato dopo retry_after secondi"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Coda piena, riprovare tra {retry_after}s")
+        self.retry_after = retry_after
+
+class JobScheduler:
+    """Coda FIFO limitata con slot di esecuzione fissi, condivisa tra i processi
+
+    La coda sta nell'archivio dei job: ammissione, posizione in coda e numero
+    di job in elaborazione valgono per l'intero servizio, non per il singolo
+    worker gunicorn. Ogni processo API avvia `slots` thread che prelevano
+    dalla coda comune solo finché i job in elaborazione sono meno di `slots`.
+
+    I job dei gruppi (/batch) stanno in una seconda corsia, più ampia, da cui
+    gli slot prendono lavoro solo quando la corsia dei job singoli è vuota.
+    """
+
+    def __init__(self, store, slots=DEFAULT_SLOTS, max_queued=DEFAULT_MAX_QUEUED,
+                 max_backlog=DEFAULT_MAX_BACKLOG):
+        self.store = store
+        self.slots = max(1, slots)
+        self.max_queued = max(0, max_queued)
+        self.max_backlog = max(0, max_backlog)
+        self._running = {}
+        self._cond = threading.Condition()
+        self.avg_duration = DEFAULT_JOB_ESTIMATE
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, store):
+        """Crea lo scheduler da MAX_CONCURRENT_JOBS / MAX_QUEUED_JOBS / MAX_BACKLOG_JOBS"""
+        slots = int(os.environ.get('MAX_CONCURRENT_JOBS', '') or DEFAULT_SLOTS)
+        max_queued = int(os.environ.get('MAX_QUEUED_JOBS', '') or DEFAULT_MAX_QUEUED)
+        max_backlog = int(os.environ.get('MAX_BACKLOG_JOBS', '') or DEFAULT_MAX_BACKLOG)
+        return cls(store, slots, max_queued, max_backlog)
+
+    def start(self, owner, run_job):
+        """Avvia gli slot del processo; `run_job(job)` esegue un job prelevato dalla coda"""
+        for i in range(self.slots):
+            thread = threading.Thread(
+                target=self._run_slot, args=(owner, run_job), name=f"job-slot-{i}"
+            )
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, job_id):
+        """Accoda un job già salvato; solleva QueueFull se la coda è al limite"""
+        if not self.store.enqueue([job_id], LANE_JOBS, self.max_queued):
+            self.rejected += 1
+            queued = self.store.queue_lengths().get(LANE_JOBS, 0)
+            raise QueueFull(max(1, math.ceil(self.estimated_wait(queued + 1))))
+        self._wake()
+
+    def submit_group(self, job_ids):
+        """Accoda i job già salvati di un gruppo, tutti o nessuno
+
+        Solleva QueueFull se non c'è posto per l'intero gruppo.
+        """
+        if not self.store.enqueue(job_ids, LANE_GROUPS, self.max_backlog):
+            self.rejected += len(job_ids)
+            pending = sum(self.store.queue_lengths().values()) + len(job_ids)
+            raise QueueFull(max(1, math.ceil(self.estimated_wait(pending))))
+        self._wake()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run_slot(self, owner, run_job):
+        while True:
+            try:
+                job = self.store.claim_next(owner, self.slots)
+            except Exception as e:
+                logger.error(f"Errore nel prelievo dalla coda: {e}")
+                job = None
+
+            if job is None:
+                with self._cond:
+                    self._cond.wait(QUEUE_POLL_INTERVAL)
+                continue
+
+            with self._cond:
+                self._running[job['id']] = time.monotonic()
+            try:
+                run_job(job)
+            except Exception as e:
+                logger.error(f"Errore non gestito nel job {job['id']}: {e}")
+            finally:
+                with self._cond:
+                    duration = time.monotonic() - self._running.pop(job['id'])
+                    self.avg_duration += DURATION_SMOOTHING * (duration - self.avg_duration)
+                    # Slot libero: gli altri slot del processo riprovano subito
+                    self._cond.notify_all()
+
+    def position(self, job_id):
+        """Posizione nella coda comune (da 1), None se il job non è in coda"""
+        return self.store.queue_position(job_id)
+
+    def estimated_wait(self, position):
+        """Secondi stimati prima che il job in posizione `position` venga avviato"""
+        # Simula gli slot: ognuno si libera al termine stimato del job in corso
+        # (in qualsiasi processo), i job in coda partono nell'ordine e durano la
+        # media misurata
+        avg_duration = self.avg_duration
+        now = datetime.now()
+        running = self.store.list(status=JobStatus.PROCESSING, limit=self.slots)
+        free_at = [
+            max(0.0, avg_duration - (now - job['started_at']).total_seconds())
+            for job in running if job.get('started_at')
+        ]
+        free_at += [0.0] * (self.slots - len(free_at))
+        heapq.heapify(free_at)
+
+        start = 0.0
+        for _ in range(position):
+            start = heapq.heappop(free_at)
+            heapq.heappush(free_at, start + avg_duration)
+        return start
+
+    def stats(self):
+        """Stato di coda e slot per /health (coda e slot comuni a tutti i processi)"""
+        lengths = self.store.queue_lengths()
+        with self._cond:
+            local_running = len(self._running)
+        return {
+            'slots': self.slots,
+            'running': self.store.count_by_status().get(JobStatus.PROCESSING, 0),
+            'running_here': local_running,
+            'queued': lengths.get(LANE_JOBS, 0),
+            'max_queued': self.max_queued,
+            'backlog': lengths.get(LANE_GROUPS, 0),
+            'max_backlog': self.max_backlog,
+            'rejected': self.rejected,
+            'avg_job_seconds': round(self.avg_duration, 1)
+        }
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Archivio dei job dell'API condiviso tra i worker gunicorn
+Backend selezionabile da DATABASE_URL; default SQLite locale
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+from datetime import datetime
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class JobStatus:
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    ERROR = "error"
+
+# Stati in cui un job occupa la propria chiave di deduplicazione
+IN_FLIGHT_STATUSES = (JobStatus.QUEUED, JobStatus.PROCESSING)
+
+# Corsie della coda di esecuzione: i job singoli passano prima dei gruppi (/batch)
+LANE_JOBS = 0
+LANE_GROUPS = 1
+
+# Campi data salvati in ISO 8601 e riconvertiti in datetime alla lettura
+DATETIME_FIELDS = ('created_at', 'started_at', 'completed_at')
+
+def _encode(job):
+    return json.dumps(
+        job, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v)
+    )
+
+def _decode(data):
+    job = json.loads(data)
+    for field in DATETIME_FIELDS:
+        if isinstance(job.get(field), str):
+            job[field] = datetime.fromisoformat(job[field])
+    return job
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime) else value
+
+class SQLiteJobStore:
+    """Job in SQLite (WAL), indicizzati per id, stato, completamento e chiave di dedup
+
+    Il job completo è salvato come JSON; le colonne indicizzate ne duplicano
+    i campi usati nelle ricerche.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    dedup_key TEXT,
+                    owner TEXT,
+                    created_at REAL NOT NULL,
+                    completed_at REAL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_completed ON jobs(completed_at)")
+            # Un solo job in corso per chiave: la deduplicazione è atomica tra processi
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_inflight ON jobs(dedup_key) "
+                "WHERE status IN ('queued', 'processing')"
+            )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS owners (
+                    owner TEXT PRIMARY KEY,
+                    host TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    started_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_owners_host_pid ON owners(host, pid)")
+            # Contatori per stato aggiornati nelle stesse transazioni dei job
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS status_counts (
+                    status TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL
+                )
+            """)
+            # Gruppi di job inviati insieme (/batch): elenco dei membri come JSON
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS groups (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_groups_created ON groups(created_at)")
+            # Coda di esecuzione comune ai worker gunicorn, in ordine di arrivo per corsia
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_queue (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL UNIQUE,
+                    lane INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_lane ON job_queue(lane, seq)")
+
+    @contextmanager
+    def _connect(self):
+        # Connessione per operazione, come la cache risultati
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _count(self, conn, status, delta):
+        conn.execute(
+            "INSERT INTO status_counts(status, count) VALUES (?, ?) "
+            "ON CONFLICT(status) DO UPDATE SET count = count + excluded.count",
+            (status, delta)
+        )
+
+    def _save(self, conn, job_id, job, old_status):
+        conn.execute(
+            "UPDATE jobs SET status = ?, owner = ?, completed_at = ?, data = ? WHERE id = ?",
+            (job['status'], job.get('owner'), _timestamp(job.get('completed_at')),
+             _encode(job), job_id)
+        )
+        if job['status'] != old_status:
+            self._count(conn, old_status, -1)
+            self._count(conn, job['status'], 1)
+
+    def create(self, job):
+        """Salva un nuovo job, oppure restituisce l'id del job identico in corso
+
+        Se `job['cache_key']` è già in coda o in elaborazione il nuovo job non
+        viene salvato: il job esistente conta una richiesta duplicata in più.
+        """
+        with self._transaction() as conn:
+            try:
+                conn.execute(
+                    "INSERT INTO jobs(id, status, dedup_key, owner, created_at, completed_at, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job['id'], job['status'], job.get('cache_key'), job.get('owner'),
+                     _timestamp(job['created_at']), _timestamp(job.get('completed_at')),
+                     _encode(job))
+                )
+                self._count(conn, job['status'], 1)
+                return None
+            except sqlite3.IntegrityError:
+                row = conn.execute(
+                    "SELECT id, data FROM jobs WHERE dedup_key = ? AND status IN (?, ?)",
+                    (job.get('cache_key'),) + IN_FLIGHT_STATUSES
+                ).fetchone()
+                if row is None:
+                    raise
+                existing = _decode(row[1])
+                existing['duplicate_requests'] = existing.get('duplicate_requests', 0) + 1
+                conn.execute("UPDATE jobs SET data = ? WHERE id = ?", (_encode(existing), row[0]))
+                return row[0]
+
+    def get(self, job_id):
+        """Job per id, None se inesistente"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def update(self, job_id, **fields):
+        """Aggiorna i campi di un job; restituisce il job aggiornato (None se inesistente)"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = _decode(row[0])
+            old_status = job['status']
+            job.update(fields)
+            self._save(conn, job_id, job, old_status)
+            return job
+
+    def get_many(self, job_ids):
+        """Job per id in un'unica lettura, {id: job} (gli id inesistenti mancano)"""
+        jobs = {}
+        job_ids = list(job_ids)
+        with self._connect() as conn:
+            # A blocchi: limite dei parametri per query di SQLite
+            for i in range(0, len(job_ids), 500):
+                chunk = job_ids[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT id, data FROM jobs WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                jobs.update((job_id, _decode(data)) for job_id, data in rows)
+        return jobs
+
+    def delete(self, job_id):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                conn.execute("DELETE FROM job_queue WHERE job_id = ?", (job_id,))
+                self._count(conn, row[0], -1)
+
+    def list(self, status=None, limit=100):
+        """Job più recenti, opzionalmente filtrati per stato"""
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute(
+                    "SELECT data FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                    (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT data FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+        return [_decode(row[0]) for row in rows]
+
+    def count_by_status(self):
+        """Numero di job per stato (dai contatori, senza scansione dei job)"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, count FROM status_counts WHERE count > 0").fetchall())
+
+    def finished_before(self, before):
+        """Job completati o in errore prima di `before` (datetime)"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT data FROM jobs WHERE completed_at < ?", (before.timestamp(),)
+            ).fetchall()
+        return [_decode(row[0]) for row in rows]
+
+    def enqueue(self, job_ids, lane, limit):
+        """Mette in coda i job nella corsia `lane`, tutti o nessuno
+
+        Restituisce False, senza accodare nulla, se la corsia supererebbe `limit` job.
+        """
+        with self._transaction() as conn:
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM job_queue WHERE lane = ?", (lane,)
+            ).fetchone()[0]
+            if queued + len(job_ids) > limit:
+                return False
+            conn.executemany(
+                "INSERT INTO job_queue(job_id, lane) VALUES (?, ?)",
+                [(job_id, lane) for job_id in job_ids]
+            )
+            return True
+
+    def claim_next(self, owner, slots):
+        """Preleva il primo job in coda e lo segna in elaborazione per `owner`
+
+        None se la coda è vuota o se `slots` job sono già in elaborazione
+        (in qualsiasi processo). I job rimossi o non più in coda vengono scartati.
+        """
+        with self._connect() as conn:
+            # Lettura senza lock: gli slot inattivi di tutti i processi interrogano la coda
+            if conn.execute("SELECT 1 FROM job_queue LIMIT 1").fetchone() is None:
+                return None
+
+        with self._transaction() as conn:
+            running = conn.execute(
+                "SELECT count FROM status_counts WHERE status = ?", (JobStatus.PROCESSING,)
+            ).fetchone()
+            if running and running[0] >= slots:
+                return None
+
+            while True:
+                row = conn.execute(
+                    "SELECT seq, job_id FROM job_queue ORDER BY lane, seq LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                seq, job_id = row
+                conn.execute("DELETE FROM job_queue WHERE seq = ?", (seq,))
+
+                row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    continue
+                job = _decode(row[0])
+                if job['status'] != JobStatus.QUEUED:
+                    continue
+                job.update(status=JobStatus.PROCESSING, owner=owner, started_at=datetime.now())
+                self._save(conn, job_id, job, JobStatus.QUEUED)
+                return job
+
+    def queue_position(self, job_id):
+        """Posizione nella coda comune (da 1), None se il job non è in coda"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT lane, seq FROM job_queue WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            lane, seq = row
+            return conn.execute(
+                "SELECT COUNT(*) FROM job_queue WHERE lane < ? OR (lane = ? AND seq <= ?)",
+                (lane, lane, seq)
+            ).fetchone()[0]
+
+    def queue_lengths(self):
+        """Job in coda per corsia, {lane: numero}"""
+        with self._connect() as conn:
+            return dict(conn.execute(
+                "SELECT lane, COUNT(*) FROM job_queue GROUP BY lane"
+            ).fetchall())
+
+    def create_group(self, group):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO groups(id, created_at, data) VALUES (?, ?, ?)",
+                (group['id'], _timestamp(group['created_at']), _encode(group))
+            )
+
+    def get_group(self, group_id):
+        """Gruppo per id, None se inesistente"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM groups WHERE id = ?", (group_id,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def delete_groups_before(self, before):
+        """Elimina i gruppi creati prima di `before` (datetime); restituisce quanti"""
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM groups WHERE created_at < ?", (before.timestamp(),))
+            return cursor.rowcount
+
+    def register_owner(self, owner):
+        """Registra il processo corrente come proprietario dei job che avvia"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO owners(owner, host, pid, started_at) VALUES (?, ?, ?, ?)",
+                (owner, socket.gethostname(), os.getpid(), time.time())
+            )
+
+    def _dead_owners(self, conn):
+        """Proprietari registrati su questo host il cui processo non esiste più
+
+        Un proprietario è vivo se il suo pid esiste ed è l'ultimo registrato
+        con quel pid (un pid riusato dopo un riavvio ha un nuovo identificativo).
+        """
+        owners = conn.execute(
+            "SELECT owner, pid, started_at FROM owners WHERE host = ?", (socket.gethostname(),)
+        ).fetchall()
+
+        latest = {}
+        for owner, pid, started_at in owners:
+            if pid not in latest or started_at > latest[pid][1]:
+                latest[pid] = (owner, started_at)
+        alive = {owner for pid, (owner, _) in latest.items() if _pid_alive(pid)}
+        return [owner for owner, _, _ in owners if owner not in alive]
+
+    def adopt_orphans(self, owner):
+        """Assegna a `owner` i job in corso rimasti senza processo proprietario
+
+        I job tornano nella coda comune (con i loro checkpoint per pagina),
+        anche oltre i limiti della coda, e vengono restituiti al chiamante;
+        i proprietari morti vengono rimossi.
+        """
+        adopted = []
+        with self._transaction() as conn:
+            for dead in self._dead_owners(conn):
+                rows = conn.execute(
+                    "SELECT id, data FROM jobs WHERE owner = ? AND status IN (?, ?)",
+                    (dead,) + IN_FLIGHT_STATUSES
+                ).fetchall()
+                for job_id, data in rows:
+                    job = _decode(data)
+                    old_status = job['status']
+                    job.update(
+                        status=JobStatus.QUEUED,
+                        owner=owner,
+                        restarts=job.get('restarts', 0) + 1
+                    )
+                    job.pop('started_at', None)
+                    self._save(conn, job_id, job, old_status)
+                    conn.execute(
+                        "INSERT OR IGNORE INTO job_queue(job_id, lane) VALUES (?, ?)",
+                        (job_id, LANE_GROUPS if job.get('group_id') else LANE_JOBS)
+                    )
+                    adopted.append(job)
+                conn.execute("DELETE FROM owners WHERE owner = ?", (dead,))
+        return adopted
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# Backend disponibili per schema di DATABASE_URL
+STORE_BACKENDS = {
+    'sqlite': lambda url: SQLiteJobStore(url[len('sqlite:///'):]),
+}
+
+def open_job_store(url):
+    """Apre l'archivio indicato da un URL (es. sqlite:////tmp/pdf_processor/jobs.db)"""
+    scheme = url.split(':', 1)[0]
+    if scheme not in STORE_BACKENDS:
+        raise ValueError(f"Archivio job non supportato: {scheme}")
+    return STORE_BACKENDS[scheme](url)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Metriche Prometheus dell'API
+Contatori e istogrammi dei job (esito, latenza, pagine, byte, tempi per
+stadio) aggregati tra i worker gunicorn con la modalità multiprocess di
+prometheus_client (PROMETHEUS_MULTIPROC_DIR); coda e job attivi sono letti
+dall'archivio job, già condiviso tra i worker, al momento dello scrape.
+"""
+
+import os
+import logging
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from job_store import JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Stadi della pipeline riportati dal processore nelle statistiche del job (stage_seconds)
+STAGES = ('analyze', 'rasterize', 'preprocess', 'ocr', 'merge', 'optimize')
+
+# Esiti dei job e delle richieste: completed, error, cached, deduplicated, rejected
+OUTCOMES = ('completed', 'error', 'cached', 'deduplicated', 'rejected')
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTE_BUCKETS = tuple(1024 * 2 ** i for i in range(0, 21, 2))  # 1 KB .. 1 GB
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+def _seconds_between(start, end):
+    if start is None or end is None:
+        return None
+    return max(0.0, (end - start).total_seconds())
+
+class _JobStoreCollector:
+    """Gauge calcolati dall'archivio job a ogni scrape (valori globali, non per worker)"""
+
+    def __init__(self, count_by_status):
+        self.count_by_status = count_by_status
+
+    def collect(self):
+        try:
+            counts = self.count_by_status()
+        except Exception as e:
+            logger.warning(f"Metriche: impossibile leggere l'archivio job: {e}")
+            return
+
+        yield GaugeMetricFamily(
+            'pdf_ocr_queue_depth', 'Job in coda in attesa di uno slot',
+            value=counts.get(JobStatus.QUEUED, 0)
+        )
+        yield GaugeMetricFamily(
+            'pdf_ocr_active_jobs', 'Job in elaborazione',
+            value=counts.get(JobStatus.PROCESSING, 0)
+        )
+        jobs = GaugeMetricFamily('pdf_ocr_jobs', 'Job presenti nell\'archivio per stato', labels=['status'])
+        for status, count in sorted(counts.items()):
+            jobs.add_metric([status], count)
+        yield jobs
+
+class JobMetrics:
+    """Metriche dei job esposte su /metrics
+
+    Senza `multiproc_dir` i valori restano nel processo (sviluppo con un solo
+    worker); con la directory ogni worker scrive i propri file e lo scrape li
+    somma. La directory va impostata in PROMETHEUS_MULTIPROC_DIR prima di
+    importare prometheus_client e svuotata all'avvio del servizio.
+    """
+
+    def __init__(self, count_by_status, multiproc_dir=None):
+        self.multiproc_dir = multiproc_dir
+        self.store_collector = _JobStoreCollector(count_by_status)
+        self.registry = CollectorRegistry()
+
+        self.jobs_total = Counter(
+            'pdf_ocr_jobs_total', 'Job terminati e richieste per esito', ['outcome'],
+            registry=self.registry
+        )
+        self.job_duration = Histogram(
+            'pdf_ocr_job_duration_seconds', 'Latenza end-to-end: dalla ricezione alla fine del job',
+            buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.queue_wait = Histogram(
+            'pdf_ocr_job_queue_wait_seconds', 'Attesa in coda prima dell\'avvio del job',
+            buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.processing = Histogram(
+            'pdf_ocr_job_processing_seconds', 'Durata dell\'elaborazione del job',
+            buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.pages = Histogram(
+            'pdf_ocr_job_pages', 'Pagine per job', buckets=PAGE_BUCKETS, registry=self.registry
+        )
+        self.input_bytes = Histogram(
+            'pdf_ocr_job_input_bytes', 'Dimensione dei PDF ricevuti',
+            buckets=BYTE_BUCKETS, registry=self.registry
+        )
+        self.output_bytes = Histogram(
+            'pdf_ocr_job_output_bytes', 'Dimensione dei PDF prodotti',
+            buckets=BYTE_BUCKETS, registry=self.registry
+        )
+        self.stage_seconds = Histogram(
+            'pdf_ocr_stage_seconds', 'Tempo per job in ogni stadio della pipeline', ['stage'],
+            buckets=STAGE_BUCKETS, registry=self.registry
+        )
+
+        if not multiproc_dir:
+            self.registry.register(self.store_collector)
+
+    @classmethod
+    def from_env(cls, count_by_status):
+        """Crea le metriche da ENABLE_METRICS / PROMETHEUS_MULTIPROC_DIR; None se disabilitate"""
+        if os.environ.get('ENABLE_METRICS', 'true').lower() != 'true':
+            return None
+        multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')
+        if multiproc_dir:
+            os.makedirs(multiproc_dir, exist_ok=True)
+        return cls(count_by_status, multiproc_dir or None)
+
+    def count(self, outcome, n=1):
+        """Conta richieste che non diventano job eseguiti (deduplicated, rejected)"""
+        self.jobs_total.labels(outcome).inc(n)
+
+    def observe_job(self, job):
+        """Registra un job terminato: esito, latenze, pagine, byte e tempi per stadio"""
+        if job.get('cache_hit'):
+            outcome = 'cached'
+        elif job['status'] == JobStatus.COMPLETED:
+            outcome = 'completed'
+        else:
+            outcome = 'error'
+        self.jobs_total.labels(outcome).inc()
+
+        duration = _seconds_between(job.get('created_at'), job.get('completed_at'))
+        if duration is not None:
+            self.job_duration.observe(duration)
+        wait = _seconds_between(job.get('created_at'), job.get('started_at'))
+        if wait is not None:
+            self.queue_wait.observe(wait)
+        processing = _seconds_between(job.get('started_at'), job.get('completed_at'))
+        if processing is not None:
+            self.processing.observe(processing)
+
+        if job.get('input_size'):
+            self.input_bytes.observe(job['input_size'])
+        if outcome == 'cached' or job.get('output_size') is None:
+            # Risultati dalla cache: nessuna elaborazione da misurare
+            return
+        self.output_bytes.observe(job['output_size'])
+
+        stats = job.get('stats') or {}
+        pages = stats.get('pages_total') or job.get('input_pages')
+        if pages:
+            self.pages.observe(pages)
+        for stage, seconds in (stats.get('stage_seconds') or {}).items():
+            if stage in STAGES:
+                self.stage_seconds.labels(stage).observe(seconds)
+
+    def render(self):
+        """Testo di esposizione Prometheus con i valori di tutti i worker"""
+        if not self.multiproc_dir:
+            return generate_latest(self.registry)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=self.multiproc_dir)
+        registry.register(self.store_collector)
+        return generate_latest(registry)
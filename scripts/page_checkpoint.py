@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Checkpoint per pagina dell'OCR
+Le pagine completate (PDF di tesseract e testo) restano nella directory del
+checkpoint e sono elencate in un manifest JSONL: un job interrotto riprende
+dalla prima pagina non completata. Un lock esclusivo (flock) impedisce a
+due processi di riprendere e scrivere lo stesso checkpoint.
+"""
+
+import os
+import json
+import time
+import fcntl
+import logging
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "pages.jsonl"
+PROGRESS_NAME = "progress.json"
+LOCK_NAME = ".lock"
+CHECKPOINT_VERSION = 1
+
+# Attesa massima del lock tenuto da un altro processo (es. un job rimasto
+# orfano dopo la terminazione del worker API) e intervallo dei tentativi
+DEFAULT_LOCK_TIMEOUT = 300
+LOCK_POLL_INTERVAL = 1.0
+
+# File per pagina scritti da tesseract nella directory del checkpoint (page_001.pdf, ...)
+PAGE_FILE_PATTERN = "page_*"
+PAGE_FILE_SUFFIXES = {'.pdf', '.txt', '.tsv', '.png'}
+
+class CheckpointLocked(Exception):
+    """Il checkpoint è in uso da un altro processo"""
+
+def _fsync_file(path):
+    with open(path, 'rb') as fh:
+        os.fsync(fh.fileno())
+
+class PageCheckpoint:
+    """Manifest delle pagine completate di un documento
+
+    La prima riga del manifest contiene la firma (input + configurazione):
+    un checkpoint con firma diversa viene scartato. Ogni pagina completata
+    aggiunge una riga, scritta su disco con fsync dopo il relativo PDF.
+    """
+
+    def __init__(self, checkpoint_dir, signature):
+        self.dir = Path(checkpoint_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.dir / MANIFEST_NAME
+        self.signature = signature
+        self._fh = None
+        self._lock_fh = None
+
+    def acquire(self, timeout=DEFAULT_LOCK_TIMEOUT):
+        """Prende il lock esclusivo del checkpoint, attendendo al più `timeout` secondi
+
+        Va preso prima di `load()` e tenuto finché il documento non è
+        completato (`clear()`) o il job termina (`release()`).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            lock_path = self.dir / LOCK_NAME
+            fh = open(lock_path, 'a')
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fh.close()
+                if time.monotonic() >= deadline:
+                    raise CheckpointLocked(f"Checkpoint {self.dir} in uso da un altro processo")
+                time.sleep(LOCK_POLL_INTERVAL)
+                continue
+
+            # Chi teneva il lock può aver completato il documento ed eliminato il file:
+            # il lock vale solo se il file aperto è ancora quello nella directory
+            try:
+                current = os.stat(lock_path).st_ino == os.fstat(fh.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                self._lock_fh = fh
+                return
+            fh.close()
+
+    def release(self):
+        """Chiude il manifest e rilascia il lock"""
+        self.close()
+        if self._lock_fh is not None:
+            self._lock_fh.close()
+            self._lock_fh = None
+
+    def load(self):
+        """Pagine già completate, {indice: record}
+
+        Il manifest viene riscritto con i soli record validi: una riga
+        troncata da un'interruzione o un PDF mancante fanno ripetere la pagina.
+        """
+        records = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, encoding='utf-8') as fh:
+                lines = fh.read().splitlines()
+
+            header = None
+            try:
+                header = json.loads(lines[0]) if lines else None
+            except ValueError:
+                pass
+
+            if header and header.get('signature') == self.signature \
+                    and header.get('version') == CHECKPOINT_VERSION:
+                for line in lines[1:]:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('pdf') and not (self.dir / record['pdf']).exists():
+                        continue
+                    records[record['index']] = record
+            else:
+                logger.info("Checkpoint di un input o di una configurazione diversa: scartato")
+                self._reset()
+
+        self._rewrite(records.values())
+        return records
+
+    def _reset(self):
+        # Il lock resta: il checkpoint viene riscritto dallo stesso processo
+        _remove_checkpoint_files(self.dir, keep_lock=True)
+
+    def _rewrite(self, records):
+        """Riscrive atomicamente il manifest (intestazione + record)"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(json.dumps({'version': CHECKPOINT_VERSION, 'signature': self.signature}) + "\n")
+            for record in records:
+                fh.write(json.dumps(record) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def record(self, record):
+        """Registra una pagina completata; il PDF indicato deve stare nella directory"""
+        if record.get('pdf'):
+            _fsync_file(self.dir / record['pdf'])
+
+        if self._fh is None:
+            self._fh = open(self.manifest_path, 'a', encoding='utf-8')
+        self._fh.write(json.dumps(record) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def clear(self):
+        """Elimina il checkpoint (documento completato) e rilascia il lock"""
+        self.close()
+        clear_checkpoint(self.dir)
+        self.release()
+
+def _remove_checkpoint_files(checkpoint_dir, keep_lock=False):
+    """Elimina i soli file del checkpoint: la directory può essere indicata
+    dall'utente (--checkpoint-dir) e contenere altro"""
+    checkpoint_dir = Path(checkpoint_dir)
+    owned = [checkpoint_dir / MANIFEST_NAME, checkpoint_dir / PROGRESS_NAME]
+    if not keep_lock:
+        owned.append(checkpoint_dir / LOCK_NAME)
+    owned += checkpoint_dir.glob('*.tmp')
+    owned += (
+        path for path in checkpoint_dir.glob(PAGE_FILE_PATTERN)
+        if path.suffix in PAGE_FILE_SUFFIXES
+    )
+    for path in owned:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Impossibile eliminare {path}: {e}")
+
+def clear_checkpoint(checkpoint_dir):
+    """Elimina i file del checkpoint e la directory, se non contiene altro"""
+    _remove_checkpoint_files(checkpoint_dir)
+    try:
+        Path(checkpoint_dir).rmdir()
+    except OSError:
+        pass
+
+def write_progress(checkpoint_dir, progress):
+    """Scrive atomicamente lo stato di avanzamento del documento (letto dall'API)"""
+    checkpoint_dir = Path(checkpoint_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=checkpoint_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+        json.dump(progress, fh)
+    os.replace(tmp_path, checkpoint_dir / PROGRESS_NAME)
+
+def read_progress(checkpoint_dir):
+    """Ultimo stato di avanzamento scritto dal processore, None se assente"""
+    try:
+        with open(Path(checkpoint_dir) / PROGRESS_NAME, encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def completed_pages(checkpoint_dir):
+    """Numero di pagine registrate in un checkpoint (0 se assente)"""
+    try:
+        with open(Path(checkpoint_dir) / MANIFEST_NAME, 'rb') as fh:
+            return max(0, sum(1 for _ in fh) - 1)
+    except OSError:
+        return 0
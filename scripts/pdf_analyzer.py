@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Analisi strutturale delle pagine PDF
+Classifica le pagine ispezionando risorse e content stream, senza estrarre il testo
+"""
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Operatori di disegno del testo: Tj, TJ, ' e "
+TEXT_OPERATOR_RE = re.compile(rb'(?:\)|\]|>)\s*(?:Tj|TJ|\'|")')
+
+# Immagine disegnata con matrice esplicita: "a b c d e f cm /Nome Do"
+IMAGE_DRAW_RE = re.compile(
+    rb'(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+cm\s*/([^\s/\[\]()<>]+)\s+Do'
+)
+
+# Dimensione font impostata con Tf
+FONT_SIZE_RE = re.compile(rb'/[^\s/\[\]()<>]+\s+(-?[\d.]+)\s+Tf')
+
+# Modalità di rendering testo invisibile (tipico dei layer OCR)
+INVISIBLE_TEXT_RE = re.compile(rb'\b3\s+Tr\b')
+
+# Frazione di pagina oltre la quale un'immagine è considerata una scansione
+FULL_PAGE_IMAGE_COVERAGE = 0.5
+
+# Ricorsione massima nei Form XObject annidati
+MAX_FORM_DEPTH = 2
+
+# Testo di riferimento per la scelta della risoluzione: corpo 10pt a 300 DPI
+REFERENCE_TEXT_SIZE = 10.0
+REFERENCE_TEXT_DPI = 300
+
+def _resolve(obj):
+    """Risolve un riferimento indiretto PyPDF2"""
+    return obj.get_object() if hasattr(obj, 'get_object') else obj
+
+def _stream_data(contents):
+    """Concatena i dati decodificati di uno o più content stream"""
+    contents = _resolve(contents)
+    if contents is None:
+        return b""
+    
+    streams = contents if isinstance(contents, list) else [contents]
+    chunks = []
+    for stream in streams:
+        try:
+            chunks.append(_resolve(stream).get_data())
+        except Exception as e:
+            logger.debug(f"Content stream non decodificabile: {e}")
+    return b"\n".join(chunks)
+
+def _collect_resources(resources, info, depth=0):
+    """Raccoglie font e immagini dalle risorse (inclusi i Form XObject)"""
+    resources = _resolve(resources)
+    if not resources:
+        return b""
+    
+    fonts = _resolve(resources.get('/Font')) or {}
+    for font in fonts.values():
+        font = _resolve(font)
+        info['fonts'] += 1
+        # Font composito senza ToUnicode: il testo estratto è spesso illeggibile
+        if font.get('/Subtype') == '/Type0' and '/ToUnicode' not in font:
+            info['unmapped_fonts'] += 1
+    
+    form_data = []
+    xobjects = _resolve(resources.get('/XObject')) or {}
+    for name, xobj in xobjects.items():
+        xobj = _resolve(xobj)
+        subtype = xobj.get('/Subtype')
+        if subtype == '/Image':
+            info['images'][name.lstrip('/')] = (int(xobj.get('/Width', 0)), int(xobj.get('/Height', 0)))
+        elif subtype == '/Form' and depth < MAX_FORM_DEPTH:
+            form_data.append(_collect_resources(xobj.get('/Resources'), info, depth + 1))
+            try:
+                form_data.append(xobj.get_data())
+            except Exception:
+                pass
+    
+    return b"\n".join(form_data)
+
+def inspect_page(page):
+    """Ispeziona la struttura di una pagina
+    
+    Restituisce un dizionario con font, immagini, operatori di testo,
+    copertura delle immagini e risoluzione nativa delle scansioni.
+    """
+    info = {
+        'fonts': 0,
+        'unmapped_fonts': 0,
+        'images': {},
+        'has_text_ops': False,
+        'invisible_text': False,
+        'image_coverage': 0.0,
+        'image_dpi': None,
+        'font_sizes': [],
+        'width_pt': float(page.mediabox.width),
+        'height_pt': float(page.mediabox.height),
+    }
+    
+    form_data = _collect_resources(page.get('/Resources'), info)
+    data = _stream_data(page.get('/Contents'))
+    if form_data:
+        data = data + b"\n" + form_data
+    
+    # Basta il primo operatore di testo per decidere (uscita anticipata)
+    info['has_text_ops'] = bool(info['fonts']) and TEXT_OPERATOR_RE.search(data) is not None
+    if info['has_text_ops']:
+        info['invisible_text'] = INVISIBLE_TEXT_RE.search(data) is not None
+        info['font_sizes'] = [abs(float(m)) for m in FONT_SIZE_RE.findall(data)[:200]]
+    
+    if info['images']:
+        page_area = info['width_pt'] * info['height_pt'] or 1.0
+        for match in IMAGE_DRAW_RE.finditer(data):
+            name = match.group(7).decode('latin-1')
+            if name not in info['images']:
+                continue
+            try:
+                a, b, c, d = (float(x) for x in match.groups()[:4])
+            except ValueError:
+                continue
+            
+            coverage = abs(a * d - b * c) / page_area
+            if coverage > info['image_coverage']:
+                info['image_coverage'] = min(coverage, 1.0)
+                # Risoluzione nativa: pixel dell'immagine / pollici disegnati
+                width_px, height_px = info['images'][name]
+                drawn_w = (a * a + b * b) ** 0.5 / 72
+                drawn_h = (c * c + d * d) ** 0.5 / 72
+                if drawn_w and drawn_h and width_px and height_px:
+                    info['image_dpi'] = round(min(width_px / drawn_w, height_px / drawn_h))
+    
+    return info
+
+def classify_page(info):
+    """Classifica una pagina ispezionata
+    
+    Restituisce "has_text", "needs_ocr" oppure "ambiguous" quando serve
+    l'estrazione completa del testo per decidere.
+    """
+    if not info['has_text_ops']:
+        # Solo immagini o pagina vuota
+        return "needs_ocr"
+    
+    if info['unmapped_fonts'] and info['unmapped_fonts'] == info['fonts']:
+        # Testo presente ma probabilmente non estraibile correttamente
+        return "ambiguous"
+    
+    if info['image_coverage'] >= FULL_PAGE_IMAGE_COVERAGE or info.get('invisible_text'):
+        # Scansione con un layer di testo (spesso invisibile, da un OCR precedente):
+        # va verificata la qualità, anche se l'immagine non è stata riconosciuta
+        return "ambiguous"
+    
+    return "has_text"
+
+def choose_page_dpi(info, ceiling, floor):
+    """Risoluzione di rendering per una pagina ispezionata
+    
+    Non si renderizza oltre la risoluzione nativa della scansione incorporata
+    (sarebbe solo interpolazione) e il testo grande non richiede la piena
+    risoluzione: un corpo 10pt a 300 DPI è già abbondante per Tesseract.
+    Il risultato è arrotondato a multipli di 25 e limitato a [floor, ceiling].
+    """
+    dpi = ceiling
+    if info is None:
+        return dpi
+    
+    if info.get('image_dpi') and info['image_coverage'] >= FULL_PAGE_IMAGE_COVERAGE:
+        dpi = min(dpi, info['image_dpi'])
+    
+    # Dimensioni < 4pt di solito sono scalate dalla matrice di testo: non affidabili
+    sizes = sorted(s for s in info.get('font_sizes', []) if s >= 4)
+    if sizes:
+        median_size = sizes[len(sizes) // 2]
+        dpi = min(dpi, REFERENCE_TEXT_DPI * REFERENCE_TEXT_SIZE / median_size)
+    
+    dpi = int(round(dpi / 25.0)) * 25
+    return max(floor, min(ceiling, dpi))
@@ -6,13 +6,22 @@ Analizza il contenuto di un PDF e applica OCR se necessario
 
 import os
 import sys
+import json
+import argparse
 import subprocess
 import logging
 from pathlib import Path
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 import PyPDF2
-from pdf2image import convert_from_path
-import pytesseract
-from PIL import Image, ImageEnhance
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+from pdf_analyzer import inspect_page, classify_page, choose_page_dpi
+from result_cache import ResultCache, file_sha256, make_cache_key
+from image_preprocessing import PreprocessingPipeline, DEFAULT_OPTIONS, is_blank_page, parse_stages
+from page_checkpoint import PageCheckpoint, CheckpointLocked, clear_checkpoint, write_progress
+from tracing import Tracer, measure, run_measured, profiled, write_trace
 import tempfile
 import shutil
 
@@ -23,43 +32,401 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Caratteri alfanumerici minimi perché una pagina sia considerata con testo
+MIN_PAGE_TEXT_CHARS = 25
+
+# Risoluzione di rendering delle pagine: massimo (OCR_DPI) e minimo (OCR_MIN_DPI)
+DEFAULT_DPI = 300
+DEFAULT_MIN_DPI = 150
+
+# Frazione di pixel "inchiostro" sotto la quale una pagina è considerata bianca
+DEFAULT_BLANK_THRESHOLD = 0.001
+
+
+class PageResult:
+    """Risultato di un singolo passaggio OCR su una pagina"""
+    
+    def __init__(self, index, text="", pdf_path=None, confidence=None, error=None, blank=False,
+                 timings=None, dpi=None, trace=None):
+        self.index = index
+        self.text = text
+        self.pdf_path = pdf_path
+        self.confidence = confidence
+        self.error = error
+        self.blank = blank
+        self.timings = timings or {}
+        self.dpi = dpi
+        self.trace = trace or {}
+    
+    @property
+    def ok(self):
+        return self.pdf_path is not None and self.error is None
+    
+    def to_dict(self):
+        return {
+            'page': self.index + 1,
+            'chars': len(self.text),
+            'confidence': self.confidence,
+            'dpi': self.dpi,
+            'blank': self.blank,
+            'error': self.error
+        }
+    
+    def to_record(self):
+        """Record di checkpoint (il PDF è relativo alla directory del checkpoint)"""
+        return {
+            'index': self.index,
+            'pdf': self.pdf_path.name if self.pdf_path else None,
+            'text': self.text,
+            'confidence': self.confidence,
+            'blank': self.blank,
+            'dpi': self.dpi
+        }
+    
+    @classmethod
+    def from_record(cls, record, checkpoint_dir):
+        return cls(
+            record['index'],
+            text=record.get('text', ''),
+            pdf_path=Path(checkpoint_dir) / record['pdf'] if record.get('pdf') else None,
+            confidence=record.get('confidence'),
+            blank=record.get('blank', False),
+            dpi=record.get('dpi')
+        )
+
+def available_cpus():
+    """Numero di CPU effettivamente utilizzabili (affinity e quota cgroup del container)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    
+    # Limite CPU del container (cgroup v2, poi v1)
+    try:
+        quota, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        try:
+            quota = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us').read_text())
+            period = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us').read_text())
+            if quota > 0:
+                cpus = min(cpus, max(1, quota // period))
+        except (OSError, ValueError):
+            pass
+    
+    return max(1, cpus)
+
+def default_workers():
+    """Worker OCR di default: variabile OCR_WORKERS oppure CPU disponibili"""
+    value = os.environ.get('OCR_WORKERS', '').strip()
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    return available_cpus()
+
+def processing_settings():
+    """Configurazione di elaborazione effettiva (variabili OCR_* con default)
+    
+    Tutto ciò che cambia l'output deve stare qui: è parte della chiave di cache.
+    """
+    return {
+        'lang': os.environ.get('OCR_LANGUAGE', '') or 'ita+eng',
+        'psm': int(os.environ.get('OCR_PSM', '') or 1),
+        'oem': int(os.environ.get('OCR_OEM', '') or 3),
+        'dpi': int(os.environ.get('OCR_DPI', '') or DEFAULT_DPI),
+        'min_dpi': int(os.environ.get('OCR_MIN_DPI', '') or DEFAULT_MIN_DPI),
+        'adaptive_dpi': os.environ.get('OCR_ADAPTIVE_DPI', 'true').lower() == 'true',
+        'preprocessing': preprocessing_options(),
+        'analysis_sample': int(os.environ.get('OCR_ANALYSIS_SAMPLE', '') or 0),
+        'blank_threshold': float(os.environ.get('OCR_BLANK_THRESHOLD', '') or DEFAULT_BLANK_THRESHOLD),
+        'drop_blank_pages': os.environ.get('OCR_DROP_BLANK_PAGES', 'false').lower() == 'true'
+    }
+
+def preprocessing_options():
+    """Opzioni di preprocessing: stadi da OCR_PREPROCESS (es. "border,deskew,binarize,denoise")"""
+    options = dict(DEFAULT_OPTIONS)
+    options['stages'] = parse_stages(os.environ.get('OCR_PREPROCESS'))
+    return options
+
+def optimize_image_for_ocr(image, options=None, dpi=DEFAULT_DPI):
+    """Ottimizza l'immagine per migliorare la precisione OCR
+    
+    Restituisce (immagine, tempi per stadio); con la binarizzazione attiva
+    l'immagine è bilevel, più veloce da elaborare per Tesseract.
+    """
+    return PreprocessingPipeline(options).run(image, dpi=dpi)
+
+def parse_tsv_confidence(tsv_path):
+    """Calcola la confidenza media delle parole dall'output TSV di Tesseract"""
+    try:
+        confidences = []
+        with open(tsv_path, encoding='utf-8', errors='replace') as fh:
+            next(fh, None)  # intestazione
+            for line in fh:
+                fields = line.rstrip('\n').split('\t')
+                # Solo righe di livello parola (5) con testo
+                if len(fields) == 12 and fields[0] == '5' and fields[11].strip():
+                    conf = float(fields[10])
+                    if conf >= 0:
+                        confidences.append(conf)
+        
+        if not confidences:
+            return None
+        return round(sum(confidences) / len(confidences), 1)
+        
+    except (OSError, ValueError):
+        return None
+
+def recognize_page(page, index, temp_dir, settings, dpi=None):
+    """Riconosce una pagina producendo testo, PDF ricercabile e confidenza in un solo passaggio
+    
+    `page` può essere un'immagine PIL o il percorso dell'immagine renderizzata:
+    in questo caso il file viene eliminato dopo il caricamento, così su disco
+    restano solo i PDF per pagina. `dpi` è la risoluzione a cui la pagina è
+    stata renderizzata (default: settings['dpi']). Il risultato contiene la
+    traccia della pagina: tempi, CPU e picco di memoria di pagina e tesseract.
+    """
+    with measure() as usage:
+        result = _recognize_page(page, index, temp_dir, settings, dpi)
+    result.trace.update(usage, pid=os.getpid(), dpi=result.dpi, blank=result.blank)
+    if result.timings:
+        result.trace['preprocess_seconds'] = round(sum(result.timings.values()), 4)
+    return result
+
+def _recognize_page(page, index, temp_dir, settings, dpi=None):
+    img_path = None
+    dpi = dpi or settings['dpi']
+    try:
+        temp_dir = Path(temp_dir)
+        if not isinstance(page, Image.Image):
+            rendered_path = Path(page)
+            page = Image.open(rendered_path)
+            page.load()
+            rendered_path.unlink(missing_ok=True)
+        
+        # Pagine bianche: nessun preprocessing né OCR
+        if is_blank_page(page, settings.get('blank_threshold', 0)):
+            return PageResult(index, blank=True)
+        
+        optimized_page, timings = optimize_image_for_ocr(
+            page, settings.get('preprocessing'), dpi
+        )
+        page = None
+        img_path = temp_dir / f"page_{index:03d}.png"
+        # La risoluzione salvata determina le dimensioni della pagina nel PDF di tesseract
+        optimized_page.save(img_path, 'PNG', dpi=(dpi, dpi))
+        optimized_page = None
+        
+        # Tesseract scrive txt, pdf e tsv dalla stessa recognition
+        output_base = temp_dir / f"page_{index:03d}"
+        cmd = [
+            'tesseract',
+            str(img_path),
+            str(output_base),
+            '-l', settings['lang'],
+            '--oem', str(settings['oem']),
+            '--psm', str(settings['psm']),
+            '-c', 'preserve_interword_spaces=1',
+            'txt', 'pdf', 'tsv'
+        ]
+        
+        # Con più worker ogni tesseract usa un solo thread OpenMP,
+        # altrimenti i thread interni si sommano ai processi del pool
+        env = None
+        if settings.get('omp_threads'):
+            env = dict(os.environ, OMP_THREAD_LIMIT=str(settings['omp_threads']))
+        
+        returncode, stderr, ocr_usage = run_measured(cmd, env=env)
+        trace = {
+            'ocr_seconds': ocr_usage['wall_seconds'],
+            'ocr_cpu_seconds': ocr_usage['cpu_seconds'],
+            'ocr_peak_rss_mb': ocr_usage['peak_rss_mb']
+        }
+        if returncode != 0:
+            return PageResult(index, error=stderr, trace=trace)
+        
+        text = output_base.with_suffix('.txt').read_text(encoding='utf-8', errors='replace')
+        confidence = parse_tsv_confidence(output_base.with_suffix('.tsv'))
+        
+        return PageResult(
+            index,
+            text=text,
+            pdf_path=output_base.with_suffix('.pdf'),
+            confidence=confidence,
+            timings=timings,
+            dpi=dpi,
+            trace=trace
+        )
+        
+    except Exception as e:
+        return PageResult(index, error=str(e))
+    
+    finally:
+        # L'immagine preprocessata non serve più: resta solo il PDF della pagina
+        if img_path is not None:
+            img_path.unlink(missing_ok=True)
+
+def _page_chunks(pages, chunk_size, key=None):
+    """Raggruppa gli indici di pagina (da 0) in intervalli contigui (prima, ultima) da 1
+    
+    Con `key` un intervallo contiene solo pagine con lo stesso valore (es. DPI).
+    """
+    run_start = prev = None
+    for i in sorted(pages):
+        if run_start is not None and (
+            i != prev + 1 or i - run_start >= chunk_size or (key and key(i) != key(prev))
+        ):
+            yield run_start + 1, prev + 1
+            run_start = None
+        if run_start is None:
+            run_start = i
+        prev = i
+    
+    if run_start is not None:
+        yield run_start + 1, prev + 1
+
+def _recognize_page_task(task):
+    """Entry point per i processi del pool: task = (page, index, temp_dir, settings, dpi)"""
+    return recognize_page(*task)
+
 class PDFProcessor:
-    def __init__(self, input_path, output_path, temp_dir="/app/temp"):
+    def __init__(self, input_path, output_path, temp_dir="/app/temp", workers=None,
+                 checkpoint_dir=None, trace_path=None, profile_path=None):
         self.input_path = Path(input_path)
         self.output_path = Path(output_path)
         self.temp_dir = Path(temp_dir)
         self.temp_dir.mkdir(exist_ok=True)
         
+        # Checkpoint per pagina: le pagine completate sopravvivono a interruzioni e retry
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else None
+        self.checkpoint = None
+        
+        # Parametri Tesseract
+        settings = processing_settings()
+        self.lang = settings['lang']
+        self.oem = settings['oem']
+        self.psm = settings['psm']
+        self.dpi = settings['dpi']
+        self.min_dpi = min(settings['min_dpi'], self.dpi)
+        self.adaptive_dpi = settings['adaptive_dpi']
+        self.preprocessing = settings['preprocessing']
+        
+        # Processi del pool OCR per pagina
+        self.workers = max(1, int(workers)) if workers else default_workers()
+        
+        # Classificazione e risultati OCR per pagina (testo conservato per log e altri usi)
+        self.page_types = []
+        self.page_info = []
+        self.page_count = 0
+        
+        # Pagine campione per l'analisi rapida (0 = tutte)
+        self.analysis_sample = settings['analysis_sample']
+        
+        # Pagine bianche: soglia di rilevamento ed eventuale rimozione dall'output
+        self.blank_threshold = settings['blank_threshold']
+        self.drop_blank_pages = settings['drop_blank_pages']
+        
+        # Statistiche del job (pagine elaborate, saltate, bianche)
+        self.stats = {}
+        self.page_results = []
+        
+        # Traccia per stadio e per pagina (JSON in trace_path) e profilo cProfile opzionale
+        self.tracer = Tracer()
+        self.trace = None
+        self.trace_path = Path(trace_path) if trace_path else None
+        self.profile_path = Path(profile_path) if profile_path else None
+        
     def analyze_pdf_content(self):
-        """Analizza il contenuto del PDF per determinare se ha testo estraibile"""
+        """Analizza il contenuto del PDF per determinare se ha testo estraibile
+        
+        Restituisce "has_text", "needs_ocr" oppure "mixed" quando solo alcune
+        pagine richiedono OCR (vedi self.page_types).
+        """
+        self.page_types = self.classify_pages()
+        
+        if not self.page_types:
+            return "needs_ocr"
+        
+        ocr_pages = self.ocr_pages
+        logger.info(
+            f"Pagine con testo nativo: {len(self.page_types) - len(ocr_pages)}, "
+            f"pagine da OCR: {len(ocr_pages)}"
+        )
+        
+        if not ocr_pages:
+            return "has_text"
+        elif len(ocr_pages) == len(self.page_types):
+            return "needs_ocr"
+        else:
+            return "mixed"
+    
+    @property
+    def ocr_pages(self):
+        """Indici (da 0) delle pagine che richiedono OCR"""
+        return [i for i, t in enumerate(self.page_types) if t == "needs_ocr"]
+    
+    def classify_pages(self):
+        """Classifica ogni pagina come "has_text" o "needs_ocr"
+        
+        Usa l'analisi strutturale (font, immagini, operatori di testo) e ricorre
+        all'estrazione completa del testo solo per le pagine ambigue. Con
+        OCR_ANALYSIS_SAMPLE > 0 analizza prima un campione di pagine: se è
+        uniforme la decisione vale per tutto il documento.
+        """
         try:
-            # Prova ad estrarre testo con PyPDF2
             with open(self.input_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                total_text = ""
-                
-                for page in pdf_reader.pages:
-                    text = page.extract_text()
-                    total_text += text
+                pages = pdf_reader.pages
+                page_count = len(pages)
+                self.page_info = [None] * page_count
                 
-                # Conta caratteri significativi (no spazi/newline)
-                significant_chars = len([c for c in total_text if c.isalnum()])
+                sample = self._sample_indices(page_count)
+                if sample:
+                    sampled = {self._classify_page(pages[i], i) for i in sample}
+                    if len(sampled) == 1:
+                        decision = sampled.pop()
+                        logger.info(f"Campione di {len(sample)} pagine uniforme: {decision}")
+                        return [decision] * page_count
                 
-                logger.info(f"Caratteri significativi estratti: {significant_chars}")
-                
-                # Se ha meno di 100 caratteri significativi, considera come immagine
-                if significant_chars < 100:
-                    return "needs_ocr"
-                else:
-                    # Verifica qualità del testo estratto
-                    if self._is_text_quality_good(total_text):
-                        return "has_text"
-                    else:
-                        return "needs_ocr"
+                return [self._classify_page(page, i) for i, page in enumerate(pages)]
                         
         except Exception as e:
             logger.warning(f"Errore nell'analisi con PyPDF2: {e}")
+            return []
+    
+    def _sample_indices(self, page_count):
+        """Indici di pagina equidistanti da analizzare prima dell'intero documento"""
+        if not self.analysis_sample or page_count <= self.analysis_sample:
+            return []
+        step = page_count / self.analysis_sample
+        return sorted({int(i * step) for i in range(self.analysis_sample)} | {page_count - 1})
+    
+    def _classify_page(self, page, index):
+        """Classifica una singola pagina, con estrazione del testo solo se ambigua"""
+        try:
+            info = inspect_page(page)
+            self.page_info[index] = info
+            page_type = classify_page(info)
+        except Exception as e:
+            logger.warning(f"Analisi strutturale fallita per pagina {index+1}: {e}")
+            page_type = "ambiguous"
+        
+        if page_type != "ambiguous":
+            return page_type
+        
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            logger.warning(f"Errore estrazione testo pagina {index+1}: {e}")
+            text = ""
+        
+        # Conta caratteri significativi (no spazi/newline)
+        significant_chars = sum(1 for c in text if c.isalnum())
+        
+        # Pagine quasi vuote o con testo corrotto vanno riconosciute
+        if significant_chars < MIN_PAGE_TEXT_CHARS or not self._is_text_quality_good(text):
             return "needs_ocr"
+        return "has_text"
     
     def _is_text_quality_good(self, text):
         """Verifica se il testo estratto è di buona qualità"""
@@ -75,120 +442,269 @@ class PDFProcessor:
     
     def optimize_image_for_ocr(self, image):
         """Ottimizza l'immagine per migliorare la precisione OCR"""
-        # Converti in scala di grigi
-        if image.mode != 'L':
-            image = image.convert('L')
-        
-        # Migliora il contrasto
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(1.5)
-        
-        # Migliora la nitidezza
-        enhancer = ImageEnhance.Sharpness(image)
-        image = enhancer.enhance(1.2)
-        
-        # Ridimensiona se troppo piccola (migliora OCR)
-        width, height = image.size
-        if width < 1000 or height < 1000:
-            scale_factor = max(1000/width, 1000/height)
-            new_size = (int(width * scale_factor), int(height * scale_factor))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        return image
+        optimized, _ = optimize_image_for_ocr(image, self.preprocessing, self.dpi)
+        return optimized
+    
+    def effective_settings(self):
+        """Configurazione effettiva di questa istanza (chiave della cache risultati)"""
+        return {
+            'lang': self.lang,
+            'psm': self.psm,
+            'oem': self.oem,
+            'dpi': self.dpi,
+            'min_dpi': self.min_dpi,
+            'adaptive_dpi': self.adaptive_dpi,
+            'preprocessing': self.preprocessing,
+            'analysis_sample': self.analysis_sample,
+            'blank_threshold': self.blank_threshold,
+            'drop_blank_pages': self.drop_blank_pages
+        }
     
-    def perform_ocr(self):
-        """Esegue OCR sul PDF"""
-        logger.info("Inizio processo OCR...")
+    def ocr_settings(self):
+        """Parametri passati ai worker OCR"""
+        return {
+            'lang': self.lang,
+            'oem': self.oem,
+            'psm': self.psm,
+            'dpi': self.dpi,
+            'preprocessing': self.preprocessing,
+            'blank_threshold': self.blank_threshold,
+            'omp_threads': 1 if self.workers > 1 else None
+        }
+    
+    def report_progress(self, stage, **fields):
+        """Pubblica l'avanzamento nel checkpoint (se presente) per chi segue il job"""
+        if not self.checkpoint_dir:
+            return
+        try:
+            self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+            write_progress(self.checkpoint_dir, dict(fields, stage=stage, pages_total=self.page_count))
+        except OSError as e:
+            logger.debug(f"Impossibile scrivere l'avanzamento: {e}")
+    
+    def perform_ocr(self, pages=None):
+        """Esegue OCR sul PDF
         
-        # Converti PDF in immagini
+        `pages` limita l'OCR agli indici indicati (da 0): le altre pagine
+        vengono copiate senza modifiche dal PDF originale.
+        """
         try:
-            pages = convert_from_path(
-                self.input_path,
-                dpi=300,
-                output_folder=self.temp_dir,
-                fmt='png'
-            )
-            logger.info(f"Convertite {len(pages)} pagine in immagini")
+            self.page_count = pdfinfo_from_path(self.input_path)['Pages']
         except Exception as e:
-            logger.error(f"Errore nella conversione PDF->immagini: {e}")
+            logger.error(f"Errore nella lettura delle informazioni PDF: {e}")
             return False
         
-        # Processa ogni pagina con OCR
-        ocr_results = []
-        for i, page in enumerate(pages):
+        page_count = self.page_count
+        if pages is None:
+            pages = range(page_count)
+        
+        # Ripresa: le pagine già registrate nel checkpoint non vengono rielaborate
+        checkpoint = None
+        page_dir = self.temp_dir
+        self.page_results = []
+        if self.checkpoint_dir:
+            signature = make_cache_key(file_sha256(self.input_path), self.effective_settings())
+            checkpoint = self.checkpoint = PageCheckpoint(self.checkpoint_dir, signature)
+            # Lock tenuto fino al termine del job: nessun altro processo scrive le stesse pagine
             try:
-                logger.info(f"Processing pagina {i+1}/{len(pages)}")
-                
-                # Ottimizza immagine
-                optimized_page = self.optimize_image_for_ocr(page)
-                
-                # Configura Tesseract per italiano e inglese
-                custom_config = r'--oem 3 --psm 1 -c preserve_interword_spaces=1'
-                
-                # Esegui OCR
-                text = pytesseract.image_to_string(
-                    optimized_page,
-                    lang='ita+eng',
-                    config=custom_config
-                )
-                
-                ocr_results.append(text)
-                logger.info(f"OCR completato per pagina {i+1}, caratteri: {len(text)}")
-                
-            except Exception as e:
-                logger.error(f"Errore OCR pagina {i+1}: {e}")
-                ocr_results.append("")
+                checkpoint.acquire()
+            except CheckpointLocked as e:
+                logger.error(str(e))
+                return False
+            done = checkpoint.load()
+            self.page_results = [
+                PageResult.from_record(done[i], self.checkpoint_dir) for i in pages if i in done
+            ]
+            pages = [i for i in pages if i not in done]
+            page_dir = self.checkpoint_dir
+            self.stats['pages_resumed'] = len(self.page_results)
+            if self.page_results:
+                logger.info(f"Ripresa da checkpoint: {len(self.page_results)} pagine già completate")
+        
+        logger.info(f"Inizio processo OCR su {len(pages)}/{page_count} pagine con {self.workers} worker...")
+        pages_ocr = len(pages) + len(self.page_results)
+        self.report_progress('ocr', pages_ocr=pages_ocr, pages_done=len(self.page_results))
+        
+        # Le pagine vengono renderizzate a blocchi e riconosciute man mano:
+        # in memoria restano solo le pagine in lavorazione, non l'intero documento
+        settings = self.ocr_settings()
+        tasks = (
+            (page_path, i, page_dir, settings, dpi)
+            for i, page_path, dpi in self.iter_rendered_pages(pages)
+        )
         
-        # Crea PDF ricercabile usando tesseract direttamente
-        return self._create_searchable_pdf(pages, ocr_results)
-    
-    def _create_searchable_pdf(self, pages, ocr_results):
-        """Crea PDF ricercabile usando tesseract"""
         try:
-            # Salva temporaneamente le immagini ottimizzate
-            temp_images = []
-            for i, page in enumerate(pages):
-                optimized_page = self.optimize_image_for_ocr(page)
-                temp_path = self.temp_dir / f"page_{i:03d}.png"
-                optimized_page.save(temp_path, 'PNG', dpi=(300, 300))
-                temp_images.append(temp_path)
-            
-            # Usa tesseract per creare PDF ricercabile
-            pdf_files = []
-            for i, img_path in enumerate(temp_images):
-                output_pdf = self.temp_dir / f"page_{i:03d}.pdf"
+            for result in self._map_pages(tasks):
+                self.page_results.append(result)
+                self.tracer.add_page(result.index, result.trace)
+                i = result.index
                 
-                cmd = [
-                    'tesseract',
-                    str(img_path),
-                    str(output_pdf.with_suffix('')),
-                    '-l', 'ita+eng',
-                    '--oem', '3',
-                    '--psm', '1',
-                    'pdf'
-                ]
+                if checkpoint and (result.ok or result.blank):
+                    checkpoint.record(result.to_record())
+                self.report_progress('ocr', pages_ocr=pages_ocr, pages_done=len(self.page_results))
                 
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    pdf_files.append(output_pdf)
-                    logger.info(f"PDF creato per pagina {i+1}")
+                if result.blank:
+                    logger.info(f"Pagina {i+1}/{page_count} bianca, OCR saltato")
+                elif result.ok:
+                    logger.info(
+                        f"OCR completato per pagina {i+1}/{page_count}, caratteri: {len(result.text)}, "
+                        f"confidenza: {result.confidence}"
+                    )
                 else:
-                    logger.error(f"Errore tesseract pagina {i+1}: {result.stderr}")
-            
-            # Unisci tutti i PDF
-            if pdf_files:
-                return self._merge_pdfs(pdf_files)
-            else:
-                return False
+                    logger.error(f"Errore OCR pagina {i+1}: {result.error}")
                 
+                if result.timings:
+                    logger.debug(
+                        f"Preprocessing pagina {i+1}: " +
+                        ", ".join(f"{k} {v*1000:.0f}ms" for k, v in result.timings.items())
+                    )
         except Exception as e:
-            logger.error(f"Errore nella creazione PDF ricercabile: {e}")
+            logger.error(f"Errore nella pipeline OCR: {e}")
+            return False
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        
+        self.report_progress('merge', pages_ocr=pages_ocr, pages_done=len(self.page_results))
+        return self._create_searchable_pdf(self.page_results)
+    
+    def page_dpi(self, index):
+        """Risoluzione di rendering della pagina (da 0), adattata al contenuto"""
+        if not self.adaptive_dpi:
+            return self.dpi
+        info = self.page_info[index] if index < len(self.page_info) else None
+        return choose_page_dpi(info, self.dpi, self.min_dpi)
+    
+    def iter_rendered_pages(self, pages, chunk_size=None):
+        """Renderizza le pagine indicate a blocchi, restituendo (indice, percorso immagine, dpi)"""
+        chunk_size = chunk_size or self.workers
+        
+        for first, last in _page_chunks(pages, chunk_size, key=self.page_dpi):
+            dpi = self.page_dpi(first - 1)
+            try:
+                with self.tracer.stage('rasterize'):
+                    paths = convert_from_path(
+                        self.input_path,
+                        dpi=dpi,
+                        first_page=first,
+                        last_page=last,
+                        output_folder=self.temp_dir,
+                        fmt='png',
+                        paths_only=True
+                    )
+            except Exception as e:
+                logger.error(f"Errore nella conversione PDF->immagini (pagine {first}-{last}): {e}")
+                raise
+            
+            for offset, path in enumerate(paths):
+                yield first - 1 + offset, path, dpi
+    
+    def _map_pages(self, tasks):
+        """Esegue recognize_page sui task restituendo i risultati nell'ordine delle pagine
+        
+        I task vengono consumati in modo lazy: al massimo due pagine per worker
+        sono in coda o in lavorazione, così la memoria dipende dai worker e non
+        dal numero di pagine.
+        """
+        if self.workers <= 1:
+            for task in tasks:
+                yield _recognize_page_task(task)
+            return
+        
+        max_pending = self.workers * 2
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for task in tasks:
+                pending.append(executor.submit(_recognize_page_task, task))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            
+            while pending:
+                yield pending.popleft().result()
+    
+    def recognize_page(self, page, index):
+        """Riconosce una pagina producendo testo, PDF ricercabile e confidenza in un solo passaggio"""
+        return recognize_page(page, index, self.temp_dir, self.ocr_settings())
+    
+    def _create_searchable_pdf(self, page_results):
+        """Crea PDF ricercabile unendo le pagine prodotte da tesseract
+        
+        Le pagine non riconosciute (testo nativo, bianche o OCR fallito) sono
+        copiate dal PDF originale, mantenendo l'ordine delle pagine. Con
+        drop_blank_pages le pagine bianche vengono rimosse.
+        """
+        ocr_pdfs = {r.index: r.pdf_path for r in page_results if r.ok}
+        blank_pages = {r.index for r in page_results if r.blank}
+        self._update_page_stats(page_results)
+        
+        if not ocr_pdfs and not blank_pages:
             return False
+        
+        skip = blank_pages if self.drop_blank_pages else set()
+        if len(skip) == self.page_count:
+            logger.warning("Tutte le pagine sono bianche: nessuna pagina rimossa")
+            skip = set()
+        
+        entries = []
+        for i in range(self.page_count):
+            if i in skip:
+                continue
+            if i in ocr_pdfs:
+                entries.append((ocr_pdfs[i], None))
+            elif entries and entries[-1][0] == self.input_path and entries[-1][1][1] == i:
+                # Estende l'intervallo di pagine originali consecutive
+                entries[-1] = (self.input_path, (entries[-1][1][0], i + 1))
+            else:
+                entries.append((self.input_path, (i + 1, i + 1)))
+        
+        with self.tracer.stage('merge'):
+            return self._merge_pdfs(entries)
+    
+    def _update_page_stats(self, page_results):
+        """Aggiorna le statistiche per pagina del job"""
+        blank = sorted(r.index + 1 for r in page_results if r.blank)
+        self.stats.update({
+            'pages_total': self.page_count,
+            'pages_ocr': sum(1 for r in page_results if r.ok),
+            'pages_native': self.page_count - len(page_results),
+            'pages_blank': len(blank),
+            'pages_failed': sum(1 for r in page_results if not r.ok and not r.blank),
+            'blank_pages': blank,
+            'blank_pages_dropped': self.drop_blank_pages and len(blank) < self.page_count
+        })
+        
+        # Tempo totale per stadio di preprocessing (somma sulle pagine)
+        preprocess_seconds = {}
+        for r in page_results:
+            for stage, seconds in r.timings.items():
+                preprocess_seconds[stage] = preprocess_seconds.get(stage, 0.0) + seconds
+        self.stats['preprocess_seconds'] = {k: round(v, 3) for k, v in preprocess_seconds.items()}
+        
+        # Pagine per risoluzione di rendering
+        page_dpi = {}
+        for r in page_results:
+            if r.dpi:
+                page_dpi[str(r.dpi)] = page_dpi.get(str(r.dpi), 0) + 1
+        self.stats['page_dpi'] = page_dpi
     
     def _merge_pdfs(self, pdf_files):
-        """Unisce più PDF in uno solo"""
+        """Unisce più PDF in uno solo
+        
+        Ogni elemento è un percorso oppure una coppia (percorso, (prima, ultima))
+        per includere solo un intervallo di pagine.
+        """
         try:
-            cmd = ['qpdf', '--empty', '--pages'] + [str(f) for f in pdf_files] + ['--', str(self.output_path)]
+            page_args = []
+            for entry in pdf_files:
+                if isinstance(entry, tuple):
+                    path, page_range = entry
+                    page_args.append(str(path))
+                    if page_range:
+                        page_args.append(f"{page_range[0]}-{page_range[1]}")
+                else:
+                    page_args.append(str(entry))
+            
+            cmd = ['qpdf', '--empty', '--pages'] + page_args + ['--', str(self.output_path)]
             result = subprocess.run(cmd, capture_output=True, text=True)
             
             if result.returncode == 0:
@@ -228,18 +744,55 @@ class PDFProcessor:
             return False
     
     def process(self):
-        """Processo principale"""
+        """Processo principale, misurato nella traccia del job
+        
+        Con trace_path la traccia (stadi, pagine, totali) viene salvata in JSON
+        anche se l'elaborazione fallisce; con profile_path il job è profilato
+        con cProfile.
+        """
+        profiler = profiled(self.profile_path) if self.profile_path else nullcontext()
+        with measure() as usage:
+            with profiler as profile:
+                success = self._process()
+        
+        self.trace = self.tracer.to_dict(
+            input_file=self.input_path.name,
+            success=success,
+            content_type=self.stats.get('content_type'),
+            pages_total=self.page_count or len(self.page_types),
+            workers=self.workers,
+            total=usage,
+            profile=profile
+        )
+        write_trace(self.trace_path, self.trace)
+        
+        logger.info(
+            f"Tempo totale {usage['wall_seconds']:.2f}s (CPU {usage['cpu_seconds']:.2f}s, "
+            f"processi esterni {usage['child_cpu_seconds']:.2f}s, picco RSS {usage['peak_rss_mb']} MB)"
+        )
+        if self.tracer.stages:
+            logger.info("Tempi per stadio: " + ", ".join(
+                f"{stage} {seconds:.2f}s" for stage, seconds in self.tracer.stage_seconds().items()
+            ))
+        return success
+    
+    def _process(self):
         try:
             logger.info(f"Inizio elaborazione: {self.input_path}")
             
             # Analizza contenuto
-            content_type = self.analyze_pdf_content()
+            self.report_progress('analysis')
+            with self.tracer.stage('analyze'):
+                content_type = self.analyze_pdf_content()
             logger.info(f"Tipo di contenuto rilevato: {content_type}")
             
             if content_type == "needs_ocr":
                 success = self.perform_ocr()
+            elif content_type == "mixed":
+                success = self.perform_ocr(self.ocr_pages)
             else:
-                success = self.optimize_existing_pdf()
+                with self.tracer.stage('optimize'):
+                    success = self.optimize_existing_pdf()
             
             if success:
                 # Statistiche finali
@@ -247,10 +800,36 @@ class PDFProcessor:
                 output_size = self.output_path.stat().st_size
                 
                 logger.info(f"Elaborazione completata!")
+                if self.stats.get('pages_failed'):
+                    logger.warning(
+                        f"Output parziale: {self.stats['pages_failed']} pagine senza OCR "
+                        f"(copiate dall'originale)"
+                    )
+                
+                # Output completo: le pagine del checkpoint non servono più
+                if self.checkpoint:
+                    self.checkpoint.clear()
+                elif self.checkpoint_dir:
+                    clear_checkpoint(self.checkpoint_dir)
                 logger.info(f"Dimensione originale: {input_size / 1024:.1f} KB")
                 logger.info(f"Dimensione finale: {output_size / 1024:.1f} KB")
                 logger.info(f"Rapporto compressione: {output_size/input_size:.2f}")
                 
+                self.stats.setdefault('pages_total', len(self.page_types))
+                self.stats.update({
+                    'content_type': content_type,
+                    'input_size': input_size,
+                    'output_size': output_size,
+                    # Con più worker rendering e OCR si sovrappongono: la somma
+                    # degli stadi può superare la durata del job
+                    'stage_seconds': self.tracer.stage_seconds()
+                })
+                if self.stats.get('pages_blank'):
+                    logger.info(
+                        f"Pagine bianche saltate: {self.stats['pages_blank']} "
+                        f"({', '.join(map(str, self.stats['blank_pages']))})"
+                    )
+                
                 return True
             else:
                 logger.error("Elaborazione fallita")
@@ -261,6 +840,9 @@ class PDFProcessor:
             return False
         
         finally:
+            if self.checkpoint:
+                self.checkpoint.release()
+            
             # Pulizia file temporanei
             try:
                 shutil.rmtree(self.temp_dir)
@@ -268,20 +850,78 @@ class PDFProcessor:
             except:
                 pass
 
+def write_stats(path, stats):
+    """Salva le statistiche del job in JSON (se richiesto)"""
+    if not path:
+        return
+    try:
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(stats, fh, indent=2)
+    except OSError as e:
+        logger.warning(f"Impossibile scrivere le statistiche: {e}")
+
 def main():
-    if len(sys.argv) != 3:
-        print("Uso: python3 pdf_processor.py <input.pdf> <output.pdf>")
+    parser = argparse.ArgumentParser(
+        description="Analizza un PDF e applica OCR se necessario"
+    )
+    parser.add_argument('input_file', help="PDF di input")
+    parser.add_argument('output_file', help="PDF di output")
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help="Processi OCR paralleli (default: OCR_WORKERS o CPU disponibili)"
+    )
+    parser.add_argument(
+        '--stats-json', default=None,
+        help="Scrive le statistiche del job (pagine OCR, bianche, dimensioni) in formato JSON"
+    )
+    parser.add_argument(
+        '--trace-json', default=None,
+        help="Scrive la traccia del job (tempi, CPU e memoria per stadio e per pagina) in JSON"
+    )
+    parser.add_argument(
+        '--profile', default=None, metavar='PATH',
+        help="Profila il job con cProfile e salva il profilo in PATH (formato pstats)"
+    )
+    parser.add_argument(
+        '--checkpoint-dir', default=None,
+        help="Directory dei checkpoint per pagina: un'esecuzione interrotta riprende da qui"
+    )
+    parser.add_argument(
+        '--cache-dir', default=None,
+        help="Directory della cache risultati (default: OCR_CACHE_DIR, vuoto = disabilitata)"
+    )
+    args = parser.parse_args()
+    
+    if not os.path.exists(args.input_file):
+        print(f"File di input non trovato: {args.input_file}")
         sys.exit(1)
     
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    processor = PDFProcessor(
+        args.input_file, args.output_file,
+        workers=args.workers, checkpoint_dir=args.checkpoint_dir,
+        trace_path=args.trace_json, profile_path=args.profile
+    )
     
-    if not os.path.exists(input_file):
-        print(f"File di input non trovato: {input_file}")
-        sys.exit(1)
+    # Cache risultati: stesso input e stessa configurazione -> stesso output
+    cache = ResultCache.from_env(args.cache_dir)
+    cache_key = None
+    if cache:
+        cache_key = make_cache_key(file_sha256(args.input_file), processor.effective_settings())
+        if cache.get(cache_key, args.output_file):
+            processor.stats['cache_hit'] = True
+            write_stats(args.stats_json, processor.stats)
+            sys.exit(0)
     
-    processor = PDFProcessor(input_file, output_file)
     success = processor.process()
+    write_stats(args.stats_json, processor.stats)
+    
+    # Un output parziale (pagine con OCR fallito) non va in cache: il prossimo
+    # invio dello stesso file deve riprovare
+    if success and cache and not processor.stats.get('pages_failed'):
+        try:
+            cache.put(cache_key, args.output_file)
+        except Exception as e:
+            logger.warning(f"Impossibile salvare il risultato in cache: {e}")
     
     sys.exit(0 if success else 1)
 
@@ -24,6 +24,11 @@ OPZIONI:
   -h, --help     Mostra questo aiuto
   -v, --verbose  Output dettagliato
   -d, --debug    Modalità debug (mantiene file temporanei)
+  -w, --workers  Processi OCR paralleli (default: \$OCR_WORKERS o CPU disponibili)
+  -s, --stats    Salva le statistiche del job in <output>.stats.json
+  -t, --trace    Salva la traccia (tempi, CPU, memoria per stadio e pagina) in <output>.trace.json
+  -p, --profile  Profila il job con cProfile in <output>.prof
+  -c, --checkpoint DIR  Checkpoint per pagina in DIR: un'esecuzione interrotta riprende da lì
 
 MOUNT POINTS:
   /app/input     Directory con i file PDF di input
@@ -34,6 +39,11 @@ EOF
 # Parsing argomenti
 VERBOSE=false
 DEBUG=false
+WORKERS="${OCR_WORKERS:-}"
+STATS=false
+TRACE=false
+PROFILE=false
+CHECKPOINT_DIR=""
 INPUT_FILE=""
 OUTPUT_FILE=""
 
@@ -51,6 +61,26 @@ while [[ $# -gt 0 ]]; do
             DEBUG=true
             shift
             ;;
+        -w|--workers)
+            WORKERS="$2"
+            shift 2
+            ;;
+        -s|--stats)
+            STATS=true
+            shift
+            ;;
+        -t|--trace)
+            TRACE=true
+            shift
+            ;;
+        -p|--profile)
+            PROFILE=true
+            shift
+            ;;
+        -c|--checkpoint)
+            CHECKPOINT_DIR="$2"
+            shift 2
+            ;;
         -*)
             echo "Opzione sconosciuta: $1"
             exit 1
@@ -118,20 +148,40 @@ if [ "$VERBOSE" = true ]; then
     echo
 fi
 
+# Opzioni per il processore Python
+PROCESSOR_ARGS=()
+if [ -n "$WORKERS" ]; then
+    PROCESSOR_ARGS+=(--workers "$WORKERS")
+    echo "Worker OCR: $WORKERS"
+fi
+if [ "$STATS" = true ]; then
+    PROCESSOR_ARGS+=(--stats-json "${OUTPUT_PATH%.pdf}.stats.json")
+fi
+if [ "$TRACE" = true ]; then
+    PROCESSOR_ARGS+=(--trace-json "${OUTPUT_PATH%.pdf}.trace.json")
+fi
+if [ "$PROFILE" = true ]; then
+    PROCESSOR_ARGS+=(--profile "${OUTPUT_PATH%.pdf}.prof")
+fi
+if [ -n "$CHECKPOINT_DIR" ]; then
+    PROCESSOR_ARGS+=(--checkpoint-dir "$CHECKPOINT_DIR")
+fi
+
 # Esegui il processore Python
 echo "Avvio elaborazione..."
-start_time=$(date +%s)
+start_time=$(date +%s%N)
 
 if [ "$DEBUG" = true ]; then
     export PYTHONPATH=/app
-    python3 /app/pdf_processor.py "$INPUT_PATH" "$OUTPUT_PATH"
+    python3 /app/pdf_processor.py "${PROCESSOR_ARGS[@]}" "$INPUT_PATH" "$OUTPUT_PATH"
 else
-    python3 /app/pdf_processor.py "$INPUT_PATH" "$OUTPUT_PATH" 2>/dev/null
+    python3 /app/pdf_processor.py "${PROCESSOR_ARGS[@]}" "$INPUT_PATH" "$OUTPUT_PATH" 2>/dev/null
 fi
 
 # Calcola tempo di elaborazione
-end_time=$(date +%s)
-duration=$((end_time - start_time))
+end_time=$(date +%s%N)
+duration_ms=$(( (end_time - start_time) / 1000000 ))
+duration=$(printf '%d.%03d' $((duration_ms / 1000)) $((duration_ms % 1000)))
 
 # Risultati finali
 if [ -f "$OUTPUT_PATH" ]; then
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Cache dei risultati indirizzata per contenuto
+La chiave è l'hash del PDF di input più la configurazione di elaborazione effettiva
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import sqlite3
+import logging
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Da incrementare quando cambia l'output a parità di configurazione
+CACHE_VERSION = 1
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path):
+    """Hash SHA-256 di un file letto a blocchi"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_cache_key(input_hash, settings):
+    """Chiave di cache: hash dell'input + configurazione serializzata in modo stabile"""
+    payload = json.dumps(
+        {'input': input_hash, 'settings': settings, 'version': CACHE_VERSION},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """Cache su disco con indice SQLite, eviction LRU limitata in dimensione"""
+    
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.cache_dir / "index.db"
+        self.max_bytes = max_bytes
+        
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+    
+    @classmethod
+    def from_env(cls, cache_dir=None):
+        """Crea la cache da OCR_CACHE_DIR / OCR_CACHE_MAX_MB; None se disabilitata"""
+        cache_dir = cache_dir or os.environ.get('OCR_CACHE_DIR', '')
+        if not cache_dir:
+            return None
+        max_mb = int(os.environ.get('OCR_CACHE_MAX_MB', '2048') or 2048)
+        return cls(cache_dir, max_bytes=max_mb * 1024 * 1024)
+    
+    @contextmanager
+    def _connect(self):
+        # Connessione per operazione: condivisibile tra thread, processi e worker gunicorn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+    
+    def _object_path(self, key):
+        return self.objects_dir / key[:2] / f"{key}.pdf"
+    
+    def _count(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters(name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,)
+        )
+    
+    def get(self, key, dest_path):
+        """Copia il risultato in cache su dest_path; False se assente"""
+        obj_path = self._object_path(key)
+        
+        with self._connect() as conn:
+            row = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or not obj_path.exists():
+                self._count(conn, 'misses')
+                return False
+            
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count(conn, 'hits')
+        
+        dest_path = Path(dest_path)
+        dest_path.unlink(missing_ok=True)
+        try:
+            # Hard link quando possibile: nessuna copia dei dati
+            os.link(obj_path, dest_path)
+        except OSError:
+            shutil.copyfile(obj_path, dest_path)
+        
+        logger.info(f"Risultato trovato in cache: {key[:12]}")
+        return True
+    
+    def put(self, key, src_path):
+        """Salva un risultato in cache e applica l'eviction LRU"""
+        obj_path = self._object_path(key)
+        obj_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Scrittura atomica: copia temporanea poi rename
+        fd, tmp_path = tempfile.mkstemp(dir=obj_path.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, obj_path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        
+        size = obj_path.stat().st_size
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries(key, size, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, size, now, now)
+            )
+        
+        self._evict()
+    
+    def _evict(self):
+        """Rimuove le voci meno usate di recente finché la cache rientra nel limite"""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            
+            for key, size in conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access ASC"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._object_path(key).unlink(missing_ok=True)
+                self._count(conn, 'evictions')
+                total -= size
+    
+    def stats(self):
+        """Contatori hit/miss e occupazione della cache"""
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None,
+            'entries': entries,
+            'size_bytes': total,
+            'max_bytes': self.max_bytes
+        }
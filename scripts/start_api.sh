@@ -7,41 +7,59 @@ set -e
 echo "=== PDF OCR Processor API ==="
 echo "Avvio in corso..."
 
-# Verifica che Docker sia accessibile
-if ! docker info >/dev/null 2>&1; then
-    echo "⚠️  Attenzione: Docker non accessibile"
-    echo "   Assicurarsi che il socket Docker sia montato:"
-    echo "   -v /var/run/docker.sock:/var/run/docker.sock"
-fi
+export PROCESSING_BACKEND=${PROCESSING_BACKEND:-local}
+
+if [ "$PROCESSING_BACKEND" = "docker" ]; then
+    # Verifica che Docker sia accessibile
+    if ! docker info >/dev/null 2>&1; then
+        echo "⚠️  Attenzione: Docker non accessibile"
+        echo "   Assicurarsi che il socket Docker sia montato:"
+        echo "   -v /var/run/docker.sock:/var/run/docker.sock"
+    fi
 
-# Verifica che l'immagine del processore sia disponibile
-if ! docker image inspect pdf-ocr-processor >/dev/null 2>&1; then
-    echo "⚠️  Attenzione: Immagine 'pdf-ocr-processor' non trovata"
-    echo "   Costruire l'immagine con: docker build -t pdf-ocr-processor ."
+    # Verifica che l'immagine del processore sia disponibile
+    if ! docker image inspect pdf-ocr-processor >/dev/null 2>&1; then
+        echo "⚠️  Attenzione: Immagine 'pdf-ocr-processor' non trovata"
+        echo "   Costruire l'immagine con: docker build -t pdf-ocr-processor ."
+    fi
+elif ! command -v tesseract >/dev/null 2>&1; then
+    echo "⚠️  Attenzione: tesseract non trovato, necessario per il backend locale"
 fi
 
 # Configurazione Gunicorn
 export WORKERS=${WORKERS:-2}
+# Thread per worker: le richieste long-poll e gli stream /events restano aperte a lungo
+export THREADS=${THREADS:-8}
 export WORKER_TIMEOUT=${WORKER_TIMEOUT:-600}
 export MAX_REQUESTS=${MAX_REQUESTS:-100}
 export BIND_ADDRESS=${BIND_ADDRESS:-0.0.0.0:5000}
 
+# Metriche Prometheus condivise tra i worker: i file dei valori vanno
+# azzerati a ogni avvio, altrimenti i contatori sommano le esecuzioni precedenti
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/pdf_processor/metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 echo "Configurazione:"
 echo "  Workers: $WORKERS"
+echo "  Threads per worker: $THREADS"
 echo "  Timeout: ${WORKER_TIMEOUT}s"
 echo "  Max requests per worker: $MAX_REQUESTS"
 echo "  Bind: $BIND_ADDRESS"
+echo "  Backend: $PROCESSING_BACKEND"
+echo "  Metriche: ${ENABLE_METRICS:-true} (/metrics)"
 echo
 
 # Avvia con Gunicorn per produzione
+# (senza --preload: ogni worker importa l'app e pre-avvia il proprio pool di processi OCR)
 exec gunicorn \
     --bind "$BIND_ADDRESS" \
     --workers "$WORKERS" \
-    --worker-class sync \
+    --worker-class gthread \
+    --threads "$THREADS" \
     --timeout "$WORKER_TIMEOUT" \
     --max-requests "$MAX_REQUESTS" \
     --max-requests-jitter 10 \
-    --preload \
     --access-logfile - \
     --error-logfile - \
     --log-level info \
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Tracciamento per stadio e per pagina del processore
+Tempo reale, tempo CPU (del processo e dei processi esterni come pdftoppm,
+tesseract e qpdf) e picco di memoria RSS di ogni stadio e di ogni pagina,
+salvati in una traccia JSON accanto all'output. Profilazione cProfile
+opzionale per singoli job.
+"""
+
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import logging
+import resource
+import subprocess
+from datetime import datetime
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+
+# Funzioni riportate nella traccia dal profilo cProfile (per tempo cumulativo)
+PROFILE_TOP = 25
+
+# Span aperti nel processo: il picco RSS di uno span interno vale anche per quelli esterni
+_open_spans = []
+
+class _Span:
+    __slots__ = ('peak_kb',)
+
+    def __init__(self, peak_kb):
+        self.peak_kb = peak_kb
+
+def _read_status_kb(field):
+    try:
+        with open('/proc/self/status', encoding='ascii') as fh:
+            for line in fh:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def _peak_rss_kb():
+    """Picco RSS del processo (VmHWM, azzerabile) o, in mancanza, ru_maxrss"""
+    value = _read_status_kb('VmHWM')
+    if value is None:
+        value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return value
+
+def _reset_peak_rss():
+    """Azzera VmHWM al valore attuale (Linux, /proc/self/clear_refs)"""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as fh:
+            fh.write('5')
+    except OSError:
+        pass
+
+def _cpu_seconds(usage):
+    return usage.ru_utime + usage.ru_stime
+
+def _mb(kb):
+    return round(kb / 1024, 1)
+
+@contextmanager
+def measure():
+    """Misura il blocco; il dizionario restituito viene completato all'uscita con
+    wall_seconds, cpu_seconds, child_cpu_seconds (processi esterni terminati nel
+    blocco) e peak_rss_mb (picco di memoria del processo durante il blocco)
+    """
+    # Il picco raggiunto finora appartiene agli span già aperti; poi si riparte da zero
+    hwm = _peak_rss_kb()
+    for span in _open_spans:
+        span.peak_kb = max(span.peak_kb, hwm)
+    _reset_peak_rss()
+    span = _Span(_read_status_kb('VmRSS') or 0)
+    _open_spans.append(span)
+
+    usage = {}
+    self_start = resource.getrusage(resource.RUSAGE_SELF)
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.monotonic()
+    try:
+        yield usage
+    finally:
+        wall = time.monotonic() - start
+        self_end = resource.getrusage(resource.RUSAGE_SELF)
+        children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        _open_spans.remove(span)
+        peak = max(span.peak_kb, _peak_rss_kb())
+        for outer in _open_spans:
+            outer.peak_kb = max(outer.peak_kb, peak)
+
+        usage.update(
+            wall_seconds=round(wall, 4),
+            cpu_seconds=round(_cpu_seconds(self_end) - _cpu_seconds(self_start), 4),
+            child_cpu_seconds=round(_cpu_seconds(children_end) - _cpu_seconds(children_start), 4),
+            peak_rss_mb=_mb(peak)
+        )
+
+def run_measured(cmd, env=None):
+    """Esegue un comando esterno misurandone le risorse
+
+    Restituisce (returncode, stderr, uso) dove uso contiene wall_seconds,
+    cpu_seconds e peak_rss_mb del solo processo figlio (da os.wait4, quindi
+    esatti anche in un processo che ha già eseguito altri comandi).
+    """
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env
+    )
+    with proc.stderr:
+        stderr = proc.stderr.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, stderr, {
+        'wall_seconds': round(time.monotonic() - start, 4),
+        'cpu_seconds': round(_cpu_seconds(rusage), 4),
+        'peak_rss_mb': _mb(rusage.ru_maxrss)
+    }
+
+class Tracer:
+    """Traccia di un job: totali per stadio e record per pagina
+
+    Gli stadi misurati nel processo del job (analyze, rasterize, merge,
+    optimize) si registrano con `stage()`; preprocess e ocr sono la somma dei
+    record di pagina, prodotti nei processi del pool OCR.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.stages = {}
+        self.pages = {}
+
+    def _accumulate(self, name, usage):
+        total = self.stages.setdefault(name, {'calls': 0})
+        total['calls'] += 1
+        for key, value in usage.items():
+            if value is None:
+                continue
+            if key.startswith('peak_'):
+                total[key] = max(total.get(key, 0), value)
+            else:
+                total[key] = total.get(key, 0) + value
+
+    @contextmanager
+    def stage(self, name):
+        """Misura il blocco e lo somma allo stadio `name`"""
+        usage = {}
+        try:
+            with measure() as usage:
+                yield usage
+        finally:
+            self._accumulate(name, usage)
+
+    def add_page(self, index, record):
+        """Registra la traccia di una pagina (da recognize_page)"""
+        if not record:
+            return
+        self.pages[index] = dict(record, page=index + 1)
+        if record.get('preprocess_seconds') is not None:
+            self._accumulate('preprocess', {
+                'wall_seconds': record['preprocess_seconds'],
+                'cpu_seconds': record.get('cpu_seconds'),
+                'peak_rss_mb': record.get('peak_rss_mb')
+            })
+        if record.get('ocr_seconds') is not None:
+            self._accumulate('ocr', {
+                'wall_seconds': record['ocr_seconds'],
+                'child_cpu_seconds': record.get('ocr_cpu_seconds'),
+                'child_peak_rss_mb': record.get('ocr_peak_rss_mb')
+            })
+
+    def stage_seconds(self):
+        """Tempo reale per stadio, {stadio: secondi}"""
+        return {name: round(total.get('wall_seconds', 0.0), 3) for name, total in self.stages.items()}
+
+    def to_dict(self, **fields):
+        """Traccia serializzabile; `fields` aggiunge informazioni sul job"""
+        stages = {
+            name: {k: round(v, 4) if isinstance(v, float) else v for k, v in total.items()}
+            for name, total in self.stages.items()
+        }
+        return dict(
+            fields,
+            version=TRACE_VERSION,
+            started_at=self.started_at.isoformat(),
+            stages=stages,
+            pages=[self.pages[i] for i in sorted(self.pages)]
+        )
+
+@contextmanager
+def profiled(path, top=PROFILE_TOP):
+    """Profila il blocco con cProfile e salva il profilo in `path` (formato pstats)
+
+    Il dizionario restituito riceve all'uscita le `top` funzioni per tempo
+    cumulativo. È profilato solo il thread corrente: con più processi pagina
+    il riconoscimento avviene altrove (OCR_WORKERS=1 per includerlo).
+    """
+    profiler = cProfile.Profile()
+    summary = {}
+    profiler.enable()
+    try:
+        yield summary
+    finally:
+        profiler.disable()
+        try:
+            profiler.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"Impossibile salvare il profilo: {e}")
+        summary['top'] = top_functions(profiler, top)
+
+def top_functions(profiler, top=PROFILE_TOP):
+    """Le `top` funzioni per tempo cumulativo: [{function, calls, tottime, cumtime}]"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{line}({name})",
+            'calls': calls,
+            'tottime': round(tottime, 4),
+            'cumtime': round(cumtime, 4)
+        })
+    rows.sort(key=lambda row: row['cumtime'], reverse=True)
+    return rows[:top]
+
+def write_trace(path, trace):
+    """Salva la traccia del job in JSON"""
+    if not path:
+        return
+    try:
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(trace, fh, indent=2)
+    except OSError as e:
+        logger.warning(f"Impossibile scrivere la traccia: {e}")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Ricezione in streaming dei PDF caricati
+Il corpo multipart viene scritto direttamente nella directory del job, a
+blocchi, calcolando hash e conteggio pagine mentre i byte arrivano.
+"""
+
+import os
+import re
+import uuid
+import shutil
+import tarfile
+import zipfile
+import hashlib
+import logging
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b"%PDF-"
+
+# Oggetti pagina non compressi ("/Type /Page", non "/Pages")
+PAGE_OBJECT_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+# Byte conservati tra un blocco e il successivo per non perdere le corrispondenze a cavallo
+PAGE_SCAN_OVERLAP = 32
+
+UPLOAD_PART_NAME = "upload.part"
+
+EXTRACT_CHUNK_SIZE = 1024 * 1024
+
+# Archivi accettati da /batch: salvati senza la verifica dell'intestazione PDF
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+def is_archive(filename):
+    return (filename or '').lower().endswith(ARCHIVE_SUFFIXES)
+
+class NotAPDF(Exception):
+    """Il file caricato non inizia con l'intestazione %PDF-"""
+
+class TooManyFiles(Exception):
+    """L'archivio contiene più PDF di quelli ammessi"""
+
+class PDFUploadStream:
+    """File di destinazione di un upload con hash, dimensione e pagine calcolati al volo
+
+    Espone l'interfaccia file richiesta da Werkzeug (write, seek, read);
+    i primi byte vengono verificati prima di scrivere qualsiasi cosa su disco.
+    """
+
+    def __init__(self, path, expect_pdf=True):
+        self.path = path
+        self.expect_pdf = expect_pdf
+        self._file = open(path, 'w+b')
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._tail = b""
+        self.size = 0
+        self.page_objects = 0
+
+    def write(self, data):
+        if not self.expect_pdf:
+            self._digest.update(data)
+            self.size += len(data)
+            return self._file.write(data)
+
+        # Verifica dell'intestazione sui primi byte, prima di scrivere su disco
+        if len(self._head) < len(PDF_MAGIC):
+            self._head += data[:len(PDF_MAGIC) - len(self._head)]
+            if not PDF_MAGIC.startswith(self._head):
+                raise NotAPDF("Il file non è un PDF")
+
+        self._digest.update(data)
+        self.size += len(data)
+
+        # Conteggio pagine sul blocco più la coda del precedente; le corrispondenze
+        # nella nuova coda vengono contate con il blocco successivo
+        window = self._tail + data
+        self._tail = window[-PAGE_SCAN_OVERLAP:]
+        self.page_objects += len(PAGE_OBJECT_RE.findall(window))
+        self.page_objects -= len(PAGE_OBJECT_RE.findall(self._tail))
+
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    @property
+    def page_count(self):
+        """Pagine stimate dagli oggetti /Page in chiaro (None se compressi in object stream)"""
+        return self.page_objects + len(PAGE_OBJECT_RE.findall(self._tail)) or None
+
+    def is_pdf(self):
+        return self._head == PDF_MAGIC
+
+    def __getattr__(self, name):
+        # seek, read, readline, close, ... del file sottostante
+        return getattr(self._file, name)
+
+class StreamingUploadRequest(Request):
+    """Request che salva i file caricati in una nuova directory di job
+
+    La directory (WORK_DIR/<id>) viene creata al primo file; se la richiesta
+    termina senza che il job la reclami (errore, client disconnesso) viene
+    rimossa da `discard_upload`.
+    """
+
+    upload_dir = None
+    upload_claimed = False
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        if self.upload_dir is None:
+            self.upload_dir = os.path.join(current_app.config['UPLOAD_ROOT'], str(uuid.uuid4()))
+            os.makedirs(self.upload_dir)
+        # Un file per campo: i nomi definitivi vengono assegnati dall'endpoint
+        path = os.path.join(self.upload_dir, f"{uuid.uuid4().hex}.{UPLOAD_PART_NAME}")
+        return PDFUploadStream(path, expect_pdf=not is_archive(filename))
+
+    @property
+    def job_id(self):
+        return os.path.basename(self.upload_dir) if self.upload_dir else None
+
+    def discard_upload(self):
+        if self.upload_dir and not self.upload_claimed:
+            shutil.rmtree(self.upload_dir, ignore_errors=True)
+            self.upload_dir = None
+
+def _archive_members(archive_path):
+    """Coppie (nome, file in lettura) dei PDF di un archivio ZIP o TAR"""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith('.pdf'):
+                    with archive.open(info) as fh:
+                        yield info.filename, fh
+    else:
+        with tarfile.open(archive_path, 'r:*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith('.pdf'):
+                    yield member.name, archive.extractfile(member)
+
+def extract_pdfs(archive_path, dest_dir, max_bytes, max_files=None):
+    """Estrae i PDF di un archivio in dest_dir, a blocchi e senza i percorsi interni
+
+    Restituisce (estratti, scartati): gli estratti sono coppie (nome originale,
+    PDFUploadStream chiuso, con hash e pagine), gli scartati i nomi dei file
+    che non sono PDF. Solleva ValueError per archivi illeggibili o cifrati,
+    RequestEntityTooLarge oltre max_bytes estratti in totale e TooManyFiles
+    prima di estrarre il PDF oltre max_files.
+    """
+    extracted, rejected = [], []
+    total = 0
+    try:
+        for name, src in _archive_members(archive_path):
+            if max_files is not None and len(extracted) >= max_files:
+                raise TooManyFiles(f"Più di {max_files} PDF nell'archivio")
+            path = os.path.join(dest_dir, f"{uuid.uuid4().hex}.{UPLOAD_PART_NAME}")
+            stream = PDFUploadStream(path)
+            try:
+                for chunk in iter(lambda: src.read(EXTRACT_CHUNK_SIZE), b''):
+                    total += len(chunk)
+                    if total > max_bytes:
+                        raise RequestEntityTooLarge("Contenuto dell'archivio troppo grande")
+                    stream.write(chunk)
+            except NotAPDF:
+                os.remove(path)
+                rejected.append(name)
+                continue
+            finally:
+                stream.close()
+            # Membri vuoti o più corti dell'intestazione
+            if not stream.is_pdf():
+                os.remove(path)
+                rejected.append(name)
+                continue
+            extracted.append((name, stream))
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        raise ValueError(f"Archivio non valido: {e}")
+    except (RuntimeError, NotImplementedError):
+        # zipfile: membri cifrati (password richiesta) o compressione non supportata
+        raise ValueError("Archivio non supportato: file cifrati o compressione non disponibile")
+    return extracted, rejected
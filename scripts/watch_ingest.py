@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Ingest continuo da cartelle monitorate
+I PDF depositati nelle directory di input vengono rilevati con inotify (o
+con una scansione periodica dove inotify non è disponibile), presi in carico
+quando smettono di crescere ed elaborati da un pool di worker OCR persistente.
+L'output compare in output/ in modo atomico, solo a elaborazione finita.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import shutil
+import signal
+import struct
+import ctypes
+import ctypes.util
+import logging
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_processor import available_cpus, processing_settings
+from result_cache import ResultCache, file_sha256, make_cache_key
+from worker_pool import WorkerPool, JobTimeout, DEFAULT_JOB_TIMEOUT
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Secondi in cui dimensione e data di modifica devono restare invariate prima della presa in carico
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# Sottodirectory delle directory di input (nascoste, ignorate dal monitoraggio)
+PROCESSING_DIR = ".processing"
+DONE_DIR = ".done"
+FAILED_DIR = ".failed"
+# Sottodirectory di output in cui i worker scrivono prima della consegna
+# (una directory temporanea per ogni file preso in carico)
+INCOMING_DIR = ".incoming"
+
+# Eventi inotify: file chiuso dopo la scrittura o spostato nella directory
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """Notifiche inotify (Linux) su directory non ricorsive, via ctypes"""
+
+    def __init__(self, dirs):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 non riuscita")
+
+        self._dirs = {}
+        for directory in dirs:
+            wd = libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO
+            )
+            if wd < 0:
+                os.close(self._fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch non riuscita su {directory}")
+            self._dirs[wd] = Path(directory)
+
+    def wait(self, timeout):
+        """Percorsi dei file scritti o arrivati; None se la coda eventi è traboccata
+        (il chiamante deve riscansionare le directory)"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+
+        paths = []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd in self._dirs and name:
+                paths.append(self._dirs[wd] / os.fsdecode(name))
+        return paths
+
+    def close(self):
+        os.close(self._fd)
+
+class PollingWatcher:
+    """Scansione periodica, per file system senza inotify (es. volumi di rete)"""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        return None
+
+    def close(self):
+        pass
+
+def scan(dirs):
+    """PDF visibili nelle directory di input (esclusi file e directory nascosti)"""
+    for directory in dirs:
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                yield Path(entry.path)
+
+class IngestDaemon:
+    """Rileva, prende in carico ed elabora i PDF delle directory di input"""
+
+    def __init__(self, input_dirs, output_dir, temp_dir="/app/temp", jobs=1, page_workers=None,
+                 settle=DEFAULT_SETTLE_SECONDS, timeout=DEFAULT_JOB_TIMEOUT, poll_interval=0):
+        self.input_dirs = [Path(d) for d in input_dirs]
+        self.output_dir = Path(output_dir)
+        self.temp_dir = Path(temp_dir)
+        self.jobs = max(1, jobs)
+        self.page_workers = page_workers or max(1, available_cpus() // self.jobs)
+        self.settle = settle
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.cache = ResultCache.from_env()
+        self.settings = processing_settings()
+        # File visti ma non ancora stabili: {percorso: (dimensione, mtime, stabile da)}
+        self._pending = {}
+        self._stopped = threading.Event()
+
+        for directory in self.input_dirs:
+            for sub in (PROCESSING_DIR, DONE_DIR, FAILED_DIR):
+                (directory / sub).mkdir(parents=True, exist_ok=True)
+        (self.output_dir / INCOMING_DIR).mkdir(parents=True, exist_ok=True)
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+
+    def _open_watcher(self):
+        if self.poll_interval:
+            return PollingWatcher(self.poll_interval)
+        try:
+            return InotifyWatcher(self.input_dirs)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify non disponibile ({e}): scansione ogni 5s")
+            return PollingWatcher(5.0)
+
+    def stop(self, *args):
+        self._stopped.set()
+
+    def run(self):
+        watcher = self._open_watcher()
+        pool = WorkerPool(self.jobs, page_workers=self.page_workers, timeout=self.timeout)
+        executor = ThreadPoolExecutor(max_workers=pool.size)
+        logger.info(
+            f"Ingest attivo su {', '.join(map(str, self.input_dirs))} -> {self.output_dir} "
+            f"({type(watcher).__name__}, {pool.size} worker)"
+        )
+
+        try:
+            # File rimasti in carico da un'esecuzione interrotta, poi quelli già presenti
+            for directory in self.input_dirs:
+                for path in sorted((directory / PROCESSING_DIR).iterdir()):
+                    if path.is_file():
+                        executor.submit(self._process, pool, path, directory)
+            self._observe(scan(self.input_dirs))
+
+            while not self._stopped.is_set():
+                # Senza file in attesa di stabilizzarsi il processo resta bloccato sul watcher
+                timeout = min(self.settle / 2, 1.0) if self._pending else None
+                if timeout is None and isinstance(watcher, InotifyWatcher):
+                    timeout = 5.0  # per reagire a stop() anche senza eventi
+                paths = watcher.wait(timeout)
+                self._observe(scan(self.input_dirs) if paths is None else paths)
+
+                for path in self._settled():
+                    claimed = self._claim(path)
+                    if claimed:
+                        executor.submit(self._process, pool, claimed, path.parent)
+        finally:
+            watcher.close()
+            logger.info("Arresto: attesa dei file in elaborazione...")
+            executor.shutdown(wait=True)
+            pool.shutdown()
+
+    def _observe(self, paths):
+        now = time.monotonic()
+        for path in paths:
+            if path.name.startswith('.') or path.suffix.lower() != '.pdf':
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                self._pending.pop(path, None)
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            previous = self._pending.get(path)
+            if previous is None or previous[:2] != current:
+                self._pending[path] = current + (now,)
+
+    def _settled(self):
+        """File la cui dimensione non cambia da almeno `settle` secondi"""
+        now = time.monotonic()
+        settled = []
+        for path, (size, mtime, since) in list(self._pending.items()):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif st.st_size > 0 and now - since >= self.settle:
+                del self._pending[path]
+                settled.append(path)
+        return settled
+
+    def _claim(self, path):
+        """Sposta il file in .processing con un rename atomico (un solo daemon lo prende)"""
+        target = path.parent / PROCESSING_DIR / path.name
+        if target.exists():
+            # Omonimo ancora in elaborazione: riprova dopo un nuovo periodo di stabilità
+            self._observe([path])
+            return None
+        try:
+            os.rename(path, target)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            if e.errno in (errno.EACCES, errno.EPERM, errno.EROFS):
+                logger.error(f"Impossibile prendere in carico {path}: {e}")
+                return None
+            raise
+        logger.info(f"Preso in carico: {path.name}")
+        return target
+
+    def _process(self, pool, path, input_dir):
+        """Elabora un file preso in carico (eseguito nei thread dell'executor)"""
+        # Directory di arrivo propria: omonimi da altre directory di input non si sovrascrivono
+        incoming_dir = Path(tempfile.mkdtemp(dir=self.output_dir / INCOMING_DIR, prefix='ingest_'))
+        incoming_path = incoming_dir / f"{path.stem}_ocr.pdf"
+        scratch_dir = Path(tempfile.mkdtemp(dir=self.temp_dir, prefix='ingest_'))
+        start = time.monotonic()
+        error = None
+        try:
+            cache_key = make_cache_key(file_sha256(path), self.settings)
+            if not (self.cache and self.cache.get(cache_key, incoming_path)):
+                outcome = pool.run(
+                    path, incoming_path, scratch_dir, self.temp_dir / 'checkpoints' / cache_key
+                )
+                pages_failed = (outcome['stats'] or {}).get('pages_failed')
+                if not outcome['success']:
+                    error = outcome['error'] or 'Elaborazione fallita'
+                elif pages_failed:
+                    # Output consegnato ma non in cache: un nuovo deposito del file riprova
+                    logger.warning(f"{path.name}: {pages_failed} pagine senza OCR")
+                elif self.cache:
+                    try:
+                        self.cache.put(cache_key, incoming_path)
+                    except Exception as e:
+                        logger.warning(f"Impossibile salvare il risultato in cache: {e}")
+            if error is None:
+                output_path = self._publish(incoming_path, path.stem)
+        except (JobTimeout, RuntimeError, OSError) as e:
+            error = str(e)
+        finally:
+            # Vi restano statistiche e traccia del processore, o l'output non consegnato
+            shutil.rmtree(incoming_dir, ignore_errors=True)
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+        seconds = time.monotonic() - start
+        if error is None:
+            shutil.move(str(path), str(input_dir / DONE_DIR / path.name))
+            logger.info(f"✓ {path.name} -> {output_path} in {seconds:.1f}s")
+        else:
+            failed = input_dir / FAILED_DIR / path.name
+            shutil.move(str(path), str(failed))
+            failed.with_name(failed.name + '.error.txt').write_text(error + "\n", encoding='utf-8')
+            logger.error(f"✗ {path.name} in {seconds:.1f}s: {error}")
+
+    def _publish(self, incoming_path, stem):
+        """Porta l'output in output/ senza sovrascrivere file esistenti
+
+        Se il nome è già presente (omonimo da un'altra directory di input o
+        file depositato di nuovo) usa {stem}_{n}_ocr.pdf, come /batch. Il
+        link fallisce se la destinazione esiste, anche con più daemon sulla
+        stessa directory di output.
+        """
+        output_path = self.output_dir / f"{stem}_ocr.pdf"
+        n = 1
+        while True:
+            try:
+                os.link(incoming_path, output_path)
+                break
+            except FileExistsError:
+                n += 1
+                output_path = self.output_dir / f"{stem}_{n}_ocr.pdf"
+        return output_path
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Monitora directory di input ed elabora i PDF appena depositati"
+    )
+    parser.add_argument('input_dirs', nargs='+', help="Directory da monitorare")
+    parser.add_argument('-o', '--output-dir', required=True, help="Directory dei PDF di output")
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=int(os.environ.get('WATCH_JOBS', '') or 1),
+        help="File elaborati in parallelo (default: WATCH_JOBS o 1)"
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=int(os.environ.get('OCR_WORKERS', '') or 0) or None,
+        help="Processi OCR per file (default: OCR_WORKERS o CPU / jobs)"
+    )
+    parser.add_argument(
+        '--settle', type=float,
+        default=float(os.environ.get('WATCH_SETTLE_SECONDS', '') or DEFAULT_SETTLE_SECONDS),
+        help="Secondi senza variazioni prima di prendere in carico un file"
+    )
+    parser.add_argument(
+        '--poll', type=float, default=float(os.environ.get('WATCH_POLL_INTERVAL', '') or 0),
+        help="Scansione periodica ogni N secondi invece di inotify (0 = inotify)"
+    )
+    parser.add_argument('--temp-dir', default='/app/temp', help="Directory temporanea e dei checkpoint")
+    parser.add_argument(
+        '--timeout', type=int, default=int(os.environ.get('PROCESSING_TIMEOUT', '') or DEFAULT_JOB_TIMEOUT),
+        help="Tempo massimo per file in secondi"
+    )
+    args = parser.parse_args()
+
+    for directory in args.input_dirs:
+        if not os.path.isdir(directory):
+            print(f"Directory di input non trovata: {directory}")
+            sys.exit(1)
+
+    daemon = IngestDaemon(
+        args.input_dirs, args.output_dir, temp_dir=args.temp_dir, jobs=args.jobs,
+        page_workers=args.workers, settle=args.settle, timeout=args.timeout,
+        poll_interval=args.poll
+    )
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Notifiche webhook di fine job
+Ogni notifica è una POST JSON firmata con HMAC-SHA256, salvata in una coda
+SQLite persistente e inviata da un pool limitato di thread, con ritentativi a
+backoff esponenziale e dead-letter dopo l'ultimo tentativo. Le callback
+indicate dai client possono puntare solo a host ammessi (WEBHOOK_ALLOWED_HOSTS)
+o a indirizzi pubblici.
+"""
+
+import os
+import hmac
+import json
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import hashlib
+import logging
+import ipaddress
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_SENDERS = 4
+
+# Attesa prima del tentativo n: BACKOFF_BASE * 2^(n-1), al più BACKOFF_MAX (secondi)
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+
+# Intervallo con cui i sender cercano consegne scadute quando la coda è vuota
+POLL_INTERVAL = 2.0
+
+# Risposte 4xx dopo cui ha senso riprovare; le altre sono errori definitivi
+RETRYABLE_CLIENT_ERRORS = (408, 425, 429)
+
+SIGNATURE_HEADER = 'X-PDF-OCR-Signature'
+TIMESTAMP_HEADER = 'X-PDF-OCR-Timestamp'
+
+class DeliveryStatus:
+    PENDING = "pending"
+    SENDING = "sending"
+    DELIVERED = "delivered"
+    DEAD = "dead"
+
+def sign_payload(secret, timestamp, body):
+    """Firma HMAC-SHA256 di "<timestamp>.<body>", nel formato sha256=<hex>"""
+    message = f"{timestamp}.".encode('utf-8') + body
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+class CallbackRejected(Exception):
+    """La callback punta a una destinazione non ammessa"""
+
+class CallbackPolicy:
+    """Destinazioni ammesse per le callback indicate dai client
+
+    Con `allowed_hosts` sono ammessi solo quegli host (".dominio" ammette
+    anche i sottodomini), senza altri controlli: è il modo per autorizzare
+    servizi interni. Senza elenco è ammesso qualsiasi host che risolva solo
+    in indirizzi pubblici; loopback, link-local (metadata cloud), reti
+    private e nomi dei servizi compose sono rifiutati salvo `allow_private`.
+    """
+
+    def __init__(self, allowed_hosts=(), allow_private=False):
+        self.allowed_hosts = {host.strip().lower() for host in allowed_hosts if host.strip()}
+        self.allow_private = allow_private
+
+    @classmethod
+    def from_env(cls):
+        """Crea la policy da WEBHOOK_ALLOWED_HOSTS (separati da virgola) / WEBHOOK_ALLOW_PRIVATE"""
+        return cls(
+            os.environ.get('WEBHOOK_ALLOWED_HOSTS', '').split(','),
+            allow_private=os.environ.get('WEBHOOK_ALLOW_PRIVATE', 'false').lower() == 'true'
+        )
+
+    def _listed(self, host):
+        return host in self.allowed_hosts or any(
+            entry.startswith('.') and host.endswith(entry) for entry in self.allowed_hosts
+        )
+
+    def check(self, url):
+        """Solleva CallbackRejected se l'URL non è ammesso
+
+        La risoluzione del nome può sollevare OSError (socket.gaierror).
+        """
+        parsed = urlparse(url)
+        host = (parsed.hostname or '').lower()
+        if not host:
+            raise CallbackRejected("host mancante")
+        if self.allowed_hosts:
+            if not self._listed(host):
+                raise CallbackRejected(f"host {host} non in WEBHOOK_ALLOWED_HOSTS")
+            return
+        if self.allow_private:
+            return
+
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        for *_, sockaddr in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP):
+            address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+            if not address.is_global or address.is_multicast:
+                raise CallbackRejected(f"{host} risolve nell'indirizzo non pubblico {address}")
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Le callback non seguono redirect: il 3xx diventa un errore definitivo"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def backoff_delay(attempts):
+    """Secondi di attesa dopo `attempts` tentativi falliti, con jitter del ±10%"""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.9, 1.1)
+
+class DeliveryQueue:
+    """Coda persistente delle consegne (SQLite WAL, condivisa tra i worker gunicorn)
+
+    Una consegna presa da un sender resta "sending" fino a un lease: se il
+    processo muore durante l'invio torna disponibile allo scadere del lease.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    id TEXT PRIMARY KEY,
+                    job_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries(status, next_attempt_at)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # Connessione per operazione, come archivio job e cache risultati
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, job_id, url, event, payload):
+        """Accoda una consegna; restituisce il suo id"""
+        delivery_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO deliveries(id, job_id, url, event, payload, status, "
+                "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (delivery_id, job_id, url, event, payload, DeliveryStatus.PENDING, now, now, now)
+            )
+        return delivery_id
+
+    def claim(self, lease):
+        """Prende la consegna scaduta più vecchia per `lease` secondi, None se non ce ne sono"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, job_id, url, event, payload, attempts FROM deliveries "
+                    "WHERE status IN (?, ?) AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT 1",
+                    (DeliveryStatus.PENDING, DeliveryStatus.SENDING, now)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE deliveries SET status = ?, next_attempt_at = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (DeliveryStatus.SENDING, now + lease, now, row[0])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        keys = ('id', 'job_id', 'url', 'event', 'payload', 'attempts')
+        return dict(zip(keys, row))
+
+    def delivered(self, delivery_id, attempts):
+        self._set(delivery_id, DeliveryStatus.DELIVERED, attempts, None, time.time())
+
+    def failed(self, delivery_id, attempts, error, retry_at=None):
+        """Registra un tentativo fallito: nuovo tentativo a `retry_at`, dead-letter se None"""
+        if retry_at is None:
+            self._set(delivery_id, DeliveryStatus.DEAD, attempts, error, time.time())
+        else:
+            self._set(delivery_id, DeliveryStatus.PENDING, attempts, error, retry_at)
+
+    def _set(self, delivery_id, status, attempts, error, next_attempt_at):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE deliveries SET status = ?, attempts = ?, last_error = ?, "
+                "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, error, next_attempt_at, time.time(), delivery_id)
+            )
+
+    def retry(self, delivery_id):
+        """Rimette in coda una consegna in dead-letter; False se non esiste o non è dead"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE deliveries SET status = ?, attempts = 0, next_attempt_at = ?, "
+                "updated_at = ? WHERE id = ? AND status = ?",
+                (DeliveryStatus.PENDING, now, now, delivery_id, DeliveryStatus.DEAD)
+            )
+            return cursor.rowcount > 0
+
+    def list(self, status=None, limit=100):
+        """Consegne più recenti (senza payload), opzionalmente filtrate per stato"""
+        query = ("SELECT id, job_id, url, event, status, attempts, last_error, created_at, "
+                 "updated_at FROM deliveries")
+        params = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY created_at DESC LIMIT ?", params + (limit,)).fetchall()
+        keys = ('id', 'job_id', 'url', 'event', 'status', 'attempts', 'last_error',
+                'created_at', 'updated_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def counts(self):
+        """Numero di consegne per stato"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status").fetchall())
+
+    def purge(self, before):
+        """Elimina le consegne riuscite aggiornate prima di `before` (timestamp)"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM deliveries WHERE status = ? AND updated_at < ?",
+                (DeliveryStatus.DELIVERED, before)
+            )
+            return cursor.rowcount
+
+class WebhookDispatcher:
+    """Invio delle notifiche con un numero fisso di thread sender
+
+    `notify()` si limita ad accodare: l'invio avviene sempre fuori dalla
+    richiesta o dal job che ha prodotto la notifica.
+    """
+
+    def __init__(self, queue, default_url=None, secret=None, timeout=DEFAULT_TIMEOUT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, senders=DEFAULT_SENDERS, policy=None):
+        self.queue = queue
+        self.default_url = default_url or None
+        self.secret = secret or None
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.senders = max(1, senders)
+        self.policy = policy or CallbackPolicy()
+        self._callback_opener = urllib.request.build_opener(_NoRedirect)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+        if not self.secret:
+            logger.warning("WEBHOOK_SECRET non impostato: notifiche webhook non firmate")
+
+    @classmethod
+    def from_env(cls, db_path):
+        """Crea il dispatcher da WEBHOOK_URL / WEBHOOK_SECRET / WEBHOOK_TIMEOUT /
+        WEBHOOK_MAX_ATTEMPTS / WEBHOOK_SENDERS e la policy delle callback"""
+        return cls(
+            DeliveryQueue(db_path),
+            default_url=os.environ.get('WEBHOOK_URL', ''),
+            secret=os.environ.get('WEBHOOK_SECRET', ''),
+            timeout=float(os.environ.get('WEBHOOK_TIMEOUT', '') or DEFAULT_TIMEOUT),
+            max_attempts=int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '') or DEFAULT_MAX_ATTEMPTS),
+            senders=int(os.environ.get('WEBHOOK_SENDERS', '') or DEFAULT_SENDERS),
+            policy=CallbackPolicy.from_env()
+        )
+
+    def start(self):
+        for i in range(self.senders):
+            thread = threading.Thread(target=self._run_sender, name=f"webhook-sender-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def notify(self, job_id, event, payload, callback_urls=None):
+        """Accoda la notifica per WEBHOOK_URL e per le callback del job"""
+        urls = [url for url in [self.default_url] + list(callback_urls or []) if url]
+        body = json.dumps(payload, default=str)
+        for url in dict.fromkeys(urls):
+            self.queue.enqueue(job_id, url, event, body)
+        if urls:
+            self._wakeup.set()
+        return len(urls)
+
+    def _run_sender(self):
+        lease = self.timeout + 30
+        while not self._stopped.is_set():
+            try:
+                delivery = self.queue.claim(lease)
+            except sqlite3.Error as e:
+                logger.warning(f"Coda webhook non disponibile: {e}")
+                delivery = None
+
+            if delivery is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+
+            # Un errore su una consegna non deve fermare il sender: la consegna
+            # torna disponibile alla scadenza del lease
+            try:
+                self._deliver(delivery)
+            except Exception:
+                logger.exception(f"Errore nella consegna del webhook {delivery['id']}")
+
+    def _deliver(self, delivery):
+        attempts = delivery['attempts'] + 1
+        error, retryable = self._send(delivery)
+
+        if error is None:
+            self.queue.delivered(delivery['id'], attempts)
+            logger.info(f"Webhook {delivery['event']} del job {delivery['job_id']} consegnato")
+        elif retryable and attempts < self.max_attempts:
+            delay = backoff_delay(attempts)
+            self.queue.failed(delivery['id'], attempts, error, time.time() + delay)
+            logger.warning(
+                f"Webhook del job {delivery['job_id']} fallito ({error}), "
+                f"tentativo {attempts + 1}/{self.max_attempts} tra {delay:.0f}s"
+            )
+        else:
+            self.queue.failed(delivery['id'], attempts, error)
+            logger.error(
+                f"Webhook del job {delivery['job_id']} in dead-letter dopo {attempts} tentativi: {error}"
+            )
+
+    def _send(self, delivery):
+        """Esegue la POST; restituisce (errore o None, errore ritentabile)"""
+        body = delivery['payload'].encode('utf-8')
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'pdf-ocr-processor-webhook',
+            'X-PDF-OCR-Event': delivery['event'],
+            'X-PDF-OCR-Delivery': delivery['id'],
+            TIMESTAMP_HEADER: timestamp
+        }
+        if self.secret:
+            headers[SIGNATURE_HEADER] = sign_payload(self.secret, timestamp, body)
+
+        try:
+            request = urllib.request.Request(delivery['url'], data=body, headers=headers, method='POST')
+            opener = urllib.request.urlopen
+            if delivery['url'] != self.default_url:
+                # Callback del client: ricontrollata all'invio, il DNS può essere cambiato
+                self.policy.check(delivery['url'])
+                opener = self._callback_opener.open
+            with opener(request, timeout=self.timeout) as response:
+                response.read()
+            return None, False
+        except urllib.error.HTTPError as e:
+            retryable = e.code >= 500 or e.code in RETRYABLE_CLIENT_ERRORS
+            return f"HTTP {e.code}", retryable
+        except (urllib.error.URLError, OSError) as e:
+            return str(getattr(e, 'reason', e)), True
+        except http.client.HTTPException as e:
+            # Risposta troncata o malformata (IncompleteRead, BadStatusLine, ...)
+            return f"{type(e).__name__}: {e}", True
+        except ValueError as e:
+            # URL malformato: nessun tentativo successivo può riuscire
+            return f"URL non valido: {e}", False
+        except CallbackRejected as e:
+            return f"Destinazione non ammessa: {e}", False
+
+    def stats(self):
+        """Stato della coda per /health"""
+        return {
+            'senders': self.senders,
+            'default_url': bool(self.default_url),
+            'signed': bool(self.secret),
+            'deliveries': self.queue.counts()
+        }
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Pool di processi OCR pre-avviati per l'API
+Ogni worker importa il processore una sola volta ed elabora più job in sequenza,
+ognuno con la propria directory temporanea; dopo N job viene sostituito.
+"""
+
+import os
+import queue
+import signal
+import logging
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+from pdf_processor import PDFProcessor, available_cpus, write_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 1
+DEFAULT_MAX_JOBS_PER_WORKER = 50
+DEFAULT_JOB_TIMEOUT = 600
+
+class JobTimeout(Exception):
+    """Il job ha superato il tempo massimo: il worker è stato terminato"""
+
+class _ErrorCollector(logging.Handler):
+    """Raccoglie i messaggi di errore del processore durante un job"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def _warm_up():
+    """Porta in page cache eseguibile e modelli di tesseract prima del primo job"""
+    try:
+        from PIL import Image
+        with tempfile.TemporaryDirectory() as tmp:
+            img_path = os.path.join(tmp, 'warmup.png')
+            Image.new('L', (200, 60), 255).save(img_path)
+            lang = os.environ.get('OCR_LANGUAGE', 'ita+eng')
+            subprocess.run(
+                ['tesseract', img_path, os.path.join(tmp, 'warmup'), '-l', lang],
+                capture_output=True, timeout=60
+            )
+    except Exception as e:
+        logger.warning(f"Warm-up tesseract non riuscito: {e}")
+
+def _run_job(input_path, output_path, scratch_dir, checkpoint_dir, profile, page_workers):
+    """Esegue un job nel worker e restituisce un dizionario serializzabile
+
+    Statistiche, traccia ed eventuale profilo sono scritti accanto all'output
+    (<output>.stats.json, <output>.trace.json, <output>.prof).
+    """
+    collector = _ErrorCollector()
+    root = logging.getLogger()
+    root.addHandler(collector)
+    try:
+        base_path = os.path.splitext(output_path)[0]
+        processor = PDFProcessor(
+            input_path, output_path,
+            temp_dir=scratch_dir, workers=page_workers, checkpoint_dir=checkpoint_dir,
+            trace_path=base_path + '.trace.json',
+            profile_path=base_path + '.prof' if profile else None
+        )
+        success = processor.process()
+        write_stats(base_path + '.stats.json', processor.stats)
+        return {
+            'success': success and os.path.exists(output_path),
+            'stats': processor.stats,
+            'error': '\n'.join(collector.messages) or None
+        }
+    except Exception as e:
+        return {'success': False, 'stats': None, 'error': str(e)}
+    finally:
+        root.removeHandler(collector)
+
+def _worker_main(conn, page_workers, max_jobs):
+    """Ciclo del processo worker: riceve job dalla pipe finché non va riciclato"""
+    # Gruppo di processi proprio: in caso di timeout si terminano anche i processi pagina
+    os.setpgrp()
+    logging.basicConfig(level=logging.INFO)
+    _warm_up()
+
+    jobs = 0
+    while jobs < max_jobs:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        conn.send(_run_job(*job, page_workers))
+        jobs += 1
+    conn.close()
+
+class _PoolWorker:
+    """Processo worker con la relativa pipe e il numero di job eseguiti"""
+
+    def __init__(self, context, page_workers, max_jobs):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, page_workers, max_jobs),
+            daemon=False  # i worker creano a loro volta il pool delle pagine
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+class WorkerPool:
+    """Pool di worker OCR a lunga vita con riciclo dopo max_jobs job
+
+    `run()` è bloccante e thread-safe: ogni thread chiamante prende un worker
+    libero, gli invia il job e ne attende il risultato.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, max_jobs=DEFAULT_MAX_JOBS_PER_WORKER,
+                 page_workers=None, timeout=DEFAULT_JOB_TIMEOUT):
+        self.size = max(1, size)
+        self.max_jobs = max(1, max_jobs)
+        self.page_workers = page_workers or max(1, available_cpus() // self.size)
+        self.timeout = timeout
+        # spawn: interpreti puliti, senza i thread e i lock del processo API
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._busy = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.jobs_completed = 0
+        self.recycled = 0
+
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+        logger.info(
+            f"Pool worker avviato: {self.size} processi, {self.page_workers} processi pagina "
+            f"per job, riciclo ogni {self.max_jobs} job"
+        )
+
+    @classmethod
+    def from_env(cls):
+        """Crea il pool da MAX_CONCURRENT_JOBS / API_WORKER_MAX_JOBS / PROCESSING_TIMEOUT
+
+        Un worker per ogni slot dello scheduler: gli slot sono comuni a tutti i
+        worker gunicorn, ma un processo può eseguirli tutti, quindi i job
+        prelevati non attendono mai un worker.
+        """
+        size = int(os.environ.get('MAX_CONCURRENT_JOBS', '') or DEFAULT_POOL_SIZE)
+        max_jobs = int(os.environ.get('API_WORKER_MAX_JOBS', '') or DEFAULT_MAX_JOBS_PER_WORKER)
+        timeout = int(os.environ.get('PROCESSING_TIMEOUT', '') or DEFAULT_JOB_TIMEOUT)
+
+        # Le CPU sono divise tra i job in esecuzione, al più `size` in tutto il servizio
+        page_workers = os.environ.get('OCR_WORKERS')
+        if page_workers:
+            page_workers = int(page_workers)
+        else:
+            page_workers = max(1, available_cpus() // size)
+
+        return cls(size, max_jobs=max_jobs, page_workers=page_workers, timeout=timeout)
+
+    def _spawn(self):
+        return _PoolWorker(self._context, self.page_workers, self.max_jobs)
+
+    def _release(self, worker, healthy):
+        """Rimette il worker nel pool o lo sostituisce con uno nuovo"""
+        if not healthy or worker.jobs >= self.max_jobs or not worker.process.is_alive():
+            if healthy:
+                # Il worker esce da solo dopo max_jobs job
+                worker.process.join(timeout=10)
+                worker.conn.close()
+            with self._lock:
+                self.recycled += 1
+            if self._closed:
+                return
+            worker = self._spawn()
+
+        if self._closed:
+            worker.stop()
+        else:
+            self._idle.put(worker)
+
+    def run(self, input_path, output_path, scratch_dir, checkpoint_dir=None, profile=False):
+        """Elabora un PDF in un worker libero (con `profile` profilato con cProfile)
+
+        Restituisce {'success', 'stats', 'error'}; solleva JobTimeout se il job
+        supera il timeout (il worker viene terminato e sostituito).
+        """
+        if self._closed:
+            raise RuntimeError("Pool worker chiuso")
+
+        worker = self._idle.get()
+        with self._lock:
+            self._busy.add(worker)
+        healthy = False
+        try:
+            worker.conn.send((
+                str(input_path), str(output_path), str(scratch_dir),
+                str(checkpoint_dir) if checkpoint_dir else None, bool(profile)
+            ))
+            if not worker.conn.poll(self.timeout):
+                raise JobTimeout(f"Timeout: elaborazione oltre {self.timeout}s")
+            result = worker.conn.recv()
+            worker.jobs += 1
+            healthy = True
+            with self._lock:
+                self.jobs_completed += 1
+            return result
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f"Worker terminato inaspettatamente: {e}")
+        finally:
+            with self._lock:
+                self._busy.discard(worker)
+            if not healthy:
+                worker.kill()
+            self._release(worker, healthy)
+
+    def stats(self):
+        """Stato del pool per /health"""
+        return {
+            'workers': self.size,
+            'idle': self._idle.qsize(),
+            'page_workers': self.page_workers,
+            'max_jobs_per_worker': self.max_jobs,
+            'jobs_completed': self.jobs_completed,
+            'recycled': self.recycled
+        }
+
+    def shutdown(self, terminate=False):
+        """Ferma i worker liberi; quelli occupati si fermano al termine del job
+
+        Con `terminate` i worker occupati vengono terminati subito insieme ai
+        processi del loro gruppo (pagine, tesseract): all'uscita del processo
+        API nessun job deve continuare a scrivere nel proprio checkpoint.
+        """
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+        if terminate:
+            with self._lock:
+                busy = list(self._busy)
+            for worker in busy:
+                logger.warning(f"Worker {worker.process.pid} terminato con il job in corso")
+                worker.kill()
@@ -0,0 +1,71 @@
+"""
+Test del rilevamento delle pagine bianche (image_preprocessing.is_blank_page)
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from image_preprocessing import is_blank_page
+
+# Soglia di default di OCR_BLANK_THRESHOLD
+THRESHOLD = 0.001
+
+# A4 a 100 DPI
+PAGE_SIZE = (827, 1169)
+
+def text_page(paper, ink):
+    """Pagina A4 coperta di barre di testo di colore `ink` su fondo `paper`"""
+    image = Image.new('L', PAGE_SIZE, paper)
+    draw = ImageDraw.Draw(image)
+    for y in range(100, PAGE_SIZE[1] - 100, 30):
+        draw.rectangle([80, y, PAGE_SIZE[0] - 80, y + 12], fill=ink)
+    return image
+
+def noisy_page(paper, sigma, seed=0):
+    """Pagina uniforme con rumore gaussiano, come una scansione di un foglio vuoto"""
+    rng = np.random.default_rng(seed)
+    pixels = rng.normal(paper, sigma, (PAGE_SIZE[1], PAGE_SIZE[0]))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'L')
+
+@pytest.mark.parametrize('paper, ink', [
+    (255, 0),    # nero su bianco
+    (255, 190),  # grigio su bianco
+    (40, 250),   # chiaro su fondo scuro
+    (60, 10),    # nero su fondo scuro
+])
+def test_text_pages_are_not_blank(paper, ink):
+    assert not is_blank_page(text_page(paper, ink), THRESHOLD)
+
+@pytest.mark.parametrize('paper, sigma', [
+    (255, 0),
+    (245, 6),   # scansione con rumore del sensore
+    (60, 0),    # foglio scuro uniforme
+    (200, 8),
+])
+def test_uniform_pages_are_blank(paper, sigma):
+    assert is_blank_page(noisy_page(paper, sigma), THRESHOLD)
+
+def test_wide_histogram_is_not_blank():
+    # Texture o foto a macchie ampie: il rumore supera il limite e la pagina non è uniforme
+    rng = np.random.default_rng(1)
+    blocks = np.clip(rng.normal(128, 40, (PAGE_SIZE[1] // 16 + 1, PAGE_SIZE[0] // 16 + 1)), 0, 255)
+    pixels = np.kron(blocks, np.ones((16, 16)))[:PAGE_SIZE[1], :PAGE_SIZE[0]]
+    assert not is_blank_page(Image.fromarray(pixels.astype(np.uint8), 'L'), THRESHOLD)
+
+def test_scan_specks_do_not_count_as_content():
+    image = noisy_page(245, 6)
+    draw = ImageDraw.Draw(image)
+    for x, y in ((100, 200), (400, 600), (700, 1000)):
+        draw.rectangle([x, y, x + 2, y + 2], fill=0)
+    assert is_blank_page(image, THRESHOLD)
+
+def test_rgb_input_and_disabled_threshold():
+    image = text_page(40, 250).convert('RGB')
+    assert not is_blank_page(image, THRESHOLD)
+    assert not is_blank_page(Image.new('L', PAGE_SIZE, 255), 0)